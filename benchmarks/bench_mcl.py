@@ -0,0 +1,274 @@
+"""
+    Project: ROBa project
+    File: bench_mcl.py
+    Description: This file contains the benchmark suite measuring every stage of the Monte Carlo localization update without a display.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+
+    Usage:
+        python -m benchmarks.bench_mcl --particles 1000 10000 100000 1000000 --landmarks 8 64 --output bench.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+import drawing.drawing_functions as drawing
+from drawing.renderer import Renderer
+from environment.grid_map import GridMap
+from geometry.point import Point2D
+from mcl.engine import MCLEngine
+from mcl.monte_carlo import Robot
+from mcl.pose import Pose3D
+from mcl.sensor_model import LandmarkSensorModel
+from parameters.parameters import Parameters
+
+
+class NullCanvas:
+    """
+        Class mimics the part of tkinter.Canvas used by the drawing functions, so they can be timed without a display.
+        The created items are only counted.
+        Attributes:
+            width (int): The width of the canvas in pixels.
+            height (int): The height of the canvas in pixels.
+            items (int): The number of items created so far.
+    """
+
+    def __init__(self, width: int = 800, height: int = 800):
+        self.width = width
+        self.height = height
+        self.items = 0
+
+    def winfo_width(self) -> int:
+        return self.width
+
+    def winfo_height(self) -> int:
+        return self.height
+
+    def _create(self, *_, **__) -> int:
+        self.items += 1
+        return self.items
+
+    create_line = _create
+    create_oval = _create
+    create_rectangle = _create
+    create_text = _create
+
+    def delete(self, *_):
+        pass
+
+    def coords(self, *_):
+        pass
+
+    def itemconfigure(self, *_, **__):
+        pass
+
+    def tag_lower(self, *_):
+        pass
+
+    def tag_raise(self, *_):
+        pass
+
+
+def make_engine(number_of_particles: int, number_of_landmarks: int) -> MCLEngine:
+    """
+        Function creates an engine with the given number of particles and landmarks.
+        The default landmarks are kept for 8 landmarks, other counts are drawn uniformly over the world.
+        Parameters:
+            number_of_particles (int): The number of particles.
+            number_of_landmarks (int): The number of landmarks.
+        Returns:
+            MCLEngine: The engine.
+    """
+    grid_map = GridMap()
+    grid_map.init_map()
+
+    parameters = Parameters()
+    setattr(parameters, "robot", Robot(Pose3D(20, 40, 0)))
+    setattr(parameters, "predicted_robot", Robot(Pose3D(40, 40, 0)))
+    setattr(parameters, "map", grid_map)
+    setattr(parameters, "number_of_particles", number_of_particles)
+    setattr(parameters, "percent_random_particles", 10)
+    setattr(parameters, "seed", 0)
+    engine = MCLEngine(parameters)
+
+    if number_of_landmarks != len(engine.landmarks):
+        landmarks = np.random.random((number_of_landmarks, 2)) * np.array(engine.world_size)
+        engine.landmarks = [Point2D(x, y) for x, y in landmarks]
+        engine.landmarks_np = landmarks
+        engine.particles.sensor_model = LandmarkSensorModel(landmarks, engine.particles.noise.sense_noise)
+    return engine
+
+
+def make_stages(engine: MCLEngine) -> dict[str, tuple[Callable[[], None], Callable[[], object]]]:
+    """
+        Function builds the benchmarked stages of the update.
+        Parameters:
+            engine (MCLEngine): The engine to benchmark.
+        Returns:
+            dict: For every stage name, a setup function run outside of the timing and the timed function.
+    """
+    n = len(engine.particles)
+    z = engine.robot.get_measurements(engine.landmarks)
+    canvas = NullCanvas()
+    renderer = Renderer(NullCanvas(), engine.map, particle_rendering="particles", landmarks=engine.landmarks_np)
+    renderer.draw(engine.particles, engine.robot, engine.predicted_robot)  # the static layers and the item pool
+
+    exact_model = engine.particles.sensor_model
+    lookup_models = {}
+    for lookup in ("nearest", "bilinear"):
+        lookup_models[lookup] = LandmarkSensorModel(exact_model.landmarks, exact_model.sense_noise)
+        lookup_models[lookup].use_lookup(engine.map, lookup, subdivisions=None)
+
+    def reset_weights():
+        engine.particles.weights = np.full(n, 1.0 / n)
+
+    def nothing():
+        pass
+
+    return {
+        "move_particles": (nothing, lambda: engine.move_particles(forward=0.1, turn=0.05)),
+        "log_likelihood_exact": (nothing, lambda: exact_model.log_likelihood(engine.particles.poses, z)),
+        "log_likelihood_nearest": (nothing, lambda: lookup_models["nearest"].log_likelihood(engine.particles.poses, z)),
+        "log_likelihood_bilinear": (nothing, lambda: lookup_models["bilinear"].log_likelihood(engine.particles.poses, z)),
+        "calculate_weights": (reset_weights, lambda: engine.calculate_weights(z)),
+        "resample_particles": (lambda: engine.calculate_weights(z), lambda: engine.resample_particles(engine.particles.weights)),
+        "randomize_n_particles": (nothing, lambda: engine.randomize_n_particles(n * engine.percent_random_particles // 100)),
+        "estimate_location": (lambda: engine.calculate_weights(z), engine.estimate_location),
+        "estimate_covariance": (lambda: engine.calculate_weights(z), engine.estimate_covariance),
+        "draw_particles": (nothing, lambda: drawing.draw_particles(canvas, engine.particles, engine.map)),
+        "draw_grid_map": (nothing, lambda: drawing.draw_grid_map(canvas, engine.map)),
+        "draw_landmarks": (nothing, renderer.draw_landmarks),
+        "render_frame": (nothing, lambda: renderer.draw(engine.particles, engine.robot, engine.predicted_robot)),
+        "density_layer": (nothing, lambda: renderer.density_rgb(engine.particles).tobytes()),
+    }
+
+
+def lookup_errors(engine: MCLEngine) -> dict[str, dict[str, float]]:
+    """
+        Function compares the distances looked up in the precomputed tables with the exact distances.
+        Parameters:
+            engine (MCLEngine): The engine whose particles and landmarks are used.
+        Returns:
+            dict: For every lookup mode, the maximum and mean absolute error in meters.
+    """
+    exact_model = engine.particles.sensor_model
+    exact = exact_model.expected_measurements(engine.particles.poses)
+    errors = {}
+    for lookup in ("nearest", "bilinear"):
+        model = LandmarkSensorModel(exact_model.landmarks, exact_model.sense_noise)
+        model.use_lookup(engine.map, lookup, subdivisions=None)
+        error = np.abs(model.expected_measurements(engine.particles.poses) - exact)
+        errors[lookup] = {"max_abs_error_m": float(error.max()), "mean_abs_error_m": float(error.mean())}
+    return errors
+
+
+def measure(setup: Callable[[], None], stage: Callable[[], object], repeat: int) -> dict[str, float]:
+    """
+        Function times a stage and measures its peak memory.
+        The peak memory is measured in a separate run, so tracing does not slow down the timed runs.
+        Parameters:
+            setup (Callable): The function preparing the state before every run.
+            stage (Callable): The timed function.
+            repeat (int): The number of timed runs.
+        Returns:
+            dict[str, float]: The minimum and median time in seconds and the peak memory in bytes.
+    """
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        stage()
+        times.append(time.perf_counter() - start)
+
+    setup()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"min_s": min(times), "median_s": statistics.median(times), "peak_memory_bytes": peak}
+
+
+def git_revision() -> str|None:
+    """
+        Function returns the current git commit, so runs can be compared across commits.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(particles: list[int], landmarks: list[int], repeat: int, stages: list[str]|None = None) -> dict:
+    """
+        Function runs the benchmark over every combination of particle and landmark counts.
+        Parameters:
+            particles (list[int]): The particle counts.
+            landmarks (list[int]): The landmark counts.
+            repeat (int): The number of timed runs of every stage.
+            stages (list[str]|None): The stages to run, all of them if None.
+        Returns:
+            dict: The machine-readable results.
+    """
+    results = []
+    for number_of_landmarks in landmarks:
+        for number_of_particles in particles:
+            np.random.seed(0)
+            engine = make_engine(number_of_particles, number_of_landmarks)
+            engine.map.precompute_landmark_distances(engine.particles.sensor_model.landmarks, subdivisions=4)
+            for name, (setup, stage) in make_stages(engine).items():
+                if stages is not None and name not in stages:
+                    continue
+                result = measure(setup, stage, repeat)
+                result.update({
+                    "stage": name,
+                    "particles": number_of_particles,
+                    "landmarks": number_of_landmarks,
+                    "particles_per_s": number_of_particles / result["min_s"] if result["min_s"] > 0 else None,
+                })
+                results.append(result)
+                print(f"{name:>24} N={number_of_particles:<8} L={number_of_landmarks:<5} "
+                      f"{result['min_s'] * 1e3:10.3f} ms  {result['peak_memory_bytes'] / 2 ** 20:9.2f} MiB")
+
+            for lookup, error in lookup_errors(engine).items():
+                results.append({"stage": f"lookup_error_{lookup}", "particles": number_of_particles,
+                                "landmarks": number_of_landmarks, **error})
+                print(f"{'lookup_error_' + lookup:>24} N={number_of_particles:<8} L={number_of_landmarks:<5} "
+                      f"max {error['max_abs_error_m']:.4f} m  mean {error['mean_abs_error_m']:.6f} m")
+
+    return {
+        "commit": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the Monte Carlo localization update.")
+    parser.add_argument("--particles", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--landmarks", type=int, nargs="+", default=[8, 64])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--stages", nargs="+", default=None, help="run only the given stages")
+    parser.add_argument("--output", default="bench_results.json", help="the JSON file to write the results to")
+    args = parser.parse_args()
+
+    report = run(args.particles, args.landmarks, args.repeat, args.stages)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
@@ -0,0 +1,140 @@
+"""
+    Project: ROBa project
+    File: bench_startup.py
+    Description: This file contains the benchmark of the startup of a headless filter process: the imports and the first filter step.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+
+    Usage:
+        python -m benchmarks.bench_startup --repeat 10 --max-seconds 1.0 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# modules the headless filter must not load, they are only imported lazily by the viewer or the range sensor
+FORBIDDEN_MODULES = ("scipy", "tkinter", "matplotlib", "pandas")
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(number_of_particles: int):
+    """
+        Function runs in a fresh interpreter: it times the imports of the filter, the creation of the engine
+        and its first step, and prints the timings as JSON.
+        Parameters:
+            number_of_particles (int): The number of particles of the engine.
+    """
+    start = time.perf_counter()
+    from environment.grid_map import GridMap
+    from mcl.engine import MCLEngine
+    from mcl.monte_carlo import Robot
+    from mcl.pose import Pose3D
+    from parameters.parameters import Parameters
+    imported = time.perf_counter()
+
+    grid_map = GridMap()
+    grid_map.init_map()
+    parameters = Parameters()
+    setattr(parameters, "robot", Robot(Pose3D(20, 40, 0)))
+    setattr(parameters, "predicted_robot", Robot(Pose3D(40, 40, 0)))
+    setattr(parameters, "map", grid_map)
+    setattr(parameters, "number_of_particles", number_of_particles)
+    setattr(parameters, "percent_random_particles", 10)
+    setattr(parameters, "seed", 0)
+    engine = MCLEngine(parameters)
+    created = time.perf_counter()
+
+    engine.step(*engine.simulate(0.5, 0.05))
+    stepped = time.perf_counter()
+
+    print(json.dumps({
+        "import_s": imported - start,
+        "engine_s": created - imported,
+        "first_step_s": stepped - created,
+        "total_s": stepped - start,
+        "forbidden_modules": sorted(m for m in FORBIDDEN_MODULES if m in sys.modules),
+    }))
+
+
+def measure_startup(number_of_particles: int) -> dict:
+    """
+        Function starts a fresh interpreter running child() and collects its timings.
+        Parameters:
+            number_of_particles (int): The number of particles of the engine.
+        Returns:
+            dict: The timings of the child, with the wall time of the whole process including the interpreter startup.
+    """
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", str(number_of_particles)],
+                            cwd=REPOSITORY, capture_output=True, text=True, check=True).stdout
+    process = time.perf_counter() - start
+    return {**json.loads(output.splitlines()[-1]), "process_s": process}
+
+
+def run(number_of_particles: int, repeat: int) -> dict:
+    """
+        Function measures the startup repeat times.
+        Parameters:
+            number_of_particles (int): The number of particles of the engine.
+            repeat (int): The number of started processes.
+        Returns:
+            dict: The machine-readable results, with the minimum and median of every timing.
+    """
+    from benchmarks.bench_mcl import git_revision
+
+    runs = [measure_startup(number_of_particles) for _ in range(repeat)]
+    timings = {}
+    for name in ("import_s", "engine_s", "first_step_s", "total_s", "process_s"):
+        values = [r[name] for r in runs]
+        timings[name] = {"min": min(values), "median": statistics.median(values)}
+    return {
+        "commit": git_revision(),
+        "python": platform.python_version(),
+        "particles": number_of_particles,
+        "repeat": repeat,
+        "timings": timings,
+        "forbidden_modules": sorted({m for r in runs for m in r["forbidden_modules"]}),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the startup of a headless filter process.")
+    parser.add_argument("--particles", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10, help="the number of started processes")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="fail if the median of the imports plus the first step exceeds this time")
+    parser.add_argument("--output", default=None, help="the JSON file to write the results to")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child)
+        sys.exit(0)
+
+    report = run(args.particles, args.repeat)
+    for name, timing in report["timings"].items():
+        print(f"{name:>14} min {timing['min'] * 1e3:9.2f} ms  median {timing['median'] * 1e3:9.2f} ms")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+
+    failures = []
+    if report["forbidden_modules"]:
+        failures.append(f"the headless filter imported {', '.join(report['forbidden_modules'])}")
+    if args.max_seconds is not None and report["timings"]["total_s"]["median"] > args.max_seconds:
+        failures.append(f"the startup took {report['timings']['total_s']['median']:.3f} s, more than {args.max_seconds:.3f} s")
+    for failure in failures:
+        print(f"FAILED: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
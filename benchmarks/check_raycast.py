@@ -0,0 +1,122 @@
+"""
+    Project: ROBa project
+    File: check_raycast.py
+    Description: This file contains the check of the range sensor ray casting against a brute-force march on a map with one-cell walls.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+
+    Usage:
+        python -m benchmarks.check_raycast --poses 100 --beams 90
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from environment.grid_map import GridMap
+from mcl.range_sensor import RangeSensorModel
+
+
+def walled_map(rng: np.random.Generator, resolution: float = 0.25, gaps: float = 0.15) -> GridMap:
+    """
+        Function builds a map of one-cell thick walls with random gaps, so many beams cross them at a slant
+        or slip through the diagonal holes.
+        Parameters:
+            rng (np.random.Generator): The random generator of the gaps.
+            resolution (float): The size of a cell in meters. Defaults to 0.25.
+            gaps (float): The fraction of cells cleared at random. Defaults to 0.15.
+        Returns:
+            GridMap: The map.
+    """
+    occupancy = np.zeros((120, 160), dtype=np.float32)
+    occupancy[:, 10::17] = 1.0
+    occupancy[7::13, :] = 1.0
+    occupancy[rng.random(occupancy.shape) < gaps] = 0.0
+    grid_map = GridMap()
+    grid_map.set_occupancy(occupancy, resolution)
+    return grid_map
+
+
+def march(model: RangeSensorModel, poses: np.ndarray, substeps: int = 10) -> np.ndarray:
+    """
+        Function casts the beams by a brute-force march in steps of a fraction of a cell, testing the cell of every step.
+        Parameters:
+            model (RangeSensorModel): The sensor whose beams, map and maximum range are used.
+            poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            substeps (int): The number of steps per cell. Defaults to 10.
+        Returns:
+            np.ndarray: The N×K array of ranges, max_range for the beams hitting nothing.
+    """
+    grid_map = model.grid_map
+    occupied = grid_map.occupancy >= model.occupied_threshold * grid_map.max_occupancy()
+    angles = (poses[:, 2, np.newaxis] + model.beam_angles[np.newaxis, :]).ravel()
+    k = model.beam_angles.shape[0]
+    x = np.repeat(poses[:, 0], k)
+    z = np.repeat(poses[:, 1], k)
+    dx, dz = np.cos(angles), np.sin(angles)
+
+    step = min(grid_map.size_x, grid_map.size_z) / substeps
+    ranges = np.full(angles.shape[0], model.max_range)
+    active = np.arange(angles.shape[0])
+    for i in range(int(model.max_range / step) + 1):
+        t = i * step
+        cx = np.floor((x[active] + dx[active] * t) / grid_map.size_x).astype(np.intp)
+        cz = np.floor((z[active] + dz[active] * t) / grid_map.size_z).astype(np.intp)
+        inside = (cx >= 0) & (cx < grid_map.nb_cell_x) & (cz >= 0) & (cz < grid_map.nb_cell_z)
+        hit = inside & occupied[np.where(inside, cz, 0), np.where(inside, cx, 0)]
+        ranges[active[hit]] = t
+        active = active[inside & ~hit]
+    return ranges.reshape(poses.shape[0], k)
+
+
+def run(number_of_poses: int, number_of_beams: int, seed: int = 0) -> dict:
+    """
+        Function compares the ray casting of the range sensor with the brute-force march from random free poses.
+        Parameters:
+            number_of_poses (int): The number of poses.
+            number_of_beams (int): The number of beams per pose.
+            seed (int): The seed of the map and the poses. Defaults to 0.
+        Returns:
+            dict: The number of beams, the beams longer than the marched range plus one cell and the errors in meters.
+    """
+    rng = np.random.default_rng(seed)
+    grid_map = walled_map(rng)
+    model = RangeSensorModel(grid_map, number_of_beams=number_of_beams, max_range=20.0, method="raycast")
+    poses = grid_map.sample_free_poses(number_of_poses, rng)
+
+    start = time.perf_counter()
+    ranges = model.raycast(poses)
+    raycast_s = time.perf_counter() - start
+    errors = ranges - march(model, poses)
+    cell = max(grid_map.size_x, grid_map.size_z)
+    return {
+        "beams": int(errors.size),
+        "too_long": int(np.count_nonzero(errors > cell)),
+        "max_error_m": float(errors.max()),
+        "mean_abs_error_m": float(np.abs(errors).mean()),
+        "raycast_s": raycast_s,
+        "cell_m": cell,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the range sensor ray casting against a brute-force march.")
+    parser.add_argument("--poses", type=int, default=100)
+    parser.add_argument("--beams", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.poses, args.beams, args.seed)
+    print(f"{report['beams']} beams in {report['raycast_s'] * 1e3:.1f} ms, mean abs error {report['mean_abs_error_m']:.4f} m, "
+          f"max excess {report['max_error_m']:.4f} m")
+    if report["too_long"] > 0:
+        print(f"FAILED: {report['too_long']} beams are longer than the marched range plus one cell ({report['cell_m']} m)",
+              file=sys.stderr)
+    sys.exit(1 if report["too_long"] > 0 else 0)
@@ -0,0 +1,250 @@
+"""
+    Project: ROBa project
+    File: experiments.py
+    Description: This file contains the parallel experiment runner evaluating the localization error over grids of configurations and seeds.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+
+    Usage:
+        python -m benchmarks.experiments --grid '{"number_of_particles": [1000, 5000], "resample_threshold": [0.5, 1.0]}' \\
+            --seeds 16 --steps 200 --kidnap-step 100 --output trials.csv --summary summary.csv
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from environment.grid_map import GridMap
+from mcl.engine import MCLEngine
+from mcl.monte_carlo import Robot
+from mcl.pose import Pose3D
+from parameters.parameters import Parameters
+
+BASE_CONFIGURATION = {
+    "number_of_particles": 5000,
+    "percent_random_particles": 0,  # no injection, a grid axis of [0, 10] compares with the augmented MCL recovery
+    "augmented_mcl": True,
+    "resampler": "systematic",
+    "resample_threshold": 0.5,
+    "noise": (0.2, 0.05, 2.0),
+}
+
+
+def expand_grid(grid: dict[str, list]) -> list[dict]:
+    """
+        Function builds every combination of the values of a parameter grid.
+        Parameters:
+            grid (dict[str, list]): The values of every varied parameter.
+        Returns:
+            list[dict]: The configurations, the base configuration updated with one combination each.
+    """
+    names = sorted(grid)
+    configurations = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        configuration = dict(BASE_CONFIGURATION)
+        configuration.update(zip(names, values))
+        configurations.append(configuration)
+    return configurations
+
+
+def converged_from(errors: np.ndarray, threshold: float, hold: int) -> int|None:
+    """
+        Function finds the first step from which the error stays under the threshold for hold consecutive steps.
+        Parameters:
+            errors (np.ndarray): The position errors of the steps.
+            threshold (float): The position error under which the filter is converged in meters.
+            hold (int): The number of consecutive converged steps required.
+        Returns:
+            int|None: The index of the first converged step, None if the filter never converged.
+    """
+    below = errors < threshold
+    if below.shape[0] < hold:
+        return None
+    runs = np.convolve(below, np.ones(hold, dtype=np.int64), mode="valid")
+    steady = np.flatnonzero(runs == hold)
+    return int(steady[0]) if steady.shape[0] > 0 else None
+
+
+def run_trial(configuration: dict, seed: int, steps: int = 200, kidnap_step: int|None = 100,
+              converge_distance: float = 1.0, hold: int = 5) -> dict:
+    """
+        Function runs one headless trial and measures the localization error against the ground truth.
+        The robot drives a seeded wavy trajectory. At kidnap_step it is moved to a random pose without telling the filter.
+        Parameters:
+            configuration (dict): The parameters of the engine, see BASE_CONFIGURATION.
+            seed (int): The seed of the trajectory, the noise and the particles.
+            steps (int): The number of filter updates. Defaults to 200.
+            kidnap_step (int|None): The step at which the robot is kidnapped, None for no kidnapping. Defaults to 100.
+            converge_distance (float): The position error under which the filter is converged in meters. Defaults to 1.0.
+            hold (int): The number of consecutive converged steps required. Defaults to 5.
+        Returns:
+            dict: The configuration, the seed and the metrics of the trial.
+    """
+    rng = np.random.default_rng(seed)  # the trajectory and the kidnapping, the engine has its own generators
+
+    grid_map = GridMap()
+    grid_map.init_map()
+    parameters = Parameters()
+    setattr(parameters, "robot", Robot(Pose3D(*(rng.random(3) * (grid_map.width, grid_map.height, 2 * math.pi)))))
+    setattr(parameters, "predicted_robot", Robot(Pose3D(0, 0, 0)))
+    setattr(parameters, "map", grid_map)
+    setattr(parameters, "seed", seed)
+    for name, value in configuration.items():
+        setattr(parameters, name, value)
+    engine = MCLEngine(parameters)
+
+    turns = 0.15 * np.sin(np.arange(steps) / 10 + rng.random() * 2 * math.pi)
+    position_errors = np.empty(steps)
+    heading_errors = np.empty(steps)
+    start = time.perf_counter()
+    for step in range(steps):
+        if step == kidnap_step:
+            engine.robot.set_pose(Pose3D(*(rng.random(3) * (grid_map.width, grid_map.height, 2 * math.pi))))
+        estimate = engine.step(*engine.simulate(0.5, float(turns[step])))
+
+        truth = engine.robot.pose
+        position_errors[step] = math.hypot(estimate.x - truth.x, estimate.y - truth.y)
+        heading_errors[step] = (estimate.theta - truth.theta + math.pi) % (2 * math.pi) - math.pi
+    wall_time = time.perf_counter() - start
+
+    end_of_first_phase = kidnap_step if kidnap_step is not None else steps
+    time_to_converge = converged_from(position_errors[:end_of_first_phase], converge_distance, hold)
+    recovery_time = None
+    if kidnap_step is not None:
+        recovery_time = converged_from(position_errors[kidnap_step:], converge_distance, hold)
+
+    return {
+        **{name: json.dumps(value) if isinstance(value, (tuple, list)) else value for name, value in configuration.items()},
+        "seed": seed,
+        "position_rmse": float(np.sqrt(np.mean(np.square(position_errors)))),
+        "heading_rmse": float(np.sqrt(np.mean(np.square(heading_errors)))),
+        "final_position_error": float(position_errors[-1]),
+        "time_to_converge": time_to_converge,
+        "recovery_time": recovery_time,
+        "wall_time_s": wall_time,
+    }
+
+
+def _run_trial(arguments: tuple) -> dict:
+    configuration, seed, kwargs = arguments
+    return run_trial(configuration, seed, **kwargs)
+
+
+def run_experiments(configurations: list[dict], seeds: list[int], processes: int|None = None, **kwargs) -> list[dict]:
+    """
+        Function runs every configuration with every seed over a pool of processes.
+        Parameters:
+            configurations (list[dict]): The configurations, see expand_grid.
+            seeds (list[int]): The seeds.
+            processes (int|None): The number of worker processes, the number of cores if None. Defaults to None.
+            kwargs: The options of run_trial.
+        Returns:
+            list[dict]: The results of the trials, in the order of the configurations and seeds.
+    """
+    trials = [(configuration, seed, kwargs) for configuration in configurations for seed in seeds]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # a few trials per task amortize the inter-process communication
+        chunk_size = max(1, len(trials) // (4 * (processes or os.cpu_count() or 1)))
+        return list(pool.map(_run_trial, trials, chunksize=chunk_size))
+
+
+def summarize(results: list[dict], names: list[str]) -> list[dict]:
+    """
+        Function aggregates the trials of every configuration.
+        Parameters:
+            results (list[dict]): The results of the trials.
+            names (list[str]): The configuration parameters the trials are grouped by.
+        Returns:
+            list[dict]: For every configuration, the number of trials, the mean RMSE, the fraction of converged
+                and recovered trials and the median convergence and recovery times of those.
+    """
+    groups: dict[tuple, list[dict]] = {}
+    for result in results:
+        groups.setdefault(tuple(result[name] for name in names), []).append(result)
+
+    def median(values: list) -> float|None:
+        values = [v for v in values if v is not None]
+        return statistics.median(values) if values else None
+
+    summary = []
+    for key, trials in groups.items():
+        summary.append({
+            **dict(zip(names, key)),
+            "trials": len(trials),
+            "position_rmse": statistics.fmean(t["position_rmse"] for t in trials),
+            "heading_rmse": statistics.fmean(t["heading_rmse"] for t in trials),
+            "converged": sum(t["time_to_converge"] is not None for t in trials) / len(trials),
+            "time_to_converge": median([t["time_to_converge"] for t in trials]),
+            "recovered": sum(t["recovery_time"] is not None for t in trials) / len(trials),
+            "recovery_time": median([t["recovery_time"] for t in trials]),
+            "wall_time_s": statistics.fmean(t["wall_time_s"] for t in trials),
+        })
+    return summary
+
+
+def write_csv(path: str, rows: list[dict]):
+    """
+        Function writes rows of results to a CSV file.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_table(rows: list[dict]):
+    """
+        Function prints rows of results as an aligned table.
+    """
+    def cell(value) -> str:
+        if value is None:
+            return "-"
+        return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+    columns = list(rows[0])
+    cells = [[cell(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.rjust(w) for v, w in zip(r, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run headless localization trials over a grid of configurations and seeds.")
+    parser.add_argument("--grid", default="{}", help="JSON object (or path to a JSON file) of parameter name to list of values")
+    parser.add_argument("--seeds", type=int, default=8, help="the number of seeds per configuration")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--kidnap-step", type=int, default=100, help="the step of the kidnapping, negative for none")
+    parser.add_argument("--converge-distance", type=float, default=1.0)
+    parser.add_argument("--processes", type=int, default=None, help="the number of worker processes, all cores by default")
+    parser.add_argument("--output", default="trials.csv", help="the CSV file of the individual trials")
+    parser.add_argument("--summary", default="summary.csv", help="the CSV file of the aggregated results")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.grid):
+        with open(args.grid) as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+
+    start = time.perf_counter()
+    results = run_experiments(expand_grid(grid), list(range(args.seeds)), args.processes, steps=args.steps,
+                              kidnap_step=args.kidnap_step if args.kidnap_step >= 0 else None,
+                              converge_distance=args.converge_distance)
+    summary = summarize(results, sorted(grid) or ["number_of_particles"])
+    write_csv(args.output, results)
+    write_csv(args.summary, summary)
+    print_table(summary)
+    print(f"{len(results)} trials in {time.perf_counter() - start:.1f} s, written to {args.output} and {args.summary}")
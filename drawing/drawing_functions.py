@@ -11,6 +11,8 @@
 """
 
 from math import cos, sin
+
+from drawing.renderer import grid_grey_levels
 from mcl.global_vars import LANDMARKS
 
 
@@ -91,14 +93,20 @@ def draw_grid_map(canvas, grid_map):
             canvas: (tkinter.Canvas) the display
             grid_map: (environment.GridMap) the grid map to draw
     """
-    # loops over all the cells of the grid map
-    for z in grid_map.cells:
-        for c in z:
-            color = '#%02x%02x%02x' % (int(255 - c.val * 255), int(255 - c.val * 255), int(255 - c.val * 255))
-            canvas.create_rectangle(x_real_2_draw(canvas, c.x * grid_map.size_x, grid_map),
-                                    y_real_2_draw(canvas, c.z * grid_map.size_z, grid_map),
-                                    x_real_2_draw(canvas, c.x * grid_map.size_x + grid_map.size_x, grid_map),
-                                    y_real_2_draw(canvas, c.z * grid_map.size_z + grid_map.size_z, grid_map),
+    # one rectangle per cell, or per pixel for maps finer than the canvas, sampled like the Renderer does
+    columns = max(1, min(grid_map.nb_cell_x, canvas.winfo_width()))
+    rows = max(1, min(grid_map.nb_cell_z, canvas.winfo_height()))
+    grey = grid_grey_levels(grid_map, columns, rows).astype(int).tolist()
+    size_x = grid_map.width / columns
+    size_z = grid_map.height / rows
+    for z in range(rows):
+        for x in range(columns):
+            level = grey[z][x]
+            color = '#%02x%02x%02x' % (level, level, level)
+            canvas.create_rectangle(x_real_2_draw(canvas, x * size_x, grid_map),
+                                    y_real_2_draw(canvas, z * size_z, grid_map),
+                                    x_real_2_draw(canvas, x * size_x + size_x, grid_map),
+                                    y_real_2_draw(canvas, z * size_z + size_z, grid_map),
                                     fill=color, outline="white")
 
 
@@ -124,14 +132,20 @@ def draw_particles(canvas, particles, world_dimension):
         Method to draw a set particles with pose in the world frame
         Parameters:
             canvas: (tkinter.Canvas) the display
-            robot: (robot.robot.Robot) the robot the particles are evaluated the pose of
-            mcl: (mcl.monte_carlo MonteCarloLocalization) The MonteCarloLocalization object we want to draw
-            the particle of
+            particles: (mcl.particle_set.ParticleSet) the particles to draw
             world_dimension: (should have width and height attributes) the world the measurements are defined in
     """
-
-    for particle in particles:
-        draw_point(canvas, particle.pose, size=0.1, color="grey", world_dimension=world_dimension)
+    size = 0.1
+    scale_x = canvas.winfo_width() / world_dimension.width
+    scale_y = canvas.winfo_height() / world_dimension.height
+
+    # the screen coordinates of all the particles are computed at once
+    x_left_top = (particles.poses[:, 0] - size) * scale_x
+    y_left_top = (particles.poses[:, 1] - size) * scale_y
+    x_right_bot = (particles.poses[:, 0] + size) * scale_x
+    y_right_bot = (particles.poses[:, 1] + size) * scale_y
+    for coords in zip(x_left_top.tolist(), y_left_top.tolist(), x_right_bot.tolist(), y_right_bot.tolist()):
+        canvas.create_oval(*coords, fill="grey", outline="grey")
 
 
 def draw_predicted_robot(canvas, robot, world_dimension):
@@ -0,0 +1,399 @@
+"""
+    Project: ROBa project
+    File: renderer.py
+    Description: This file contains the retained-mode renderer which keeps the canvas items between frames instead of recreating them.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+from math import cos, sin
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from mcl.global_vars import LANDMARKS_NP
+
+if TYPE_CHECKING:
+    import tkinter as tk
+
+PARTICLE_SIZE = 0.1
+PREDICTED_ROBOT_SIZE = 0.25
+LANDMARK_SIZE = 0.3
+PARTICLE_GREY = 128  # grey level of the particles, also the darkest level of the density layer
+MAX_GRID_ITEMS = 10000  # larger grid maps are drawn as a single image instead of one rectangle per cell
+
+
+def grid_grey_levels(grid_map, width: int, height: int) -> np.ndarray:
+    """
+        Function computes the grey levels of the grid map cells sampled on a width×height raster.
+        Only the sampled cells are read, so memory-mapped maps are not loaded entirely.
+        Parameters:
+            grid_map: (environment.GridMap) the grid map
+            width: (int) the number of columns of the raster
+            height: (int) the number of rows of the raster
+        Returns:
+            np.ndarray: The height×width float32 array of grey levels.
+    """
+    rows = np.arange(height) * grid_map.nb_cell_z // height
+    cols = np.arange(width) * grid_map.nb_cell_x // width
+    values = grid_map.occupancy[rows[:, np.newaxis], cols[np.newaxis, :]].astype(np.float32)
+    return 255 - values * (255 / grid_map.max_occupancy())
+
+
+class Renderer:
+    """
+        Class to draw the simulation on a Tkinter canvas in retained mode.
+        The grid map and the landmarks are static layers drawn once and redrawn only when the canvas is resized.
+        The particles and the robots are created once and afterwards only moved with coords().
+        Large particle sets are drawn as a density layer instead: a 2D histogram of the particle
+        positions blitted as a single image, whose cost does not depend on the number of particles.
+        Attributes:
+            canvas (tkinter.Canvas): The display.
+            grid_map (environment.grid_map.GridMap): The grid map, also giving the dimensions of the world.
+            size (tuple[int, int]): The size of the canvas the static layers were drawn for.
+            scale_x (float): The number of pixels per meter along x, cached for the current frame.
+            scale_y (float): The number of pixels per meter along y, cached for the current frame.
+            particle_items (list[int]): The pool of canvas items used for the particles.
+            visible_particles (int): The number of items of the pool currently shown.
+            particle_rendering (str): "particles", "density" or "auto" to switch on the number of particles.
+            density_threshold (int): The number of particles above which "auto" switches to the density layer.
+            density_resolution (str): The bins of the density layer, "map" for the grid map cells or "canvas" for the pixels.
+            background (np.ndarray|None): The grey levels of the grid map at canvas resolution, under the density layer.
+            landmarks (np.ndarray): The L×2 array of landmarks drawn in the static layer.
+            overlay_item (int|None): The text item of the performance overlay.
+    """
+    size: tuple[int, int]
+    scale_x: float
+    scale_y: float
+    particle_items: list[int]
+    visible_particles: int
+    particle_rendering: str
+    density_threshold: int
+    density_resolution: str
+
+    def __init__(self, canvas, grid_map, particle_rendering: str = "auto", density_threshold: int = 5000,
+                 density_resolution: str = "canvas", landmarks: np.ndarray = LANDMARKS_NP):
+        """
+            Constructor of the class
+            Parameters:
+                canvas: (tkinter.Canvas) the display
+                grid_map: (environment.GridMap) the grid map to draw
+                particle_rendering: (str) "particles", "density" or "auto". Defaults to "auto".
+                density_threshold: (int) the number of particles above which "auto" uses the density layer. Defaults to 5000.
+                density_resolution: (str) "map" or "canvas", the bins of the density layer. Defaults to "canvas".
+                landmarks: (np.ndarray) the L×2 array of landmarks to draw. Defaults to LANDMARKS_NP.
+        """
+        if particle_rendering not in ("particles", "density", "auto"):
+            raise ValueError(f"unknown particle rendering '{particle_rendering}'")
+        if density_resolution not in ("map", "canvas"):
+            raise ValueError(f"unknown density resolution '{density_resolution}'")
+
+        self.canvas = canvas
+        self.grid_map = grid_map
+        self.landmarks = landmarks
+        self.particle_rendering = particle_rendering
+        self.density_threshold = density_threshold
+        self.density_resolution = density_resolution
+        self.background: np.ndarray|None = None
+        self.density_image: "tk.PhotoImage|None" = None
+        self.density_item: int|None = None
+        self.grid_image: "tk.PhotoImage|None" = None
+        self.size = (0, 0)
+        self.scale_x = 0.0
+        self.scale_y = 0.0
+        self.particle_items = []
+        self.visible_particles = 0
+        self.robot_item: int|None = None
+        self.predicted_robot_item: int|None = None
+        self.overlay_item: int|None = None
+
+
+    def update_transform(self) -> bool:
+        """
+            Method caches the world to screen transform for the current frame.
+            Returns:
+                bool: True if the canvas was resized since the last frame.
+        """
+        size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        self.scale_x = size[0] / self.grid_map.width
+        self.scale_y = size[1] / self.grid_map.height
+        resized = size != self.size
+        self.size = size
+        return resized
+
+
+    def draw_static(self):
+        """
+            Method (re)draws the static layers: the grid map and the landmarks.
+        """
+        self.canvas.delete("grid")
+
+        self.background = None  # the density layer background is rebuilt for the new size
+        if self.grid_map.nb_cell_x * self.grid_map.nb_cell_z > MAX_GRID_ITEMS:
+            grey = self.grid_background(max(self.size[0], 1), max(self.size[1], 1)).astype(np.uint8)
+            self.grid_image = self.photo_image(np.repeat(grey[:, :, np.newaxis], 3, axis=2))
+            self.canvas.create_image(0, 0, anchor="nw", image=self.grid_image, tags="grid")
+        else:
+            size_x = self.grid_map.size_x * self.scale_x
+            size_z = self.grid_map.size_z * self.scale_y
+            values = self.grid_map.occupancy / self.grid_map.max_occupancy()
+            for z in range(self.grid_map.nb_cell_z):
+                for x in range(self.grid_map.nb_cell_x):
+                    val = float(values[z, x])
+                    color = '#%02x%02x%02x' % (int(255 - val * 255), int(255 - val * 255), int(255 - val * 255))
+                    self.canvas.create_rectangle(x * size_x, z * size_z, (x + 1) * size_x, (z + 1) * size_z,
+                                                 fill=color, outline="white", tags="grid")
+
+        self.draw_landmarks()
+        self.restack()
+
+
+    def draw_landmarks(self):
+        """
+            Method (re)draws the landmark layer.
+        """
+        self.canvas.delete("landmarks")
+        for x, y in self.landmarks.tolist():
+            self.canvas.create_oval(*self.point_coords(x, y, LANDMARK_SIZE),
+                                    fill="red", outline="red", tags="landmarks")
+
+
+    def restack(self):
+        """
+            Method restores the drawing order of the layers from the bottom to the top:
+            grid map, particles or density layer, predicted robot, robot, landmarks, overlay.
+        """
+        self.canvas.tag_lower("grid")
+        self.canvas.tag_raise("density")
+        self.canvas.tag_raise("predicted_robot")
+        self.canvas.tag_raise("robot")
+        self.canvas.tag_raise("landmarks")
+        self.canvas.tag_raise("overlay")
+
+
+    def point_coords(self, x: float, y: float, size: float) -> tuple[float, float, float, float]:
+        """
+            Method computes the screen bounding box of a point in the world frame.
+            Parameters:
+                x: (number in m) the x coordinate of the point
+                y: (number in m) the y coordinate of the point
+                size: (number in m) the radius of the point
+            Returns:
+                tuple[float, float, float, float]: The bounding box (left, top, right, bottom) in the canvas frame.
+        """
+        return ((x - size) * self.scale_x, (y - size) * self.scale_y, (x + size) * self.scale_x, (y + size) * self.scale_y)
+
+
+    def draw_particles(self, particles):
+        """
+            Method moves the particle items to the current particle poses.
+            Items are created only when the particle set grows and hidden when it shrinks.
+            Parameters:
+                particles: (mcl.particle_set.ParticleSet) the particles to draw
+        """
+        n = len(particles)
+        x = particles.poses[:, 0]
+        y = particles.poses[:, 1]
+        coords = np.column_stack(((x - PARTICLE_SIZE) * self.scale_x, (y - PARTICLE_SIZE) * self.scale_y,
+                                  (x + PARTICLE_SIZE) * self.scale_x, (y + PARTICLE_SIZE) * self.scale_y)).tolist()
+
+        created = False
+        while len(self.particle_items) < n:
+            self.particle_items.append(self.canvas.create_oval(0, 0, 0, 0, fill="grey", outline="grey", tags="particles"))
+            created = True
+        if created:
+            self.restack()
+
+        for item, c in zip(self.particle_items, coords):
+            self.canvas.coords(item, *c)
+
+        for item in self.particle_items[self.visible_particles:n]:
+            self.canvas.itemconfigure(item, state="normal")
+        for item in self.particle_items[n:self.visible_particles]:
+            self.canvas.itemconfigure(item, state="hidden")
+        self.visible_particles = n
+
+
+    def hide_particles(self):
+        """
+            Method hides all the particle items.
+        """
+        for item in self.particle_items[:self.visible_particles]:
+            self.canvas.itemconfigure(item, state="hidden")
+        self.visible_particles = 0
+
+
+    def density_rgb(self, particles) -> np.ndarray:
+        """
+            Method computes the pixels of the density layer.
+            The particle positions are binned into a 2D histogram over the grid map cells or the canvas pixels,
+            upsampled to the canvas size and blended over the grey levels of the grid map.
+            Parameters:
+                particles: (mcl.particle_set.ParticleSet) the particles to draw
+            Returns:
+                np.ndarray: The height×width×3 array of uint8 pixels.
+        """
+        width, height = max(self.size[0], 1), max(self.size[1], 1)
+        if self.density_resolution == "map":
+            bins_x, bins_y = self.grid_map.nb_cell_x, self.grid_map.nb_cell_z
+        else:
+            bins_x, bins_y = width, height
+
+        ix = np.clip((particles.poses[:, 0] * (bins_x / self.grid_map.width)).astype(np.int64), 0, bins_x - 1)
+        iy = np.clip((particles.poses[:, 1] * (bins_y / self.grid_map.height)).astype(np.int64), 0, bins_y - 1)
+        counts = np.bincount(iy * bins_x + ix, minlength=bins_x * bins_y).reshape(bins_y, bins_x)
+
+        # nearest neighbour upsampling of the bins to the pixels of the canvas
+        rows = np.arange(height) * bins_y // height
+        cols = np.arange(width) * bins_x // width
+        counts = counts[rows[:, np.newaxis], cols[np.newaxis, :]]
+
+        # logarithmic scale so a few dense clusters do not hide the rest of the particles
+        alpha = np.log1p(counts, dtype=np.float32)
+        max_alpha = alpha.max()
+        if max_alpha > 0:
+            alpha /= max_alpha
+
+        if self.background is None or self.background.shape != (height, width):
+            self.background = self.grid_background(width, height)
+        grey = self.background + (PARTICLE_GREY - self.background) * alpha
+        return np.repeat(grey.astype(np.uint8)[:, :, np.newaxis], 3, axis=2)
+
+
+    def grid_background(self, width: int, height: int) -> np.ndarray:
+        """
+            Method computes the grey levels of the grid map cells at canvas resolution.
+            Only the cells sampled by the pixels are read, so memory-mapped maps are not loaded entirely.
+            Parameters:
+                width: (int) the width of the canvas in pixels
+                height: (int) the height of the canvas in pixels
+            Returns:
+                np.ndarray: The height×width array of grey levels.
+        """
+        return grid_grey_levels(self.grid_map, width, height)
+
+
+    def photo_image(self, rgb: np.ndarray) -> "tk.PhotoImage":
+        """
+            Method converts pixels to a Tk image.
+            Parameters:
+                rgb: (np.ndarray) the height×width×3 array of uint8 pixels
+            Returns:
+                tkinter.PhotoImage: The image.
+        """
+        import tkinter as tk
+
+        ppm = b'P6 %d %d 255\n' % (rgb.shape[1], rgb.shape[0]) + rgb.tobytes()
+        return tk.PhotoImage(master=self.canvas, data=ppm, format="PPM")
+
+
+    def draw_density(self, particles):
+        """
+            Method blits the density layer of the particles as a single image.
+            Parameters:
+                particles: (mcl.particle_set.ParticleSet) the particles to draw
+        """
+        # the image has to be referenced from Python, otherwise Tk discards it
+        self.density_image = self.photo_image(self.density_rgb(particles))
+        if self.density_item is None:
+            self.density_item = self.canvas.create_image(0, 0, anchor="nw", image=self.density_image, tags="density")
+            self.restack()
+        else:
+            self.canvas.itemconfigure(self.density_item, image=self.density_image, state="normal")
+
+
+    def hide_density(self):
+        """
+            Method hides the density layer.
+        """
+        if self.density_item is not None:
+            self.canvas.itemconfigure(self.density_item, state="hidden")
+
+
+    def use_density(self, number_of_particles: int) -> bool:
+        """
+            Method decides whether the particles are drawn as the density layer.
+            Parameters:
+                number_of_particles: (int) the number of particles to draw
+            Returns:
+                bool: True for the density layer, False for one item per particle.
+        """
+        if self.particle_rendering == "auto":
+            return number_of_particles > self.density_threshold
+        return self.particle_rendering == "density"
+
+
+    def draw_robot(self, robot):
+        """
+            Method moves the arrow of the robot to its current pose.
+            Parameters:
+                robot: (robot.Robot) the robot to draw
+        """
+        coords = (robot.pose.x * self.scale_x,
+                  robot.pose.y * self.scale_y,
+                  (robot.pose.x + cos(robot.pose.theta) * robot.robot_width) * self.scale_x,
+                  (robot.pose.y + sin(robot.pose.theta) * robot.robot_width) * self.scale_y)
+        if self.robot_item is None:
+            self.robot_item = self.canvas.create_line(*coords, fill='black', arrow='last', tags="robot")
+            self.restack()
+        else:
+            self.canvas.coords(self.robot_item, *coords)
+
+
+    def draw_predicted_robot(self, robot):
+        """
+            Method moves the point of the predicted robot to its current pose.
+            Parameters:
+                robot: (robot.Robot) the robot to draw
+        """
+        coords = self.point_coords(robot.pose.x, robot.pose.y, PREDICTED_ROBOT_SIZE)
+        if self.predicted_robot_item is None:
+            self.predicted_robot_item = self.canvas.create_oval(*coords, fill="blue", outline="blue", tags="predicted_robot")
+            self.restack()
+        else:
+            self.canvas.coords(self.predicted_robot_item, *coords)
+
+
+    def draw_overlay(self, lines: list[str]|None):
+        """
+            Method shows text lines in the top left corner of the canvas, above every layer.
+            Parameters:
+                lines: (list[str]|None) the lines to show, None to hide the overlay
+        """
+        if lines is None:
+            if self.overlay_item is not None:
+                self.canvas.itemconfigure(self.overlay_item, state="hidden")
+            return
+
+        text = "\n".join(lines)
+        if self.overlay_item is None:
+            self.overlay_item = self.canvas.create_text(5, 5, anchor="nw", text=text, font=("Courier", 9),
+                                                        fill="red", tags="overlay")
+            self.restack()
+        else:
+            self.canvas.itemconfigure(self.overlay_item, text=text, state="normal")
+
+
+    def draw(self, particles, robot, predicted_robot):
+        """
+            Method renders one frame.
+            Parameters:
+                particles: (mcl.particle_set.ParticleSet) the particles to draw
+                robot: (robot.Robot) the ground truth robot
+                predicted_robot: (robot.Robot) the robot at the estimated pose
+        """
+        if self.update_transform():
+            self.draw_static()
+
+        if self.use_density(len(particles)):
+            self.hide_particles()
+            self.draw_density(particles)
+        else:
+            self.hide_density()
+            self.draw_particles(particles)
+        self.draw_predicted_robot(predicted_robot)
+        self.draw_robot(robot)
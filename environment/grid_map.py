@@ -9,53 +9,99 @@
 
     Date of Creation: 2024-12-19
 """
-from typing import List  # for python 3.8 compatibility
+import os
 
+import numpy as np
 
-class GridCell:
-    """ 
-        Class to handle a cell in the grid map.
-        Attributes:
-            x (int): The x coordinate of the cell in the map.
-            z (int): The z coordinate of the cell in the map.
-            val (float): The value of the cell (obstacle or free).
+
+def _read_pgm(path: str) -> np.ndarray:
+    """
+        Function reads a binary (P5) or plain (P2) PGM image.
+        Parameters:
+            path (str): The path to the image.
+        Returns:
+            np.ndarray: The rows×columns array of grey levels scaled to 0-255.
     """
-    x: int      # (int) x coordinate of the cell in the map 
-    z: int      # (int) z coordinate of the cell in the map
-    val: float  # (float) value of the cell (obstacle or free)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    # the header is made of 4 whitespace separated tokens, comments start with '#'
+    tokens: list[bytes] = []
+    i = 0
+    while len(tokens) < 4:
+        while data[i:i + 1].isspace():
+            i += 1
+        if data[i:i + 1] == b"#":
+            i = data.index(b"\n", i) + 1
+            continue
+        start = i
+        while not data[i:i + 1].isspace():
+            i += 1
+        tokens.append(data[start:i])
+    magic, width, height, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+
+    if magic == b"P5":
+        dtype = np.uint8 if maxval < 256 else np.dtype(">u2")
+        pixels = np.frombuffer(data, dtype=dtype, count=width * height, offset=i + 1).reshape(height, width)
+    elif magic == b"P2":
+        pixels = np.array(data[i:].split()[:width * height], dtype=np.int64).reshape(height, width)
+    else:
+        raise ValueError(f"{path} is not a PGM image (magic number {magic!r})")
+
+    if maxval == 255:
+        return pixels.astype(np.uint8)
+    return (pixels.astype(np.uint32) * 255 // maxval).astype(np.uint8)
 
-    def __init__(self, x:int=0, z:int=0, val:float=0):
-        """
-            Constructor initializes the coordinates and value of the cell.
-            Parameters:
-                x (int): The x coordinate of the cell in the map.
-                z (int): The z coordinate of the cell in the map.
-                val (float): The value of the cell (obstacle or free).
-        """
-        self.x = x  # x coordinate of the cell in the map
-        self.z = z  # y coordinate of the cell in the map
-        self.val = val  # value of the cell (obstacle or free)
+
+def _read_png(path: str) -> np.ndarray:
+    """
+        Function reads a PNG (or any other image supported by Pillow) as grey levels.
+        Parameters:
+            path (str): The path to the image.
+        Returns:
+            np.ndarray: The rows×columns array of grey levels 0-255.
+        Raises:
+            ImportError: If Pillow is not installed.
+    """
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError("loading PNG maps requires Pillow, install it or convert the map to PGM/NPY") from e
+
+    with Image.open(path) as image:
+        return np.asarray(image.convert("L"), dtype=np.uint8)
 
 
 class GridMap:
     """
         Class to handle a grid map.
+        The cells are stored in a single occupancy array, the row index being the z coordinate
+        and the column index the x coordinate of the cell. Floating point arrays hold occupancy
+        probabilities in [0, 1], integer arrays occupancy levels in [0, 255].
         Attributes:
             width (float): The width of the map in meters.
             height (float): The height of the map in meters.
             nb_cell_x (int): The number of cells along the x-axis.
             nb_cell_z (int): The number of cells along the z-axis.
-            cells (List[List[GridCell]]): A list of lists of GridCell objects representing the map.
+            occupancy (np.ndarray): The nb_cell_z×nb_cell_x occupancy array, possibly memory-mapped.
             size_x (float): The size of a cell along the x-axis in meters.
             size_z (float): The size of a cell along the z-axis in meters.
+            landmark_distances (np.ndarray|None): The precomputed H×W×L table of distances to the landmarks.
+            table_step_x (float): The spacing of the distance table samples along the x-axis in meters.
+            table_step_z (float): The spacing of the distance table samples along the z-axis in meters.
+            free_cells (np.ndarray|None): The flat indices of the free cells, computed on first use.
     """
     width: float           # (number in m)  the width of the map
     height: float          # (number in m) the height of the map
     nb_cell_x: int         # (int) number of cells according to the x-axis
     nb_cell_z: int         # (int) number of cells according to the z-axis
-    cells: List[List[GridCell]]  # (list of GridCell)  list of cells
+    occupancy: np.ndarray  # (nb_cell_z×nb_cell_x array) occupancy of the cells
     size_x: float          # (number in m) x size of a cell
     size_z: float          # (number in m) z size of a cell
+    landmark_distances: np.ndarray|None  # (H×W×L array) distances from the table samples to the landmarks
+    table_step_x: float    # (number in m) x spacing of the table samples
+    table_step_z: float    # (number in m) z spacing of the table samples
+    free_cells: np.ndarray|None  # (array) flat indices of the free cells
 
     def __init__(self):
         """
@@ -65,28 +111,209 @@ class GridMap:
         self.height = 0  # m  the height of the map
         self.nb_cell_x = 0  # -  number of cells according to the x-axis
         self.nb_cell_z = 0  # -  number of cells according to the z-axis
-        self.cells = []  # -  list of cells
+        self.occupancy = np.zeros((0, 0), dtype=np.float32)  # -  occupancy of the cells
         self.size_x = 0  # m  x size of a cell
         self.size_z = 0  # m  z size of a cell
+        self.landmark_distances = None  # -  precomputed distances to the landmarks
+        self.table_step_x = 0  # m  x spacing of the table samples
+        self.table_step_z = 0  # m  z spacing of the table samples
+        self.free_cells = None  # -  flat indices of the free cells
 
     def init_map(self):
         """
             Method sets the width and height of the map and initializes other attributes.
         """
-        self.width = 80.0
-        self.height = 80.0
-        self.nb_cell_x = 60
-        self.nb_cell_z = 60
-
-        self.cells = []
-        for z in range(0, self.nb_cell_z):
-            self.cells.append([])
-            for x in range(0, self.nb_cell_x):
-                c = GridCell()
-                c.x = x
-                c.z = z
-                c.val = 0.0
-                self.cells[z].append(c)
-
-        self.size_x = self.width / self.nb_cell_x
-        self.size_z = self.height / self.nb_cell_z
\ No newline at end of file
+        self.set_occupancy(np.zeros((60, 60), dtype=np.float32), 80.0 / 60)
+
+
+    def set_occupancy(self, occupancy: np.ndarray, resolution: float):
+        """
+            Method sets the occupancy array of the map and derives the dimensions of the map from it.
+            Parameters:
+                occupancy (np.ndarray): The nb_cell_z×nb_cell_x occupancy array.
+                resolution (float): The size of a cell in meters.
+        """
+        self.occupancy = occupancy
+        self.nb_cell_z, self.nb_cell_x = occupancy.shape
+        self.size_x = resolution
+        self.size_z = resolution
+        self.width = self.nb_cell_x * resolution
+        self.height = self.nb_cell_z * resolution
+        self.landmark_distances = None
+        self.free_cells = None
+
+
+    def load_map(self, path: str, resolution: float, mmap: bool = True):
+        """
+            Method loads the map from a file.
+            Images (.pgm, .png) are read as grey levels, dark pixels being occupied, as in the ROS map_server format.
+            NumPy arrays (.npy) are used directly as the occupancy array and memory-mapped if mmap is True,
+            so maps larger than the memory are only paged in when their cells are read.
+            Parameters:
+                path (str): The path to the map.
+                resolution (float): The size of a cell in meters.
+                mmap (bool): Memory-map .npy maps instead of reading them. Defaults to True.
+            Raises:
+                ValueError: If the format of the map is not supported.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".npy":
+            occupancy = np.load(path, mmap_mode="r" if mmap else None)
+        elif extension == ".pgm":
+            occupancy = 255 - _read_pgm(path)
+        elif extension == ".png":
+            occupancy = 255 - _read_png(path)
+        else:
+            raise ValueError(f"unsupported map format '{extension}', expected .npy, .pgm or .png")
+
+        if occupancy.ndim != 2:
+            raise ValueError(f"the map has to be a 2D array, got shape {occupancy.shape}")
+        self.set_occupancy(occupancy, resolution)
+
+
+    def max_occupancy(self) -> float:
+        """
+            Method returns the value of a fully occupied cell for the type of the occupancy array.
+        """
+        if np.issubdtype(self.occupancy.dtype, np.integer):
+            return 255.0
+        return 1.0
+
+
+    def world_to_cell(self, x: np.ndarray, z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Method converts positions in the world frame to the indices of the cells containing them.
+            Parameters:
+                x (np.ndarray): The x coordinates in meters.
+                z (np.ndarray): The z coordinates in meters.
+            Returns:
+                tuple[np.ndarray, np.ndarray]: The column (x) and row (z) indices, clipped to the map.
+        """
+        ix = np.clip(np.floor(np.asarray(x) / self.size_x).astype(np.intp), 0, self.nb_cell_x - 1)
+        iz = np.clip(np.floor(np.asarray(z) / self.size_z).astype(np.intp), 0, self.nb_cell_z - 1)
+        return ix, iz
+
+
+    def cell_to_world(self, ix: np.ndarray, iz: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Method converts cell indices to the positions of the cell centers in the world frame.
+            Parameters:
+                ix (np.ndarray): The column (x) indices.
+                iz (np.ndarray): The row (z) indices.
+            Returns:
+                tuple[np.ndarray, np.ndarray]: The x and z coordinates in meters.
+        """
+        return (np.asarray(ix) + 0.5) * self.size_x, (np.asarray(iz) + 0.5) * self.size_z
+
+
+    def occupancy_at(self, x: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """
+            Method reads the occupancy of the cells containing the given positions.
+            Parameters:
+                x (np.ndarray): The x coordinates in meters.
+                z (np.ndarray): The z coordinates in meters.
+            Returns:
+                np.ndarray: The occupancy probabilities in [0, 1].
+        """
+        ix, iz = self.world_to_cell(x, z)
+        return self.occupancy[iz, ix].astype(np.float32) / self.max_occupancy()
+
+
+    def find_free_cells(self, threshold: float = 0.5) -> np.ndarray:
+        """
+            Method finds the cells whose occupancy probability is under the threshold, the result is cached.
+            Parameters:
+                threshold (float): The occupancy probability under which a cell is free. Defaults to 0.5.
+            Returns:
+                np.ndarray: The flat indices (row * nb_cell_x + column) of the free cells.
+        """
+        if self.free_cells is None:
+            self.free_cells = np.flatnonzero(np.asarray(self.occupancy).reshape(-1) < threshold * self.max_occupancy())
+        return self.free_cells
+
+
+    def sample_free_poses(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        """
+            Method draws poses uniformly distributed over the free cells of the map.
+            Falls back to the whole map if it has no free cell.
+            Parameters:
+                n (int): The number of poses to draw.
+                rng (np.random.Generator): The random generator.
+            Returns:
+                np.ndarray: The n×3 array of poses (x, y, theta).
+        """
+        free_cells = self.find_free_cells()
+        poses = rng.random((n, 3))
+        if free_cells.shape[0] == 0:
+            poses[:, 0] *= self.width
+            poses[:, 1] *= self.height
+        else:
+            cells = free_cells[rng.integers(free_cells.shape[0], size=n)]
+            poses[:, 0] = (cells % self.nb_cell_x + poses[:, 0]) * self.size_x
+            poses[:, 1] = (cells // self.nb_cell_x + poses[:, 1]) * self.size_z
+        poses[:, 2] *= 2 * np.pi
+        return poses
+
+
+    def precompute_landmark_distances(self, landmarks: np.ndarray, subdivisions: int = 4):
+        """
+            Method precomputes the distances to every landmark on a regular grid of samples.
+            The samples are placed at the corners of the cells split into subdivisions × subdivisions sub-cells,
+            including the far edges of the map so every position of the map can be interpolated.
+            Parameters:
+                landmarks (np.ndarray): The L×2 array of landmark coordinates.
+                subdivisions (int): The number of samples per cell along each axis. Defaults to 4.
+        """
+        landmarks = np.asarray(landmarks, dtype=np.float64)
+        self.table_step_x = self.size_x / subdivisions
+        self.table_step_z = self.size_z / subdivisions
+
+        xs = np.arange(self.nb_cell_x * subdivisions + 1) * self.table_step_x
+        zs = np.arange(self.nb_cell_z * subdivisions + 1) * self.table_step_z
+        dx = xs[np.newaxis, :, np.newaxis] - landmarks[np.newaxis, np.newaxis, :, 0]
+        dz = zs[:, np.newaxis, np.newaxis] - landmarks[np.newaxis, np.newaxis, :, 1]
+
+        # the landmarks are the last axis, so the distances of one position are contiguous in memory
+        self.landmark_distances = np.hypot(dx, dz).astype(np.float32)
+
+
+    def lookup_landmark_distances(self, x: np.ndarray, z: np.ndarray, interpolate: bool = True) -> np.ndarray:
+        """
+            Method looks up the distances from the given positions to every landmark in the precomputed table.
+            Parameters:
+                x (np.ndarray): The N array of x coordinates in meters.
+                z (np.ndarray): The N array of z coordinates in meters.
+                interpolate (bool): Bilinear interpolation between the samples if True, the nearest sample otherwise. Defaults to True.
+            Returns:
+                np.ndarray: The N×L array of distances.
+            Raises:
+                RuntimeError: If the table was not precomputed.
+        """
+        if self.landmark_distances is None:
+            raise RuntimeError("the landmark distances have not been precomputed, call precompute_landmark_distances() first")
+
+        table = self.landmark_distances
+        height, width = table.shape[0], table.shape[1]
+        samples = table.reshape(height * width, table.shape[2])
+        fx = x / self.table_step_x
+        fz = z / self.table_step_z
+
+        if not interpolate:
+            ix = np.clip(np.rint(fx).astype(np.intp), 0, width - 1)
+            iz = np.clip(np.rint(fz).astype(np.intp), 0, height - 1)
+            return samples[iz * width + ix]
+
+        ix = np.clip(fx.astype(np.intp), 0, width - 2)
+        iz = np.clip(fz.astype(np.intp), 0, height - 2)
+        tx = (fx - ix).astype(np.float32)[:, np.newaxis]
+        tz = (fz - iz).astype(np.float32)[:, np.newaxis]
+
+        # gathers of whole rows of the flattened table, one per corner of the enclosing sample square
+        index = iz * width + ix
+        top = samples[index]
+        top += (samples[index + 1] - top) * tx
+        index += width
+        bottom = samples[index]
+        bottom += (samples[index + 1] - bottom) * tx
+        top += (bottom - top) * tz
+        return top
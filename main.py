@@ -30,8 +30,36 @@ if __name__ == "__main__":
     setattr(parameters, "predicted_robot", predicted_robot)
     setattr(parameters, "map", grid_map)
     setattr(parameters, "number_of_particles", 5000)
-    setattr(parameters, "percent_random_particles", 10)
+    setattr(parameters, "percent_random_particles", 10)  # maximal percentage of particles injected at an update
+    setattr(parameters, "augmented_mcl", True)  # inject random particles when the measurements get unlikely (kidnapping)
+    setattr(parameters, "alpha_slow", 0.01)  # rate of the long-term likelihood average
+    setattr(parameters, "alpha_fast", 0.2)  # rate of the short-term likelihood average
+    setattr(parameters, "seed", None)  # seed of the random generators, an integer makes runs reproducible
+    setattr(parameters, "noise", (0.2, 0.05, 2.0))  # forward, turn and sense noise of the particles
+    setattr(parameters, "resampler", "systematic")
+    setattr(parameters, "sensor", "landmarks")  # "landmarks" or "range"
+    setattr(parameters, "landmark_lookup", "exact")  # "exact", "nearest" or "bilinear", only "exact" with landmark_max_range
+    setattr(parameters, "landmarks_file", None)  # .npy, .csv or .txt file with the landmarks, None for the built-in ones
+    setattr(parameters, "landmark_max_range", None)  # meters, None to observe every landmark
+    setattr(parameters, "resample_threshold", 0.5)
+    setattr(parameters, "odometry_distance", 0.5)  # m travelled before the particles are moved and weighted
+    setattr(parameters, "odometry_angle", 0.17)  # rad turned before the particles are moved and weighted
+    setattr(parameters, "estimator", "cluster")  # "mean", "cluster" or "max"
+    setattr(parameters, "kld_sampling", False)
+    setattr(parameters, "min_particles", 200)
+    setattr(parameters, "max_particles", 20000)
+    setattr(parameters, "compact_particles", False)  # float32 particles, half the memory of huge sets
+    setattr(parameters, "memory_budget_mb", None)  # caps the particle count to fit the filter in this many MiB
     setattr(parameters, "fps", 20)
     setattr(parameters, "rk_step", 10)
+    setattr(parameters, "particle_rendering", "auto")  # "particles", "density" or "auto"
+    setattr(parameters, "density_threshold", 5000)
+    setattr(parameters, "profile", False)  # time the stages of the filter, press 'p' to show the overlay
+    setattr(parameters, "profile_output", None)  # .json or .csv file to export the profile to when closing
+    setattr(parameters, "record_directory", None)  # directory to record the run to, see mcl/recording.py
+    setattr(parameters, "record_decimation", 1)  # record only every n-th particle
+    setattr(parameters, "playback_directory", None)  # directory of a recorded run to scrub through instead of filtering
+    setattr(parameters, "checkpoint_file", None)  # file the filter state is saved to, and restored from at startup
+    setattr(parameters, "checkpoint_interval", 50)  # filter updates between two checkpoints
 
     sim = Simulator(parameters)
@@ -0,0 +1,194 @@
+"""
+    Project: ROBa project
+    File: checkpoint.py
+    Description: This file contains the checkpoints of the filter state, written periodically and restored at startup.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+
+    Format:
+        A checkpoint is a single file: the 8 bytes CHECKPOINT_MAGIC, the length of the JSON state as a little-endian uint32
+        and 4 bytes of padding, the JSON state (random generator states, odometry accumulator, estimate, likelihood
+        averages, particle count and storage type, and the fingerprints of the map and the landmarks it belongs to),
+        padded to ALIGNMENT bytes, then the raw N×3 poses and the N weights.
+        The arrays are aligned, so they can be memory-mapped instead of read.
+"""
+
+import hashlib
+import json
+import os
+import struct
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from mcl.pose import Pose3D
+from mcl.resampling import resample_indices
+
+if TYPE_CHECKING:
+    from mcl.engine import MCLEngine
+
+CHECKPOINT_MAGIC = b"MCLCKPT1"
+CHECKPOINT_HEADER = struct.Struct("<8sI4x")
+ALIGNMENT = 64
+FINGERPRINT_SAMPLES = 256  # rows and columns of the map sampled by its fingerprint
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def map_fingerprint(grid_map) -> dict:
+    """
+        Function identifies a grid map by its geometry and a digest of its occupancy.
+        The digest covers at most FINGERPRINT_SAMPLES × FINGERPRINT_SAMPLES cells, so memory-mapped maps are not read entirely.
+        Parameters:
+            grid_map (environment.grid_map.GridMap): The grid map.
+        Returns:
+            dict: The number and size of the cells and the digest.
+    """
+    nb_cell_x, nb_cell_z = int(grid_map.nb_cell_x), int(grid_map.nb_cell_z)
+    rows = np.linspace(0, nb_cell_z, min(nb_cell_z, FINGERPRINT_SAMPLES), endpoint=False).astype(np.intp)
+    cols = np.linspace(0, nb_cell_x, min(nb_cell_x, FINGERPRINT_SAMPLES), endpoint=False).astype(np.intp)
+    sample = np.ascontiguousarray(grid_map.occupancy[rows[:, np.newaxis], cols[np.newaxis, :]], dtype="<f8")
+    return {
+        "cells": [nb_cell_x, nb_cell_z],
+        "cell_size": [float(grid_map.size_x), float(grid_map.size_z)],
+        "digest": hashlib.sha1(sample.tobytes()).hexdigest(),
+    }
+
+
+def landmarks_fingerprint(landmarks: np.ndarray) -> str:
+    """
+        Function returns the digest of the landmark coordinates.
+    """
+    return hashlib.sha1(np.ascontiguousarray(landmarks, dtype="<f8").tobytes()).hexdigest()
+
+
+def save_checkpoint(engine: "MCLEngine", path: str):
+    """
+        Function writes the state of the filter to a checkpoint.
+        The file is written next to the path and renamed over it, so a crash while writing never leaves
+        a truncated checkpoint behind.
+        Parameters:
+            engine (MCLEngine): The engine to checkpoint.
+            path (str): The path to the checkpoint.
+    """
+    particles = engine.particles
+    dtype = particles.poses.dtype.newbyteorder("<")
+    number_of_particles = len(particles)
+    odometry = engine.odometry
+    robot, estimate = engine.robot.pose, engine.predicted_robot.pose
+    state = {
+        "particles": number_of_particles,
+        "dtype": dtype.str,
+        "rng": engine.rng.bit_generator.state,
+        "world_rng": engine.world_rng.bit_generator.state,
+        "odometry": [odometry.dx, odometry.dy, odometry.dtheta, odometry.distance, odometry.steps, odometry.forward_steps],
+        "robot": [robot.x, robot.y, robot.theta],
+        "estimate": [estimate.x, estimate.y, estimate.theta],
+        "log_w_slow": engine.log_w_slow,
+        "log_w_fast": engine.log_w_fast,
+        "log_mean_likelihood": particles.log_mean_likelihood,
+        "map": map_fingerprint(engine.map),
+        "landmarks": landmarks_fingerprint(engine.landmarks_np),
+    }
+    encoded = json.dumps(state).encode()
+
+    poses_offset = _aligned(CHECKPOINT_HEADER.size + len(encoded))
+    weights_offset = _aligned(poses_offset + number_of_particles * 3 * dtype.itemsize)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, len(encoded)))
+        f.write(encoded)
+        f.seek(poses_offset)
+        f.write(np.ascontiguousarray(particles.poses, dtype=dtype).tobytes())
+        f.seek(weights_offset)
+        f.write(np.ascontiguousarray(particles.weights, dtype=dtype).tobytes())
+    os.replace(temporary, path)
+
+
+def read_checkpoint(path: str, mmap: bool = True) -> tuple[dict, np.ndarray, np.ndarray]:
+    """
+        Function reads a checkpoint.
+        Parameters:
+            path (str): The path to the checkpoint.
+            mmap (bool): Map the particle arrays copy-on-write instead of reading them, so only the pages
+                actually used are read and writing to them never changes the file. Defaults to True.
+        Returns:
+            tuple[dict, np.ndarray, np.ndarray]: The state, the N×3 poses and the N weights.
+        Raises:
+            ValueError: If the file is not a checkpoint.
+    """
+    with open(path, "rb") as f:
+        magic, length = CHECKPOINT_HEADER.unpack(f.read(CHECKPOINT_HEADER.size))
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError(f"'{path}' is not a filter checkpoint")
+        state = json.loads(f.read(length))
+
+    dtype = np.dtype(state["dtype"])
+    n = state["particles"]
+    poses_offset = _aligned(CHECKPOINT_HEADER.size + length)
+    weights_offset = _aligned(poses_offset + n * 3 * dtype.itemsize)
+    if mmap:
+        poses = np.memmap(path, dtype=dtype, mode="c", offset=poses_offset, shape=(n, 3))
+        weights = np.memmap(path, dtype=dtype, mode="c", offset=weights_offset, shape=(n,))
+    else:
+        with open(path, "rb") as f:
+            f.seek(poses_offset)
+            poses = np.fromfile(f, dtype=dtype, count=n * 3).reshape(n, 3)
+            f.seek(weights_offset)
+            weights = np.fromfile(f, dtype=dtype, count=n)
+    return state, poses, weights
+
+
+def restore_checkpoint(engine: "MCLEngine", path: str, mmap: bool = True):
+    """
+        Function restores the state of the filter from a checkpoint, so it resumes localized
+        instead of starting from uniformly spread particles.
+        The particles are copied into the arrays of the particle set and the file is unmapped, so the checkpoint
+        can be replaced right after. A checkpoint with another particle count than the engine allows
+        (the number_of_particles parameter capped by memory_budget_mb, or the KLD-sampling bounds) is resampled to it.
+        Parameters:
+            engine (MCLEngine): The engine to restore.
+            path (str): The path to the checkpoint.
+            mmap (bool): Map the particle arrays instead of reading them, see read_checkpoint. Defaults to True.
+        Raises:
+            ValueError: If the file is not a checkpoint, or it was saved on another map or with other landmarks.
+    """
+    state, poses, weights = read_checkpoint(path, mmap)
+    if state.get("map") != map_fingerprint(engine.map):
+        raise ValueError(f"the checkpoint '{path}' was saved on another map")
+    if state.get("landmarks") != landmarks_fingerprint(engine.landmarks_np):
+        raise ValueError(f"the checkpoint '{path}' was saved with other landmarks")
+
+    # the particle set shares the generator of the engine, restoring its bit generator restores both
+    engine.rng.bit_generator.state = state["rng"]
+    engine.world_rng.bit_generator.state = state["world_rng"]
+
+    number_of_particles = engine.number_of_particles
+    if engine.kld_sampler is not None:
+        number_of_particles = min(max(state["particles"], engine.kld_sampler.min_particles), engine.kld_sampler.max_particles)
+    if number_of_particles != state["particles"]:
+        rows = resample_indices(np.asarray(weights, dtype=np.float64), "systematic", n=number_of_particles, rng=engine.rng)
+        poses = poses[rows]
+        weights = np.full(number_of_particles, 1.0 / number_of_particles)
+
+    particles = engine.particles
+    if len(particles) != number_of_particles:
+        particles.poses = np.empty((number_of_particles, 3), dtype=particles.dtype)
+        particles.weights = np.empty(number_of_particles, dtype=particles.dtype)
+    np.copyto(particles.poses, poses, casting="same_kind")
+    np.copyto(particles.weights, weights, casting="same_kind")
+    del poses, weights  # unmaps the file
+    particles.log_mean_likelihood = state["log_mean_likelihood"]
+
+    odometry = engine.odometry
+    odometry.dx, odometry.dy, odometry.dtheta, odometry.distance, odometry.steps, odometry.forward_steps = state["odometry"]
+    engine.robot.set_pose(Pose3D(*state["robot"]))
+    engine.predicted_robot.pose = Pose3D(*state["estimate"])
+    engine.log_w_slow = state["log_w_slow"]
+    engine.log_w_fast = state["log_w_fast"]
@@ -0,0 +1,385 @@
+"""
+    Project: ROBa project
+    File: engine.py
+    Description: This file contains the headless Monte Carlo localization engine used by the simulator and by scripted runs.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+import os
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from geometry.point import Point2D
+from mcl.checkpoint import restore_checkpoint, save_checkpoint
+from mcl.kld_sampling import KLDSampler
+from mcl.landmarks import LandmarkIndex, VisibleLandmarkSensorModel, load_landmarks
+from mcl.monte_carlo import Robot
+from mcl.odometry import OdometryAccumulator
+from mcl.particle_set import ParticleSet, particles_for_budget
+from mcl.pose import Pose3D
+from mcl.pose_estimation import ESTIMATORS, estimate_pose, weighted_covariance
+from mcl.profiling import Profiler
+from mcl.range_sensor import RangeSensorModel
+
+from .global_vars import LANDMARKS, LANDMARKS_NP
+
+
+class MCLEngine:
+    """
+        Class provides the Monte Carlo localization filter without any user interface.
+        Attributes:
+            robot (Robot): The simulated ground truth robot.
+            predicted_robot (Robot): The robot placed at the estimated pose.
+            map (environment.grid_map.GridMap): The known grid map of the environment.
+            landmarks (list[Point2D]): The landmarks observed by the robot.
+            landmarks_np (np.ndarray): The same landmarks as an L×2 array.
+            seed (int|None): The seed of the random generators, None for a fresh entropy each run.
+            rng (np.random.Generator): The random generator of the filter (particles, resampling).
+            world_rng (np.random.Generator): The random generator of the simulated robot and sensors, an independent stream
+                so the filter settings do not change the simulated world.
+            noise (tuple[float, float, float]): The forward, turn and sense noise of the particles.
+            particles (ParticleSet): The particles of the filter.
+            dtype (np.dtype): The storage type of the particles, float32 if the "compact_particles" parameter is set.
+            max_particles (int|None): The largest particle count fitting in the "memory_budget_mb" parameter, None without a budget.
+            percent_random_particles (int): The maximal percentage of particles replaced by random ones at an update.
+            augmented (bool): Whether random particles are injected when the measurements get less likely (augmented MCL).
+            alpha_slow (float): The rate of the long-term average of the measurement likelihood.
+            alpha_fast (float): The rate of the short-term average of the measurement likelihood.
+            log_w_slow (float|None): The log of the long-term average of the measurement likelihood, None before the first update.
+            log_w_fast (float|None): The log of the short-term average of the measurement likelihood, None before the first update.
+            resampler (str): The resampling scheme, see mcl.resampling.RESAMPLERS.
+            resample_threshold (float): The fraction of the particle count under which the effective sample size triggers resampling.
+            kld_sampler (KLDSampler|None): The KLD-sampler adapting the particle count, None for a fixed count.
+            landmark_lookup (str): How the sensor model evaluates the distances to the landmarks, see mcl.sensor_model.LOOKUP_MODES.
+            sensor (str): "landmarks" for the ranges to the landmarks, "range" for the range-finder scans of the map.
+            range_sensor (RangeSensorModel|None): The range-finder model in the "range" sensor mode.
+            landmark_sensor (VisibleLandmarkSensorModel|None): The range-limited landmark model, if a landmark max range is set.
+            estimator (str): How the pose is estimated from the particles, see mcl.pose_estimation.ESTIMATORS.
+            cluster_size (float): The size of the grid cells of the "cluster" estimator in meters.
+            odometry (OdometryAccumulator): The motions of the robot not yet applied to the particles.
+            profiler (Profiler): The timers and counters of the stages of the filter, disabled unless the "profile" parameter is set.
+            updates (int): The number of filter updates with measurements since the engine was created.
+            checkpoint_file (str|None): The file the state of the filter is checkpointed to, None for no checkpoints.
+            checkpoint_interval (int): The number of updates between two checkpoints.
+            restored (bool): Whether the state was restored from the checkpoint file at startup.
+    """
+
+    def __init__(self, parameters):
+        """
+            Constructor of the class
+            Parameters:
+                parameters: (parameters.parameters.Parameters) the parameters of the filter
+            Raises:
+                AttributeError: If a mandatory parameter is missing.
+                ValueError: If a parameter has an unsupported value.
+        """
+        self.robot: Robot = getattr(parameters, "robot")
+        self.predicted_robot: Robot = getattr(parameters, "predicted_robot")
+        self.map = getattr(parameters, "map")
+        self.world_size = (self.map.width, self.map.height)  # the particles live on the whole map
+        self.profiler = Profiler(enabled=getattr(parameters, "profile", False))
+        self.number_of_particles = getattr(parameters, "number_of_particles")
+        self.percent_random_particles = getattr(parameters, "percent_random_particles")
+        self.landmarks = LANDMARKS
+        self.landmarks_np = LANDMARKS_NP
+        landmarks_file = getattr(parameters, "landmarks_file", None)
+        if landmarks_file is not None:
+            self.landmarks_np = load_landmarks(landmarks_file)
+            self.landmarks = [Point2D(x, y) for x, y in self.landmarks_np.tolist()]
+        self.noise = tuple(getattr(parameters, "noise", (0.2, 0.05, 2.0)))
+        self.seed = getattr(parameters, "seed", None)
+        filter_seed, world_seed = np.random.SeedSequence(self.seed).spawn(2)
+        self.rng = np.random.default_rng(filter_seed)
+        self.world_rng = np.random.default_rng(world_seed)
+        self.robot.rng = self.world_rng
+        self.robot.world_size = self.world_size  # the ground truth wraps around the map like the particles
+
+        self.sensor = getattr(parameters, "sensor", "landmarks")
+        self.dtype = np.dtype(np.float32 if getattr(parameters, "compact_particles", False) else np.float64)
+        self.max_particles: int|None = None
+        memory_budget_mb = getattr(parameters, "memory_budget_mb", None)
+        if memory_budget_mb is not None:
+            measurement_size = getattr(parameters, "number_of_beams", 36) if self.sensor == "range" else self.landmarks_np.shape[0]
+            self.max_particles = particles_for_budget(memory_budget_mb * 2 ** 20, self.dtype, measurement_size)
+            self.number_of_particles = min(self.number_of_particles, self.max_particles)
+
+        # warm restart: a previous checkpoint replaces the uniformly spread particles, restored once the filter is set up
+        self.updates = 0
+        self.checkpoint_file = getattr(parameters, "checkpoint_file", None)
+        self.checkpoint_interval = getattr(parameters, "checkpoint_interval", 50)
+        restore = (self.checkpoint_file is not None and getattr(parameters, "restore_checkpoint", True)
+                   and os.path.isfile(self.checkpoint_file))
+        self.particles: ParticleSet = self.init_particles(randomize=not restore)
+
+        self.range_sensor: RangeSensorModel|None = None
+        self.landmark_sensor: VisibleLandmarkSensorModel|None = None
+        self.landmark_lookup = getattr(parameters, "landmark_lookup", "exact")
+        if self.sensor == "range":
+            self.range_sensor = RangeSensorModel(self.map,
+                                                 number_of_beams=getattr(parameters, "number_of_beams", 36),
+                                                 max_range=getattr(parameters, "max_range", 20.0),
+                                                 sense_noise=getattr(parameters, "range_noise", 0.5),
+                                                 method=getattr(parameters, "range_method", "likelihood_field"))
+            self.particles.sensor_model = self.range_sensor
+        elif self.sensor == "landmarks" and getattr(parameters, "landmark_max_range", None) is not None:
+            # large landmark sets: only the landmarks in range are observed, found with a spatial index
+            if self.landmark_lookup != "exact":
+                raise ValueError(f"landmark_lookup '{self.landmark_lookup}' is not supported with landmark_max_range, "
+                                 f"the visible landmarks are always scored exactly, expected 'exact'")
+            index = LandmarkIndex(self.landmarks_np, self.map, getattr(parameters, "landmark_bucket_cells", 1))
+            self.landmark_sensor = VisibleLandmarkSensorModel(index,
+                                                              sense_noise=self.particles.noise.sense_noise,
+                                                              max_range=getattr(parameters, "landmark_max_range"))
+            self.particles.sensor_model = self.landmark_sensor
+        elif self.sensor == "landmarks":
+            # the landmarks are static, so their distances can be looked up in tables precomputed on the map
+            self.particles.sensor_model.use_lookup(self.map, self.landmark_lookup, getattr(parameters, "lookup_subdivisions", 4))
+        else:
+            raise ValueError(f"unknown sensor '{self.sensor}', expected 'landmarks' or 'range'")
+
+        self.resampler = getattr(parameters, "resampler", "systematic")  # the resampling scheme
+        self.resample_threshold = getattr(parameters, "resample_threshold", 0.5)  # fraction of N under which the ESS triggers resampling
+
+        # KLD-sampling adapts the number of particles at every filter update
+        self.kld_sampler: KLDSampler|None = None
+        if getattr(parameters, "kld_sampling", False):
+            self.kld_sampler = KLDSampler(self.map,
+                                          min_particles=getattr(parameters, "min_particles", 100),
+                                          max_particles=min(getattr(parameters, "max_particles", self.number_of_particles),
+                                                            self.max_particles or math.inf),
+                                          epsilon=getattr(parameters, "kld_epsilon", 0.05),
+                                          delta=getattr(parameters, "kld_delta", 0.01),
+                                          world_size=self.world_size)
+
+        self.estimator = getattr(parameters, "estimator", "cluster")
+        if self.estimator not in ESTIMATORS:
+            raise ValueError(f"unknown pose estimator '{self.estimator}', expected one of {ESTIMATORS}")
+        self.cluster_size = getattr(parameters, "cluster_size", 2.0)
+
+        self.odometry = OdometryAccumulator(distance_threshold=getattr(parameters, "odometry_distance", 0.5),
+                                            angle_threshold=getattr(parameters, "odometry_angle", math.radians(10)))
+
+        # augmented MCL: random particles are injected while the short-term likelihood is below the long-term one
+        self.augmented = getattr(parameters, "augmented_mcl", True)
+        self.alpha_slow = getattr(parameters, "alpha_slow", 0.01)
+        self.alpha_fast = getattr(parameters, "alpha_fast", 0.2)
+        self.log_w_slow: float|None = None
+        self.log_w_fast: float|None = None
+
+        self.restored = False
+        if restore:
+            self.restore_checkpoint()
+
+
+    def init_particles(self, randomize: bool = True) -> ParticleSet:
+        """
+            Method creates a set of particles with random positions and orientations.
+            Parameters:
+                randomize (bool): Draw the poses, False leaves them to be restored from a checkpoint. Defaults to True.
+        """
+        # only in the free cells of the map
+        return ParticleSet(self.number_of_particles, noise=self.noise, world_size=self.world_size, landmarks=self.landmarks_np,
+                           rng=self.rng, dtype=self.dtype, randomize=randomize, grid_map=self.map)
+
+
+    def step(self, odometry: tuple|None, measurements: list[float]|None) -> Pose3D:
+        """
+            Method performs one step of the filter.
+
+            This function performs the following steps:
+            1. Moves the particles by the odometry, if any.
+            2. Calculates the weights of the particles based on the measurements, if any.
+            3. Resamples the particles according to their weights once the effective sample size drops too low
+               (or at every update in the KLD-sampling mode, where resampling also picks the particle count).
+            4. Replaces some particles by random ones in the free cells of the map if the measurements became
+               less likely than usual (augmented MCL), which recovers from kidnapping.
+            5. Estimates the pose of the robot.
+            Parameters:
+                odometry (tuple|None): The forward and turn movement since the last step,
+                    or a composed motion flushed from the odometry accumulator (see move_particles).
+                measurements (list[float]|None): The observed distances to the landmarks or ranges of the scan.
+            Returns:
+                Pose3D: The estimated pose of the robot.
+        """
+        if odometry is not None:
+            self.move_particles(*odometry)
+
+        if measurements is not None:
+            w = self.calculate_weights(measurements)
+            injected = self.random_particle_fraction()
+            if injected > 0 or self.kld_sampler is not None or self.particles.effective_sample_size() < self.resample_threshold * len(self.particles):
+                self.resample_particles(w)
+            if injected > 0:
+                number_injected = int(injected * len(self.particles))
+                self.randomize_n_particles(number_injected)
+                self.profiler.count("injected_particles", number_injected)
+            self.predicted_robot.pose = self.estimate_location()  # robot location estimate based on particles
+            self.profiler.count("updates")
+            self.profiler.count("particle_updates", len(self.particles))
+            self.updates += 1
+            if self.checkpoint_file is not None and self.updates % self.checkpoint_interval == 0:
+                self.save_checkpoint()
+
+        return self.predicted_robot.pose
+
+
+    def sense(self) -> list[float]:
+        """
+            Method simulates the measurements of the ground truth robot with the configured sensor.
+            Returns:
+                list: The distances to the landmarks, the observed landmarks in range or the ranges of the scan.
+        """
+        with self.profiler.stage("sense"):
+            if self.range_sensor is not None:
+                return self.range_sensor.measure(self.robot.pose, self.world_rng)
+            if self.landmark_sensor is not None:
+                return self.landmark_sensor.measure(self.robot.pose, self.world_rng)
+            return self.robot.get_measurements(self.landmarks)
+
+
+    def simulate(self, forward: float, turn: float) -> tuple[tuple[float, float], list[float]]:
+        """
+            Method moves the ground truth robot and senses from its new pose.
+            Parameters:
+                forward (float): The forward movement.
+                turn (float): The turn movement.
+            Returns:
+                tuple[tuple[float, float], list[float]]: The odometry and the measurements to pass to step().
+        """
+        self.robot.move(forward=forward, turn=turn)
+        return (forward, turn), self.sense()
+
+
+    def run(self, trajectory: Iterable[tuple[float, float]]) -> Iterator[Pose3D]:
+        """
+            Method drives the ground truth robot along a scripted trajectory as fast as possible
+            and filters every step.
+            Parameters:
+                trajectory (Iterable[tuple[float, float]]): The forward and turn movements of the robot.
+            Returns:
+                Iterator[Pose3D]: The estimated pose after every step.
+        """
+        for forward, turn in trajectory:
+            yield self.step(*self.simulate(forward, turn))
+
+
+    def calculate_weights(self, z: list[float]) -> np.ndarray:
+        """
+            Method calculates the weights of the particles based on the measurement probabilities.
+            Parameters:
+                z (list[float]): The observed measurements.
+            Returns:
+                np.ndarray: The weights of the particles.
+        """
+        with self.profiler.stage("calculate_weights"):
+            return self.particles.measurement_prob(z)
+
+
+    def random_particle_fraction(self) -> float:
+        """
+            Method updates the short- and long-term averages of the measurement likelihood with the last measurements
+            and derives the fraction of particles to replace by random ones, max(0, 1 - w_fast / w_slow),
+            capped by percent_random_particles. The averages are kept in log space since the likelihoods underflow.
+            Returns:
+                float: The fraction of particles to replace, 0 if the augmented MCL is disabled.
+        """
+        if not self.augmented:
+            return 0.0
+
+        log_w_avg = self.particles.log_mean_likelihood
+        if self.log_w_slow is None:
+            self.log_w_slow = self.log_w_fast = log_w_avg
+            return 0.0
+
+        # w += alpha * (w_avg - w), i.e. w = (1 - alpha) * w + alpha * w_avg
+        self.log_w_slow = float(np.logaddexp(math.log1p(-self.alpha_slow) + self.log_w_slow, math.log(self.alpha_slow) + log_w_avg))
+        self.log_w_fast = float(np.logaddexp(math.log1p(-self.alpha_fast) + self.log_w_fast, math.log(self.alpha_fast) + log_w_avg))
+        if not np.isfinite(self.log_w_slow):
+            return 0.0
+        return min(max(0.0, 1.0 - math.exp(min(0.0, self.log_w_fast - self.log_w_slow))), self.percent_random_particles / 100)
+
+
+    def resample_particles(self, weights: np.ndarray):
+        """
+            Method resamples the particles based on their weights to focus on the more likely particles.
+            Parameters:
+                weights (np.ndarray): The weights of the particles.
+        """
+        with self.profiler.stage("resample_particles"):
+            self.particles.resample(weights, self.resampler, self.kld_sampler)
+        self.profiler.count("resamples")
+
+
+    def randomize_n_particles(self, n: int):
+        """
+            Method randomizes the positions and orientations of a specified number of particles,
+            drawn in the free cells of the map.
+            Parameters:
+                n (int): The number of particles to randomize.
+        """
+        with self.profiler.stage("randomize_n_particles"):
+            self.particles.randomize(n, self.map)
+
+
+    def estimate_location(self) -> Pose3D:
+        """
+            Method estimates the location of the robot from the weighted particles with the configured estimator.
+            Returns:
+                Pose3D: The estimated pose of the robot.
+        """
+        with self.profiler.stage("estimate_location"):
+            x, y, theta = estimate_pose(self.particles.poses, self.particles.weights, self.estimator,
+                                        self.world_size, self.cluster_size).tolist()
+        return Pose3D(x, y, theta)
+
+
+    def estimate_covariance(self) -> np.ndarray:
+        """
+            Method computes the spread of the particles around their weighted mean.
+            Returns:
+                np.ndarray: The 3×3 covariance matrix of (x, y, theta).
+        """
+        return weighted_covariance(self.particles.poses, self.particles.weights)
+
+
+    def move_particles(self, forward: float, turn: float, final_turn: float = 0.0, steps: int = 1, forward_steps: int = 1):
+        """
+            Method moves the particles based on the given forward and turn values.
+            Parameters:
+                forward (float): The forward movement.
+                turn (float): The turn movement.
+                final_turn (float): The turn after the forward movement of a composed motion. Defaults to 0.0.
+                steps (int): The number of increments of a composed motion. Defaults to 1.
+                forward_steps (int): The number of forward increments of a composed motion. Defaults to 1.
+        """
+        with self.profiler.stage("move_particles"):
+            self.particles.move(forward, turn, final_turn, steps, forward_steps)
+
+
+    def save_checkpoint(self, path: str|None = None):
+        """
+            Method writes the state of the filter to a checkpoint, see mcl.checkpoint.
+            Parameters:
+                path (str|None): The path to the checkpoint, the checkpoint file if None. Defaults to None.
+        """
+        with self.profiler.stage("save_checkpoint"):
+            save_checkpoint(self, path or self.checkpoint_file)
+        self.profiler.count("checkpoints")
+
+
+    def restore_checkpoint(self, path: str|None = None):
+        """
+            Method restores the state of the filter from a checkpoint, the particles are read through a memory map.
+            Parameters:
+                path (str|None): The path to the checkpoint, the checkpoint file if None. Defaults to None.
+        """
+        with self.profiler.stage("restore_checkpoint"):
+            restore_checkpoint(self, path or self.checkpoint_file, mmap=True)
+        self.restored = True
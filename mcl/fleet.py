@@ -0,0 +1,280 @@
+"""
+    Project: ROBa project
+    File: fleet.py
+    Description: This file contains the headless Monte Carlo localization engine of a fleet of robots sharing one map.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from mcl.landmarks import load_landmarks
+from mcl.monte_carlo import Robot
+from mcl.particle_batch import ParticleBatch
+from mcl.pose import Pose3D
+from mcl.pose_estimation import ESTIMATORS, estimate_batch_poses
+from mcl.profiling import Profiler
+from mcl.resampling import BATCH_RESAMPLERS
+
+from .global_vars import LANDMARKS_NP
+
+
+class FleetEngine:
+    """
+        Class localizes R independent robots on the same map with one batched filter.
+        It mirrors MCLEngine, but the particles of all robots are one R×N×3 tensor (see ParticleBatch):
+        the motion, the weighting, the resampling and the estimation are single vectorized passes over the fleet,
+        and the distance tables of the map are looked up once for all of its particles.
+        The robots observe the ranges to all the landmarks; the range-finder, the range-limited landmarks
+        and KLD-sampling change the size of the measurements or of the particle sets per robot and are not supported.
+        Attributes:
+            robots (list[Robot]): The simulated ground truth robots.
+            predicted_robots (list[Robot]): The robots placed at the estimated poses.
+            map (environment.grid_map.GridMap): The known grid map of the environment.
+            landmarks_np (np.ndarray): The L×2 array of the landmarks observed by the robots.
+            seed (int|None): The seed of the random generators, None for a fresh entropy each run.
+            rng (np.random.Generator): The random generator of the filter (particles, resampling).
+            world_rng (np.random.Generator): The random generator of the simulated robots and sensors.
+            noise (tuple[float, float, float]): The forward, turn and sense noise of the particles.
+            particles (ParticleBatch): The particles of all robots.
+            percent_random_particles (int): The maximal percentage of particles of a robot replaced by random ones at an update.
+            augmented (bool): Whether random particles are injected when the measurements get less likely (augmented MCL).
+            alpha_slow (float): The rate of the long-term averages of the measurement likelihood.
+            alpha_fast (float): The rate of the short-term averages of the measurement likelihood.
+            log_w_slow (np.ndarray|None): The R logs of the long-term averages, None before the first update.
+            log_w_fast (np.ndarray|None): The R logs of the short-term averages, None before the first update.
+            resampler (str): The resampling scheme, see mcl.resampling.BATCH_RESAMPLERS.
+            resample_threshold (float): The fraction of the particle count under which the effective sample size
+                of a robot triggers its resampling.
+            landmark_lookup (str): How the sensor model evaluates the distances to the landmarks, see mcl.sensor_model.LOOKUP_MODES.
+            estimator (str): How the poses are estimated from the particles, see mcl.pose_estimation.ESTIMATORS.
+            cluster_size (float): The size of the grid cells of the "cluster" estimator in meters.
+            profiler (Profiler): The timers and counters of the stages of the filter, disabled unless the "profile" parameter is set.
+    """
+
+    def __init__(self, parameters):
+        """
+            Constructor of the class
+            Parameters:
+                parameters: (parameters.parameters.Parameters) the parameters of the filter, with the list of
+                    ground truth robots in "robots" and the number of particles per robot in "number_of_particles"
+            Raises:
+                AttributeError: If a mandatory parameter is missing.
+                ValueError: If a parameter is not supported by the batched filter.
+        """
+        self.robots: list[Robot] = list(getattr(parameters, "robots"))
+        self.predicted_robots: list[Robot] = [Robot(Pose3D(0, 0, 0)) for _ in self.robots]
+        self.map = getattr(parameters, "map")
+        self.world_size = (self.map.width, self.map.height)
+        self.profiler = Profiler(enabled=getattr(parameters, "profile", False))
+        self.number_of_particles = getattr(parameters, "number_of_particles")
+        self.percent_random_particles = getattr(parameters, "percent_random_particles")
+        self.landmarks_np = LANDMARKS_NP
+        landmarks_file = getattr(parameters, "landmarks_file", None)
+        if landmarks_file is not None:
+            self.landmarks_np = load_landmarks(landmarks_file)
+        self.noise = tuple(getattr(parameters, "noise", (0.2, 0.05, 2.0)))
+        self.seed = getattr(parameters, "seed", None)
+        filter_seed, world_seed = np.random.SeedSequence(self.seed).spawn(2)
+        self.rng = np.random.default_rng(filter_seed)
+        self.world_rng = np.random.default_rng(world_seed)
+        for robot in self.robots:
+            robot.rng = self.world_rng
+            robot.world_size = self.world_size
+
+        sensor = getattr(parameters, "sensor", "landmarks")
+        if sensor != "landmarks" or getattr(parameters, "landmark_max_range", None) is not None:
+            raise ValueError("the fleet engine supports the 'landmarks' sensor without a max range only")
+        if getattr(parameters, "kld_sampling", False):
+            raise ValueError("the fleet engine keeps the same number of particles for every robot, KLD-sampling is not supported")
+
+        # only in the free cells of the map
+        self.particles = ParticleBatch(len(self.robots), self.number_of_particles, noise=self.noise, world_size=self.world_size,
+                                       landmarks=self.landmarks_np, rng=self.rng, grid_map=self.map)
+        # one set of distance tables serves the particles of the whole fleet
+        self.landmark_lookup = getattr(parameters, "landmark_lookup", "exact")
+        self.particles.sensor_model.use_lookup(self.map, self.landmark_lookup, getattr(parameters, "lookup_subdivisions", 4))
+
+        self.resampler = getattr(parameters, "resampler", "systematic")
+        if self.resampler not in BATCH_RESAMPLERS:
+            raise ValueError(f"unknown batch resampling method '{self.resampler}', expected one of {BATCH_RESAMPLERS}")
+        self.resample_threshold = getattr(parameters, "resample_threshold", 0.5)
+
+        self.estimator = getattr(parameters, "estimator", "cluster")
+        if self.estimator not in ESTIMATORS:
+            raise ValueError(f"unknown pose estimator '{self.estimator}', expected one of {ESTIMATORS}")
+        self.cluster_size = getattr(parameters, "cluster_size", 2.0)
+
+        self.augmented = getattr(parameters, "augmented_mcl", True)
+        self.alpha_slow = getattr(parameters, "alpha_slow", 0.01)
+        self.alpha_fast = getattr(parameters, "alpha_fast", 0.2)
+        self.log_w_slow: np.ndarray|None = None
+        self.log_w_fast: np.ndarray|None = None
+
+
+    def step(self, odometry: tuple|None, measurements: np.ndarray|None) -> np.ndarray:
+        """
+            Method performs one step of the filter of every robot, see MCLEngine.step.
+            Parameters:
+                odometry (tuple|None): The forward and turn movements of the robots since the last step, R arrays,
+                    optionally followed by the final turns and increment counts of composed motions (see ParticleBatch.move).
+                measurements (np.ndarray|None): The R×L array of observed distances to the landmarks.
+            Returns:
+                np.ndarray: The R×3 array of estimated poses.
+        """
+        if odometry is not None:
+            self.move_particles(*odometry)
+
+        if measurements is not None:
+            self.calculate_weights(measurements)
+            injected = self.random_particle_fractions()
+            resampled = (injected > 0) | (self.particles.effective_sample_size() < self.resample_threshold * len(self.particles))
+            self.resample_particles(np.flatnonzero(resampled))
+            if np.any(injected > 0):
+                self.randomize_particles(injected)
+            self.estimate_locations()
+            self.profiler.count("updates")
+            self.profiler.count("particle_updates", self.particles.weights.size)
+
+        return self.estimates()
+
+
+    def estimates(self) -> np.ndarray:
+        """
+            Method returns the current estimated poses.
+            Returns:
+                np.ndarray: The R×3 array of estimated poses.
+        """
+        return np.array([[r.pose.x, r.pose.y, r.pose.theta] for r in self.predicted_robots])
+
+
+    def sense(self) -> np.ndarray:
+        """
+            Method simulates the measurements of the ground truth robots.
+            Returns:
+                np.ndarray: The R×L array of noisy distances to the landmarks.
+        """
+        with self.profiler.stage("sense"):
+            positions = np.array([(r.pose.x, r.pose.y) for r in self.robots])
+            sense_noise = np.array([r.noise.sense_noise for r in self.robots])
+            distances = np.hypot(positions[:, np.newaxis, 0] - self.landmarks_np[np.newaxis, :, 0],
+                                 positions[:, np.newaxis, 1] - self.landmarks_np[np.newaxis, :, 1])
+            return distances + self.world_rng.standard_normal(distances.shape) * sense_noise[:, np.newaxis]
+
+
+    def simulate(self, forward: np.ndarray, turn: np.ndarray) -> tuple[tuple[np.ndarray, np.ndarray], np.ndarray]:
+        """
+            Method moves the ground truth robots and senses from their new poses.
+            Parameters:
+                forward (np.ndarray): The R forward movements.
+                turn (np.ndarray): The R turn movements.
+            Returns:
+                tuple[tuple[np.ndarray, np.ndarray], np.ndarray]: The odometry and the measurements to pass to step().
+        """
+        forward = np.broadcast_to(np.asarray(forward, dtype=np.float64), len(self.robots))
+        turn = np.broadcast_to(np.asarray(turn, dtype=np.float64), len(self.robots))
+        for robot, f, t in zip(self.robots, forward.tolist(), turn.tolist()):
+            robot.move(forward=f, turn=t)
+        return (forward, turn), self.sense()
+
+
+    def run(self, trajectory: Iterable[tuple[np.ndarray, np.ndarray]]) -> Iterator[np.ndarray]:
+        """
+            Method drives the ground truth robots along scripted trajectories as fast as possible
+            and filters every step.
+            Parameters:
+                trajectory (Iterable[tuple[np.ndarray, np.ndarray]]): The R forward and R turn movements of every step.
+            Returns:
+                Iterator[np.ndarray]: The R×3 array of estimated poses after every step.
+        """
+        for forward, turn in trajectory:
+            yield self.step(*self.simulate(forward, turn))
+
+
+    def move_particles(self, forward: np.ndarray, turn: np.ndarray, final_turn: np.ndarray|float = 0.0,
+                       steps: np.ndarray|int = 1, forward_steps: np.ndarray|int = 1):
+        """
+            Method moves the particles of every robot by its odometry, see ParticleBatch.move.
+        """
+        with self.profiler.stage("move_particles"):
+            self.particles.move(forward, turn, final_turn, steps, forward_steps)
+
+
+    def calculate_weights(self, z: np.ndarray) -> np.ndarray:
+        """
+            Method calculates the weights of the particles of every robot based on its measurements.
+            Parameters:
+                z (np.ndarray): The R×L array of observed measurements.
+            Returns:
+                np.ndarray: The R×N array of weights.
+        """
+        with self.profiler.stage("calculate_weights"):
+            return self.particles.measurement_prob(z)
+
+
+    def random_particle_fractions(self) -> np.ndarray:
+        """
+            Method updates the averages of the measurement likelihood of every robot and derives the fractions
+            of particles to replace by random ones, see MCLEngine.random_particle_fraction.
+            Returns:
+                np.ndarray: The R array of fractions, zeros if the augmented MCL is disabled.
+        """
+        no_injection = np.zeros(len(self.robots))
+        if not self.augmented:
+            return no_injection
+
+        log_w_avg = self.particles.log_mean_likelihood
+        if self.log_w_slow is None:
+            self.log_w_slow = log_w_avg.copy()
+            self.log_w_fast = log_w_avg.copy()
+            return no_injection
+
+        self.log_w_slow = np.logaddexp(math.log1p(-self.alpha_slow) + self.log_w_slow, math.log(self.alpha_slow) + log_w_avg)
+        self.log_w_fast = np.logaddexp(math.log1p(-self.alpha_fast) + self.log_w_fast, math.log(self.alpha_fast) + log_w_avg)
+        with np.errstate(invalid='ignore'):
+            fractions = 1.0 - np.exp(np.minimum(0.0, self.log_w_fast - self.log_w_slow))
+        fractions[~np.isfinite(self.log_w_slow)] = 0.0
+        return np.clip(fractions, 0.0, self.percent_random_particles / 100)
+
+
+    def resample_particles(self, robots: np.ndarray):
+        """
+            Method resamples the particle sets of the given robots in one pass.
+            Parameters:
+                robots (np.ndarray): The indices of the robots to resample.
+        """
+        with self.profiler.stage("resample_particles"):
+            self.particles.resample(robots, self.resampler)
+        self.profiler.count("resamples", robots.shape[0])
+
+
+    def randomize_particles(self, fractions: np.ndarray):
+        """
+            Method replaces a fraction of the particles of every robot by random ones drawn in the free cells of the map.
+            Every particle is replaced independently, with the probability of the fraction of its robot.
+            Parameters:
+                fractions (np.ndarray): The R array of fractions.
+        """
+        with self.profiler.stage("randomize_n_particles"):
+            mask = self.rng.random(self.particles.weights.shape) < fractions[:, np.newaxis]
+            self.particles.randomize(mask, self.map)
+        self.profiler.count("injected_particles", int(np.count_nonzero(mask)))
+
+
+    def estimate_locations(self):
+        """
+            Method estimates the locations of all robots with the configured estimator
+            and places the predicted robots there.
+        """
+        with self.profiler.stage("estimate_location"):
+            poses = estimate_batch_poses(self.particles.poses, self.particles.weights, self.estimator,
+                                         self.world_size, self.cluster_size)
+        for robot, (x, y, theta) in zip(self.predicted_robots, poses.tolist()):
+            robot.pose = Pose3D(x, y, theta)
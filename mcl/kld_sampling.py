@@ -0,0 +1,139 @@
+"""
+    Project: ROBa project
+    File: kld_sampling.py
+    Description: This file contains the KLD-sampling used to adapt the number of particles of the Monte Carlo localization.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from mcl.resampling import resample_indices
+
+from .global_vars import WORLD_SIZE
+
+
+def kld_sample_size(k: np.ndarray, epsilon: float, z_quantile: float) -> np.ndarray:
+    """
+        Function computes the number of particles needed so that the Kullback-Leibler distance between
+        the sample-based and the true posterior stays below epsilon (Wilson-Hilferty approximation).
+        Parameters:
+            k (np.ndarray): The number of occupied bins.
+            epsilon (float): The maximum allowed Kullback-Leibler distance.
+            z_quantile (float): The upper 1 - delta quantile of the standard normal distribution.
+        Returns:
+            np.ndarray: The required number of particles for every k.
+    """
+    k1 = np.maximum(np.asarray(k, dtype=np.float64) - 1.0, 1.0)
+    a = 2.0 / (9.0 * k1)
+    n = k1 / (2.0 * epsilon) * (1.0 - a + np.sqrt(a) * z_quantile) ** 3
+    return np.where(np.asarray(k) > 1, np.ceil(n), 1.0)
+
+
+class KLDSampler:
+    """
+        Class to handle the KLD-sampling of a particle set.
+        The particles are binned in (x, y, theta) and the resampled set is grown until its size exceeds
+        the number of particles required for the number of bins it occupies.
+        Attributes:
+            min_particles (int): The lower bound of the particle count.
+            max_particles (int): The upper bound of the particle count.
+            epsilon (float): The maximum allowed Kullback-Leibler distance.
+            z_quantile (float): The upper 1 - delta quantile of the standard normal distribution.
+            bin_size (tuple[float, float, float]): The size of a bin along x, y and theta.
+            nb_bins (tuple[int, int, int]): The number of bins along x, y and theta.
+    """
+    min_particles: int
+    max_particles: int
+    epsilon: float
+    z_quantile: float
+    bin_size: tuple[float, float, float]
+    nb_bins: tuple[int, int, int]
+
+    def __init__(self, grid_map, min_particles: int = 100, max_particles: int = 10000, epsilon: float = 0.05,
+                 delta: float = 0.01, theta_bin_size: float = math.radians(10), world_size: tuple[float, float] = WORLD_SIZE):
+        """
+            Constructor initializes the bounds, the error parameters and the bins.
+            Parameters:
+                grid_map (environment.grid_map.GridMap): The map whose cell size is used for the spatial bins.
+                min_particles (int): The lower bound of the particle count. Defaults to 100.
+                max_particles (int): The upper bound of the particle count. Defaults to 10000.
+                epsilon (float): The maximum allowed Kullback-Leibler distance. Defaults to 0.05.
+                delta (float): The probability that the distance exceeds epsilon. Defaults to 0.01.
+                theta_bin_size (float): The size of an orientation bin in rad. Defaults to 10 degrees.
+                world_size (tuple[float, float]): The size of the world. Defaults to WORLD_SIZE.
+        """
+        if min_particles > max_particles:
+            raise ValueError("min_particles can't be greater than max_particles")
+
+        self.min_particles = min_particles
+        self.max_particles = max_particles
+        self.epsilon = epsilon
+        self.z_quantile = NormalDist().inv_cdf(1.0 - delta)
+        self.bin_size = (grid_map.size_x, grid_map.size_z, theta_bin_size)
+        self.nb_bins = (math.ceil(world_size[0] / grid_map.size_x),
+                        math.ceil(world_size[1] / grid_map.size_z),
+                        math.ceil(2 * math.pi / theta_bin_size))
+
+
+    def bin_ids(self, poses: np.ndarray) -> np.ndarray:
+        """
+            Method computes the flat index of the (x, y, theta) bin of every pose.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            Returns:
+                np.ndarray: The N array of bin indices.
+        """
+        ix = np.clip((poses[:, 0] / self.bin_size[0]).astype(np.int64), 0, self.nb_bins[0] - 1)
+        iy = np.clip((poses[:, 1] / self.bin_size[1]).astype(np.int64), 0, self.nb_bins[1] - 1)
+        it = np.clip((poses[:, 2] / self.bin_size[2]).astype(np.int64), 0, self.nb_bins[2] - 1)
+        return ix + self.nb_bins[0] * (iy + self.nb_bins[1] * it)
+
+
+    def occupied_bins(self, poses: np.ndarray) -> int:
+        """
+            Method counts the number of bins occupied by the poses.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            Returns:
+                int: The number of occupied bins.
+        """
+        return int(np.unique(self.bin_ids(poses)).shape[0])
+
+
+    def sample_indices(self, poses: np.ndarray, weights: np.ndarray, rng: np.random.Generator,
+                       method: str = "systematic") -> np.ndarray:
+        """
+            Method draws the indices of the resampled particle set with an adaptive size.
+            max_particles candidates are drawn at once and shuffled, so every prefix of the candidates
+            is a valid sample; the set is cut at the first prefix that is large enough for the number
+            of bins it occupies.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+                weights (np.ndarray): The N array of normalized weights.
+                rng (np.random.Generator): The random generator.
+                method (str): The resampling scheme, see mcl.resampling.RESAMPLERS. Defaults to "systematic".
+            Returns:
+                np.ndarray: The array of selected particle indices, between min_particles and max_particles long.
+        """
+        candidates = resample_indices(weights, method, self.max_particles, rng)
+        candidates = candidates[rng.permutation(self.max_particles)]
+
+        # number of distinct bins occupied by the first m candidates, for every m
+        _, first_seen = np.unique(self.bin_ids(poses[candidates]), return_index=True)
+        is_new_bin = np.zeros(self.max_particles, dtype=bool)
+        is_new_bin[first_seen] = True
+        occupied = np.cumsum(is_new_bin)
+
+        required = np.clip(kld_sample_size(occupied, self.epsilon, self.z_quantile), self.min_particles, self.max_particles)
+        sizes = np.arange(1, self.max_particles + 1)
+        satisfied = np.flatnonzero(sizes >= required)
+        n = int(sizes[satisfied[0]]) if satisfied.shape[0] > 0 else self.max_particles
+        return candidates[:n]
@@ -0,0 +1,191 @@
+"""
+    Project: ROBa project
+    File: landmarks.py
+    Description: This file contains the loading of landmark sets, their spatial index and the range-limited landmark sensor model.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+import os
+
+import numpy as np
+
+from mcl.pose import Pose3D
+
+
+def load_landmarks(path: str) -> np.ndarray:
+    """
+        Function loads landmarks from a file.
+        Text files (.csv, .txt) hold one "x, y" pair per line, lines starting with '#' are ignored.
+        NumPy files (.npy) hold an L×2 array.
+        Parameters:
+            path (str): The path to the file.
+        Returns:
+            np.ndarray: The L×2 array of landmark coordinates.
+        Raises:
+            ValueError: If the format of the file is not supported or the file does not hold L×2 coordinates.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        landmarks = np.load(path)
+    elif extension in (".csv", ".txt"):
+        landmarks = np.loadtxt(path, delimiter="," if extension == ".csv" else None, comments="#", ndmin=2)
+    else:
+        raise ValueError(f"unsupported landmark format '{extension}', expected .npy, .csv or .txt")
+
+    if landmarks.ndim != 2 or landmarks.shape[1] != 2:
+        raise ValueError(f"the landmarks have to be an L×2 array, got shape {landmarks.shape}")
+    return np.ascontiguousarray(landmarks, dtype=np.float64)
+
+
+class LandmarkIndex:
+    """
+        Class to handle a spatial index of the landmarks: a grid of buckets keyed on the cells of the grid map.
+        The landmarks are sorted by bucket (compressed sparse row layout), so the landmarks of a row of
+        buckets are a single contiguous slice.
+        Attributes:
+            landmarks (np.ndarray): The L×2 array of landmark coordinates, in the original order.
+            bucket_size (tuple[float, float]): The size of a bucket along x and z in meters.
+            nb_buckets (tuple[int, int]): The number of buckets along x and z.
+            order (np.ndarray): The landmark indices sorted by bucket.
+            bucket_start (np.ndarray): The position in order of the first landmark of every bucket, plus the end.
+    """
+    landmarks: np.ndarray
+    bucket_size: tuple[float, float]
+    nb_buckets: tuple[int, int]
+    order: np.ndarray
+    bucket_start: np.ndarray
+
+    def __init__(self, landmarks: np.ndarray, grid_map, cells_per_bucket: int = 1):
+        """
+            Constructor builds the index.
+            Parameters:
+                landmarks (np.ndarray): The L×2 array of landmark coordinates.
+                grid_map (environment.grid_map.GridMap): The map whose cells define the buckets.
+                cells_per_bucket (int): The number of map cells along each axis of a bucket. Defaults to 1.
+        """
+        self.landmarks = np.asarray(landmarks, dtype=np.float64)
+        self.bucket_size = (grid_map.size_x * cells_per_bucket, grid_map.size_z * cells_per_bucket)
+        self.nb_buckets = (math.ceil(grid_map.nb_cell_x / cells_per_bucket), math.ceil(grid_map.nb_cell_z / cells_per_bucket))
+
+        buckets = self.bucket_ids(self.landmarks[:, 0], self.landmarks[:, 1])
+        self.order = np.argsort(buckets, kind="stable")
+        self.bucket_start = np.searchsorted(buckets[self.order], np.arange(self.nb_buckets[0] * self.nb_buckets[1] + 1))
+
+
+    def __len__(self) -> int:
+        return self.landmarks.shape[0]
+
+
+    def bucket_coords(self, x: np.ndarray, z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Method computes the bucket column and row of positions, clipped to the index.
+        """
+        bx = np.clip(np.floor(np.asarray(x) / self.bucket_size[0]).astype(np.intp), 0, self.nb_buckets[0] - 1)
+        bz = np.clip(np.floor(np.asarray(z) / self.bucket_size[1]).astype(np.intp), 0, self.nb_buckets[1] - 1)
+        return bx, bz
+
+
+    def bucket_ids(self, x: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """
+            Method computes the flat bucket index of positions.
+        """
+        bx, bz = self.bucket_coords(x, z)
+        return bz * self.nb_buckets[0] + bx
+
+
+    def query_radius(self, x: float, z: float, radius: float) -> np.ndarray:
+        """
+            Method finds the landmarks within the given distance of a position.
+            Only the buckets overlapping the bounding square of the circle are visited.
+            Parameters:
+                x (float): The x coordinate of the position in meters.
+                z (float): The z coordinate of the position in meters.
+                radius (float): The search radius in meters.
+            Returns:
+                np.ndarray: The indices of the landmarks within the radius, in ascending order.
+        """
+        (bx0, bx1), (bz0, bz1) = self.bucket_coords(np.array([x - radius, x + radius]), np.array([z - radius, z + radius]))
+
+        slices = []
+        for bz in range(int(bz0), int(bz1) + 1):
+            first = bz * self.nb_buckets[0]
+            slices.append(self.order[self.bucket_start[first + bx0]:self.bucket_start[first + bx1 + 1]])
+        candidates = np.concatenate(slices)
+
+        distances = np.hypot(self.landmarks[candidates, 0] - x, self.landmarks[candidates, 1] - z)
+        return np.sort(candidates[distances <= radius])
+
+
+class VisibleLandmarkSensorModel:
+    """
+        Class to handle a landmark sensor with a limited range over a large set of landmarks.
+        A measurement is the list of the landmarks seen by the robot with their distances, found with the spatial index.
+        Every particle is scored only against the observed landmarks: with the Gaussian range noise for the
+        landmarks within its own sensor range, and with a constant miss probability for the ones it could not see.
+        The cost is O(N·M) with M the number of observed landmarks, independent of the size of the landmark set.
+        Attributes:
+            index (LandmarkIndex): The spatial index of the landmarks.
+            sense_noise (float): The standard deviation of the range measurements.
+            max_range (float): The maximum range of the sensor in meters.
+            miss_probability (float): The likelihood of observing a landmark out of the range of a particle.
+    """
+    index: LandmarkIndex
+    sense_noise: float
+    max_range: float
+    miss_probability: float
+
+    def __init__(self, index: LandmarkIndex, sense_noise: float = 2.0, max_range: float = 20.0, miss_probability: float = 1e-3):
+        """
+            Constructor initializes the sensor parameters.
+            Parameters:
+                index (LandmarkIndex): The spatial index of the landmarks.
+                sense_noise (float): The standard deviation of the range measurements. Defaults to 2.0.
+                max_range (float): The maximum range of the sensor in meters. Defaults to 20.0.
+                miss_probability (float): The likelihood of an observation out of the range of a particle. Defaults to 1e-3.
+        """
+        self.index = index
+        self.sense_noise = sense_noise
+        self.max_range = max_range
+        self.miss_probability = miss_probability
+
+
+    def measure(self, pose: Pose3D, rng: np.random.Generator) -> list[tuple[int, float]]:
+        """
+            Method simulates the observation of the landmarks within range of the given pose.
+            Parameters:
+                pose (Pose3D): The pose of the robot.
+                rng (np.random.Generator): The random generator of the noise.
+            Returns:
+                list[tuple[int, float]]: The index and the noisy distance of every landmark in range.
+        """
+        visible = self.index.query_radius(pose.x, pose.y, self.max_range)
+        distances = np.hypot(self.index.landmarks[visible, 0] - pose.x, self.index.landmarks[visible, 1] - pose.y)
+        distances += rng.normal(0.0, self.sense_noise, visible.shape[0])
+        return list(zip(visible.tolist(), distances.tolist()))
+
+
+    def log_likelihood(self, poses: np.ndarray, measurements: list[tuple[int, float]]) -> np.ndarray:
+        """
+            Method computes the log-likelihood of the observed landmarks for every pose.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+                measurements (list[tuple[int, float]]): The index and distance of every observed landmark.
+            Returns:
+                np.ndarray: The N array of log-likelihoods.
+        """
+        if len(measurements) == 0:
+            return np.zeros(poses.shape[0])
+
+        ids = np.fromiter((m[0] for m in measurements), dtype=np.intp, count=len(measurements))
+        z = np.fromiter((m[1] for m in measurements), dtype=np.float64, count=len(measurements))
+        landmarks = self.index.landmarks[ids]
+
+        distances = np.hypot(poses[:, 0, np.newaxis] - landmarks[np.newaxis, :, 0], poses[:, 1, np.newaxis] - landmarks[np.newaxis, :, 1])
+        log_hit = -0.5 * np.square((distances - z[np.newaxis, :]) / self.sense_noise) - math.log(self.sense_noise * math.sqrt(2 * math.pi))
+        return np.sum(np.where(distances <= self.max_range, log_hit, math.log(self.miss_probability)), axis=1)
@@ -17,7 +17,6 @@ from math import sin
 import math
 from random import gauss
 from random import uniform
-from scipy.stats import norm
 import numpy as np
 
 from geometry.point import Point2D
@@ -58,24 +57,32 @@ class Robot:
             pose (Pose3D): The pose of the particle (x, y, theta).
             weight (float): The weight of the particle.
             robot_width (float): The width of the robot.
+            rng (np.random.Generator|None): The random generator of the motion and sensing noise, the random module if None.
+            world_size (tuple[float, float]): The size of the world the robot wraps around in.
     """
     pose: Pose3D
     weight: float
+    world_size: tuple[float, float]
     robot_width = 2
 
-    def __init__(self, pose: Pose3D|None = None, weight: float = 0.0, noise: tuple[float, float, float] = (0.2, 0.05, 2.0)):
+    def __init__(self, pose: Pose3D|None = None, weight: float = 0.0, noise: tuple[float, float, float] = (0.2, 0.05, 2.0),
+                 rng: np.random.Generator|None = None, world_size: tuple[float, float] = WORLD_SIZE):
         """ 
             Constructor initializes the robot's pose, weight, and noise parameters.
             Parameters:
                 pose (Pose3D|None): The pose of the robot (x, y, theta). Defaults to None.
                 weight (float): The weight of the robot. Defaults to 0.0.
                 noise (tuple[float, float, float]): A tuple containing the forward noise, turn noise, and sense noise. Defaults to (0.2, 0.05, 2.0).
+                rng (np.random.Generator|None): The random generator of the noise, the random module if None. Defaults to None.
+                world_size (tuple[float, float]): The size of the world, the engine sets the size of its map. Defaults to WORLD_SIZE.
         """
         if pose is None:
             pose = Pose3D()
         self.pose = copy.copy(pose)
         self.weight = weight
         self.noise = Noise(noise)
+        self.rng = rng
+        self.world_size = (world_size[0], world_size[1])
 
 
     def set_pose(self, pose: Pose3D):
@@ -87,6 +94,19 @@ class Robot:
         self.pose = pose
 
 
+    def gauss(self, sigma: float) -> float:
+        """
+            Method draws a zero-mean Gaussian noise from the generator of the robot.
+            Parameters:
+                sigma (float): The standard deviation.
+            Returns:
+                float: The noise.
+        """
+        if self.rng is not None:
+            return float(self.rng.normal(0.0, sigma))
+        return gauss(0.0, sigma)
+
+
     def move(self, forward: float , turn: float):
         """
         Method moves the robot based on the given forward and turn values, incorporating noise.
@@ -99,17 +119,17 @@ class Robot:
         if forward < 0:
             raise Exception("can't move backwards")
 
-        self.pose.theta = self.pose.theta + turn + gauss(0.0, self.noise.turn_noise)
+        self.pose.theta = self.pose.theta + turn + self.gauss(self.noise.turn_noise)
         self.pose.theta = self.pose.theta % (2 * math.pi)
 
         dist = 0.0
         if (forward > 0):
-            dist = forward + gauss(0.0, self.noise.forward_noise)
+            dist = forward + self.gauss(self.noise.forward_noise)
         self.pose.x = self.pose.x + (cos(self.pose.theta) * dist)
         self.pose.y = self.pose.y + (sin(self.pose.theta) * dist)
 
-        self.pose.x = self.pose.x % WORLD_SIZE[0]
-        self.pose.y = self.pose.y % WORLD_SIZE[1]
+        self.pose.x = self.pose.x % self.world_size[0]
+        self.pose.y = self.pose.y % self.world_size[1]
 
 
     def get_measurements(self, landmarks: list[Point2D]) -> list[float]:
@@ -121,6 +141,9 @@ class Robot:
                 list[float]: A list of distances from the robot to each landmark.
         """
         pos = Point2D(self.pose.x, self.pose.y)
+        if self.rng is not None:
+            noise = self.rng.normal(0.0, self.noise.sense_noise, len(landmarks)).tolist()
+            return [Point2D.distance(pos, l) + e for l, e in zip(landmarks, noise)]
         return [Point2D.distance(pos, l) + gauss(0.0, self.noise.sense_noise) for l in landmarks]
 
 
@@ -136,7 +159,9 @@ class Robot:
         pos = np.array([self.pose.x, self.pose.y])
         distances = np.linalg.norm(LANDMARKS_NP - pos, axis=1)
 
-        probs = norm.pdf(measurements, loc=distances, scale=self.noise.sense_noise)
+        # Gaussian pdf of the measurement errors, computed directly instead of through scipy.stats
+        errors = (np.asarray(measurements, dtype=np.float64) - distances) / self.noise.sense_noise
+        probs = np.exp(-0.5 * np.square(errors)) / (self.noise.sense_noise * math.sqrt(2 * math.pi))
         w = np.prod(probs) 
 
         return w # type: ignore
@@ -0,0 +1,109 @@
+"""
+    Project: ROBa project
+    File: odometry.py
+    Description: This file contains the odometry accumulator composing the motions of the robot between two filter updates.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+
+
+class OdometryAccumulator:
+    """
+        Class to compose consecutive (forward, turn) motions into a single motion of the particles.
+        The increments are integrated as a relative pose (dx, dy, dtheta) in the frame of the first one,
+        which is converted back to a turn, a forward movement and a final turn when flushed.
+        The filter runs once the robot moved or turned far enough instead of at every increment.
+        Attributes:
+            distance_threshold (float): The travelled distance in meters that makes the motion ready.
+            angle_threshold (float): The absolute turn in rad that makes the motion ready.
+            dx (float): The accumulated translation along the initial heading in meters.
+            dy (float): The accumulated translation across the initial heading in meters.
+            dtheta (float): The accumulated turn in rad.
+            distance (float): The accumulated travelled distance in meters.
+            steps (int): The number of accumulated increments.
+            forward_steps (int): The number of accumulated increments with a forward movement.
+    """
+    distance_threshold: float
+    angle_threshold: float
+    dx: float
+    dy: float
+    dtheta: float
+    distance: float
+    steps: int
+    forward_steps: int
+
+    def __init__(self, distance_threshold: float = 0.5, angle_threshold: float = math.radians(10)):
+        """
+            Constructor of the class
+            Parameters:
+                distance_threshold (float): The travelled distance that makes the motion ready. Defaults to 0.5 m.
+                angle_threshold (float): The absolute turn that makes the motion ready. Defaults to 10°.
+        """
+        self.distance_threshold = distance_threshold
+        self.angle_threshold = angle_threshold
+        self.reset()
+
+
+    def reset(self):
+        """
+            Method discards the accumulated motion.
+        """
+        self.dx = 0.0
+        self.dy = 0.0
+        self.dtheta = 0.0
+        self.distance = 0.0
+        self.steps = 0
+        self.forward_steps = 0
+
+
+    def add(self, forward: float, turn: float):
+        """
+            Method composes a motion increment with the accumulated motion, the turn is applied first like in Robot.move.
+            Parameters:
+                forward (float): The forward movement.
+                turn (float): The turn movement.
+            Raises:
+                Exception: If the forward movement is negative.
+        """
+        if forward < 0:
+            raise Exception("can't move backwards")
+
+        self.dtheta += turn
+        self.dx += math.cos(self.dtheta) * forward
+        self.dy += math.sin(self.dtheta) * forward
+        self.distance += forward
+        self.steps += 1
+        if forward > 0:
+            self.forward_steps += 1
+
+
+    def ready(self) -> bool:
+        """
+            Method tells whether the accumulated motion passed one of the thresholds.
+        """
+        return self.distance >= self.distance_threshold or abs(self.dtheta) >= self.angle_threshold
+
+
+    def flush(self) -> tuple[float, float, float, int, int]|None:
+        """
+            Method returns the accumulated motion and resets the accumulator.
+            Returns:
+                tuple[float, float, float, int, int]|None: The forward movement, the turn before it, the turn after it
+                    and the number of increments and forward increments, as taken by ParticleSet.move,
+                    or None if nothing was accumulated.
+        """
+        if self.steps == 0:
+            return None
+
+        forward = math.hypot(self.dx, self.dy)
+        turn = math.atan2(self.dy, self.dx) if forward > 0 else self.dtheta
+        final_turn = (self.dtheta - turn + math.pi) % (2 * math.pi) - math.pi
+        motion = (forward, turn, final_turn, self.steps, self.forward_steps)
+        self.reset()
+        return motion
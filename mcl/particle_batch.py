@@ -0,0 +1,193 @@
+"""
+    Project: ROBa project
+    File: particle_batch.py
+    Description: This file contains the ParticleBatch class which stores the particle sets of a fleet of robots as one R×N×3 tensor.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+
+import numpy as np
+
+from mcl.monte_carlo import Noise
+from mcl.resampling import batch_resample_indices
+from mcl.sensor_model import LandmarkSensorModel, normalize_batch_log_weights
+
+from .global_vars import LANDMARKS_NP, WORLD_SIZE
+
+
+class ParticleBatch:
+    """
+        Class to handle R independent particle sets of N particles, one per robot of a fleet.
+        The sets are rows of one tensor, so every operation is a single vectorized pass over all robots
+        instead of R ParticleSet instances updated one after the other.
+        Attributes:
+            poses (np.ndarray): The R×N×3 array of particle poses (x, y, theta).
+            weights (np.ndarray): The R×N array of particle weights, every row summing up to one.
+            noise (Noise): The noise parameters shared by all particles.
+            sensor_model (LandmarkSensorModel): The sensor model used to weight the particles of all robots.
+            world_size (tuple[float, float]): The size of the world the particles live in.
+            rng (np.random.Generator): The random generator of every draw of the batch.
+            log_mean_likelihood (np.ndarray): The R array of the logs of the weighted mean likelihoods
+                of the last measurements, the evidence used by the augmented MCL recovery.
+    """
+    poses: np.ndarray
+    weights: np.ndarray
+    noise: Noise
+    sensor_model: LandmarkSensorModel
+    world_size: tuple[float, float]
+    rng: np.random.Generator
+    log_mean_likelihood: np.ndarray
+
+    def __init__(self, number_of_robots: int, number_of_particles: int, rng: np.random.Generator,
+                 noise: tuple[float, float, float] = (0.2, 0.05, 2.0), world_size: tuple[float, float] = WORLD_SIZE,
+                 landmarks: np.ndarray = LANDMARKS_NP, grid_map=None):
+        """
+            Constructor creates the particle sets with uniformly distributed poses and equal weights.
+            Parameters:
+                number_of_robots (int): The number of robots R.
+                number_of_particles (int): The number of particles N of every robot.
+                rng (np.random.Generator): The random generator of every draw of the batch.
+                noise (tuple[float, float, float]): A tuple containing the forward noise, turn noise, and sense noise. Defaults to (0.2, 0.05, 2.0).
+                world_size (tuple[float, float]): The size of the world. Defaults to WORLD_SIZE.
+                landmarks (np.ndarray): The L×2 array of landmark coordinates. Defaults to LANDMARKS_NP.
+                grid_map (environment.grid_map.GridMap|None): If given, the poses are drawn in its free cells
+                    instead of the whole world. Defaults to None.
+        """
+        self.rng = rng
+        self._noise = np.empty((number_of_robots, number_of_particles), dtype=np.float64)  # reused by every motion update
+        self.log_mean_likelihood = np.zeros(number_of_robots)
+        self.world_size = (world_size[0], world_size[1])
+        self.noise = Noise(noise)
+        self.sensor_model = LandmarkSensorModel(landmarks, self.noise.sense_noise)
+        self.poses = np.empty((number_of_robots, number_of_particles, 3), dtype=np.float64)
+        self.weights = np.full((number_of_robots, number_of_particles), 1.0 / number_of_particles, dtype=np.float64)
+        self.randomize(grid_map=grid_map)
+
+
+    def __len__(self) -> int:
+        """
+            Method returns the number of particles of every robot.
+        """
+        return self.poses.shape[1]
+
+
+    def randomize(self, mask: np.ndarray|None = None, grid_map=None):
+        """
+            Method draws new random positions and orientations for the selected particles.
+            The new particles get the mean weight of their robot, the weights of every robot are renormalized.
+            Parameters:
+                mask (np.ndarray|None): The R×N boolean array of the particles to randomize, all of them if None. Defaults to None.
+                grid_map (environment.grid_map.GridMap|None): If given, the positions are drawn from its free cells
+                    instead of the whole world. Defaults to None.
+        """
+        n = self.poses.shape[0] * self.poses.shape[1] if mask is None else int(np.count_nonzero(mask))
+        if grid_map is not None:
+            poses = grid_map.sample_free_poses(n, self.rng)
+        else:
+            poses = self.rng.random((n, 3))
+            poses *= (self.world_size[0], self.world_size[1], 2 * math.pi)
+
+        if mask is None:
+            self.poses[:] = poses.reshape(self.poses.shape)
+            self.weights.fill(1.0 / len(self))
+        else:
+            self.poses[mask] = poses
+            np.copyto(self.weights, self.weights.mean(axis=1, keepdims=True), where=mask)
+            self.weights /= self.weights.sum(axis=1, keepdims=True)
+
+
+    def move(self, forward: np.ndarray, turn: np.ndarray, final_turn: np.ndarray|float = 0.0,
+             steps: np.ndarray|int = 1, forward_steps: np.ndarray|int = 1):
+        """
+            Method moves the particles of every robot by its own odometry, incorporating noise, see ParticleSet.move.
+            Every argument is either an R array, one value per robot, or a scalar shared by all robots.
+            Parameters:
+                forward (np.ndarray): The forward movement distances.
+                turn (np.ndarray): The turn angles before the forward movement.
+                final_turn (np.ndarray|float): The turn angles after the forward movement. Defaults to 0.0.
+                steps (np.ndarray|int): The numbers of composed increments. Defaults to 1.
+                forward_steps (np.ndarray|int): The numbers of composed increments with a forward movement. Defaults to 1.
+            Raises:
+                Exception: If a forward movement is negative.
+        """
+        def column(values) -> np.ndarray:
+            return np.asarray(values, dtype=np.float64).reshape(-1, 1)
+
+        forward = column(forward)
+        if np.any(forward < 0):
+            raise Exception("can't move backwards")
+
+        theta = self.poses[:, :, 2]
+        noise = self.standard_normal()
+        noise *= self.noise.turn_noise * np.sqrt(column(steps))
+        noise += column(turn)
+        theta += noise
+
+        if np.any(forward > 0):
+            dist = self.standard_normal()
+            dist *= self.noise.forward_noise * np.sqrt(column(forward_steps))
+            dist += forward
+            dist *= forward > 0  # the robots that did not move forward keep their positions
+            self.poses[:, :, 0] += np.cos(theta) * dist
+            self.poses[:, :, 1] += np.sin(theta) * dist
+
+        theta += column(final_turn)
+        np.mod(theta, 2 * math.pi, out=theta)
+        np.mod(self.poses[:, :, 0], self.world_size[0], out=self.poses[:, :, 0])
+        np.mod(self.poses[:, :, 1], self.world_size[1], out=self.poses[:, :, 1])
+
+
+    def standard_normal(self) -> np.ndarray:
+        """
+            Method draws R×N standard normal noise into the preallocated noise buffer.
+            The returned array is overwritten by the next call.
+        """
+        self.rng.standard_normal(out=self._noise)
+        return self._noise
+
+
+    def measurement_prob(self, measurements: np.ndarray) -> np.ndarray:
+        """
+            Method calculates the probability of the measurements of every robot for its particles and folds it
+            into the particle weights, so the evidence accumulates until the next resampling.
+            Parameters:
+                measurements (np.ndarray): The R×L array of observed distances to the landmarks, one row per robot.
+            Returns:
+                np.ndarray: The R×N array of normalized weights.
+        """
+        with np.errstate(divide='ignore'):
+            log_weights = np.log(self.weights)
+        log_weights += self.sensor_model.batch_log_likelihood(self.poses, measurements)
+
+        # the weights are normalized, so the log-sum-exp of every row is the log of the weighted mean likelihood
+        self.weights, self.log_mean_likelihood = normalize_batch_log_weights(log_weights)
+        return self.weights
+
+
+    def effective_sample_size(self) -> np.ndarray:
+        """
+            Method returns the effective sample sizes of the current weights.
+            Returns:
+                np.ndarray: The R array of effective sample sizes.
+        """
+        return 1.0 / np.einsum("rn,rn->r", self.weights, self.weights)
+
+
+    def resample(self, robots: np.ndarray, method: str = "systematic"):
+        """
+            Method resamples the particle sets of the selected robots in one pass and resets their weights.
+            Parameters:
+                robots (np.ndarray): The indices of the robots to resample.
+                method (str): The resampling scheme, see mcl.resampling.BATCH_RESAMPLERS. Defaults to "systematic".
+        """
+        if robots.shape[0] == 0:
+            return
+        sampled_rows = batch_resample_indices(self.weights[robots], self.rng, method)
+        self.poses[robots] = self.poses[robots].reshape(-1, 3)[sampled_rows]
+        self.weights[robots] = 1.0 / len(self)
@@ -0,0 +1,297 @@
+"""
+    Project: ROBa project
+    File: particle_set.py
+    Description: This file contains the ParticleSet class which stores the particles of the Monte Carlo localization as contiguous arrays.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+
+import numpy as np
+
+from mcl.kld_sampling import KLDSampler
+from mcl.monte_carlo import Noise
+from mcl.pose import Pose3D
+from mcl.resampling import SystematicResampler, effective_sample_size, resample_indices
+from mcl.sensor_model import LandmarkSensorModel, normalize_log_weights
+
+from .global_vars import LANDMARKS_NP, WORLD_SIZE
+
+PARTICLE_CHUNK = 1 << 16  # particles processed at once by the weighting and the resampling gather, bounds their temporaries
+
+
+def bytes_per_particle(dtype=np.float64) -> int:
+    """
+        Function estimates the peak memory used per particle by a filter update.
+        It counts the poses and their resampling copy, the weights and the motion noise in the storage type,
+        the float64 log-weights and normalized weights, the resampling buffers and the motion temporaries.
+        The sensor model temporaries are bounded by PARTICLE_CHUNK and not counted per particle.
+        Parameters:
+            dtype: The storage type of the poses and weights, np.float64 or np.float32. Defaults to np.float64.
+        Returns:
+            int: The number of bytes.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    storage = (3 + 3 + 1 + 1 + 2) * itemsize  # poses, spare poses, weights, noise, cos/sin temporaries of a motion
+    update = 8 + 8  # log-weights and normalized weights, always in float64
+    resampling = 8 + np.dtype(np.intp).itemsize + 4 + 1  # cumulative weights, edges, uint32 indices, flags
+    return storage + update + resampling
+
+
+def particles_for_budget(memory_budget: float, dtype=np.float64, number_of_landmarks: int = len(LANDMARKS_NP)) -> int:
+    """
+        Function derives the largest number of particles whose filter update fits in a memory budget.
+        Parameters:
+            memory_budget (float): The memory budget in bytes.
+            dtype: The storage type of the poses and weights. Defaults to np.float64.
+            number_of_landmarks (int): The number of landmarks, sizing the sensor model temporaries. Defaults to the default landmarks.
+        Returns:
+            int: The number of particles.
+        Raises:
+            ValueError: If the budget does not even hold the fixed temporaries of one update.
+    """
+    fixed = PARTICLE_CHUNK * max(number_of_landmarks, 1) * 3 * 8  # the N×L differences and distances of one chunk
+    if memory_budget <= fixed:
+        raise ValueError(f"a memory budget of {memory_budget:.0f} bytes does not hold the {fixed} bytes of the sensor model temporaries")
+    return int((memory_budget - fixed) // bytes_per_particle(dtype))
+
+
+class ParticleSet:
+    """
+        Class to handle the particles of the Monte Carlo localization algorithm.
+        Instead of one Robot object per particle, the poses and weights of all particles are stored
+        in contiguous NumPy arrays and every operation is applied to the whole set at once.
+        Attributes:
+            poses (np.ndarray): The N×3 array of particle poses (x, y, theta).
+            weights (np.ndarray): The N array of particle weights.
+            noise (Noise): The noise parameters shared by all particles.
+            sensor_model (LandmarkSensorModel): The sensor model used to weight the particles.
+            world_size (tuple[float, float]): The size of the world the particles live in.
+            rng (np.random.Generator): The random generator of every draw of the particle set.
+            log_mean_likelihood (float): The log of the weighted mean likelihood of the last measurements,
+                the evidence used by the augmented MCL recovery.
+            dtype (np.dtype): The storage type of the poses and weights, float32 in the compact mode.
+    """
+    poses: np.ndarray
+    weights: np.ndarray
+    noise: Noise
+    sensor_model: LandmarkSensorModel
+    world_size: tuple[float, float]
+    rng: np.random.Generator
+    log_mean_likelihood: float
+    dtype: np.dtype
+
+    def __init__(self, number_of_particles: int, rng: np.random.Generator, noise: tuple[float, float, float] = (0.2, 0.05, 2.0),
+                 world_size: tuple[float, float] = WORLD_SIZE, landmarks: np.ndarray = LANDMARKS_NP,
+                 dtype=np.float64, randomize: bool = True, grid_map=None):
+        """
+            Constructor creates the particle set with uniformly distributed poses and equal weights.
+            Parameters:
+                number_of_particles (int): The number of particles.
+                rng (np.random.Generator): The random generator of every draw of the particle set.
+                noise (tuple[float, float, float]): A tuple containing the forward noise, turn noise, and sense noise. Defaults to (0.2, 0.05, 2.0).
+                world_size (tuple[float, float]): The size of the world. Defaults to WORLD_SIZE.
+                landmarks (np.ndarray): The L×2 array of landmark coordinates. Defaults to LANDMARKS_NP.
+                dtype: The storage type of the poses and weights, np.float32 halves the memory of large sets. Defaults to np.float64.
+                randomize (bool): Draw the poses, False leaves them uninitialized for a set filled right after. Defaults to True.
+                grid_map (environment.grid_map.GridMap|None): If given, the poses are drawn in its free cells
+                    instead of the whole world. Defaults to None.
+        """
+        self.rng = rng
+        self.dtype = np.dtype(dtype)
+        self._noise = np.empty(number_of_particles, dtype=self.dtype)  # reused by every motion update
+        self._spare_poses = np.empty((number_of_particles, 3), dtype=self.dtype)  # the target of the resampling
+        self._resampler: SystematicResampler|None = None
+        self.log_mean_likelihood = 0.0
+        self.world_size = (world_size[0], world_size[1])
+        self.noise = Noise(noise)
+        self.sensor_model = LandmarkSensorModel(landmarks, self.noise.sense_noise)
+        self.poses = np.empty((number_of_particles, 3), dtype=self.dtype)
+        self.weights = np.full(number_of_particles, 1.0 / number_of_particles, dtype=self.dtype)
+        if randomize:
+            self.randomize(number_of_particles, grid_map)
+
+
+    def __len__(self) -> int:
+        return self.poses.shape[0]
+
+
+    def get_pose(self, index: int) -> Pose3D:
+        """
+            Method returns the pose of a single particle.
+            Parameters:
+                index (int): The index of the particle.
+            Returns:
+                Pose3D: A copy of the pose of the particle.
+        """
+        x, y, theta = self.poses[index]
+        return Pose3D(float(x), float(y), float(theta))
+
+
+    def random_poses(self, n: int) -> np.ndarray:
+        """
+            Method draws poses uniformly distributed over the world.
+            Parameters:
+                n (int): The number of poses to draw.
+            Returns:
+                np.ndarray: The n×3 array of random poses.
+        """
+        poses = self.rng.random((n, 3))
+        poses[:, 0] *= self.world_size[0]
+        poses[:, 1] *= self.world_size[1]
+        poses[:, 2] *= 2 * math.pi
+        return poses
+
+
+    def randomize(self, n: int, grid_map=None):
+        """
+            Method randomizes the positions and orientations of n randomly chosen particles.
+            The new particles get the mean weight, so they neither keep the weights of the replaced ones nor dominate the set.
+            Parameters:
+                n (int): The number of particles to randomize.
+                grid_map (environment.grid_map.GridMap|None): If given, the positions are drawn from its free cells
+                    instead of the whole world. Defaults to None.
+        """
+        n = min(n, len(self))
+        poses = self.random_poses(n) if grid_map is None else grid_map.sample_free_poses(n, self.rng)
+        if n == len(self):
+            self.poses[:] = poses
+            self.weights.fill(1.0 / n)
+        else:
+            indices = self.rng.choice(len(self), size=n, replace=False)
+            self.poses[indices] = poses
+            self.weights[indices] = self.weights.mean()
+            self.weights /= self.weights.sum()
+
+
+    def move(self, forward: float, turn: float, final_turn: float = 0.0, steps: int = 1, forward_steps: int = 1):
+        """
+            Method moves all the particles based on the given forward and turn values, incorporating noise.
+            A motion composed of several increments (see mcl.odometry.OdometryAccumulator) is applied in one pass,
+            with the noise of its increments: the standard deviations grow with the square root of their number.
+            Parameters:
+                forward (float): The forward movement distance.
+                turn (float): The turn angle before the forward movement.
+                final_turn (float): The turn angle after the forward movement. Defaults to 0.0.
+                steps (int): The number of composed increments. Defaults to 1.
+                forward_steps (int): The number of composed increments with a forward movement. Defaults to 1.
+            Raises:
+                Exception: If the forward movement is negative.
+        """
+        if forward < 0:
+            raise Exception("can't move backwards")
+
+        n = len(self)
+        theta = self.poses[:, 2]
+        noise = self.standard_normal(n)
+        noise *= self.noise.turn_noise * math.sqrt(steps)
+        noise += turn
+        theta += noise
+
+        if forward > 0:
+            dist = self.standard_normal(n)
+            dist *= self.noise.forward_noise * math.sqrt(forward_steps)
+            dist += forward
+            self.poses[:, 0] += np.cos(theta) * dist
+            self.poses[:, 1] += np.sin(theta) * dist
+
+        if final_turn != 0.0:
+            theta += final_turn
+        np.mod(theta, 2 * math.pi, out=theta)
+        np.mod(self.poses[:, 0], self.world_size[0], out=self.poses[:, 0])
+        np.mod(self.poses[:, 1], self.world_size[1], out=self.poses[:, 1])
+
+
+    def standard_normal(self, n: int) -> np.ndarray:
+        """
+            Method draws standard normal noise into the preallocated noise buffer, grown if needed.
+            The returned view is overwritten by the next call.
+            Parameters:
+                n (int): The number of draws.
+            Returns:
+                np.ndarray: The n array of draws.
+        """
+        if self._noise.shape[0] < n:
+            self._noise = np.empty(n, dtype=self.dtype)
+        noise = self._noise[:n]
+        self.rng.standard_normal(dtype=self.dtype, out=noise)
+        return noise
+
+
+    def measurement_prob(self, measurements: list[float]) -> np.ndarray:
+        """
+            Method calculates the probability of the given measurements for every particle and folds it
+            into the particle weights, so the evidence accumulates until the next resampling.
+            The sensor model runs on chunks of PARTICLE_CHUNK particles to bound its temporaries.
+            Parameters:
+                measurements (list[float]): A list of observed measurements.
+            Returns:
+                np.ndarray: The normalized weights of the particles.
+        """
+        with np.errstate(divide='ignore'):
+            log_weights = np.log(self.weights, dtype=np.float64)
+        for start in range(0, len(self), PARTICLE_CHUNK):
+            stop = start + PARTICLE_CHUNK
+            log_weights[start:stop] += self.sensor_model.log_likelihood(self.poses[start:stop], measurements)
+
+        # the weights are normalized, so their log-sum-exp is the log of the weighted mean likelihood
+        weights, self.log_mean_likelihood = normalize_log_weights(log_weights, return_log_sum=True)
+        self.weights = weights.astype(self.dtype, copy=False)
+        return self.weights
+
+
+    def effective_sample_size(self) -> float:
+        """
+            Method returns the effective sample size of the current weights.
+            Returns:
+                float: The effective sample size.
+        """
+        return effective_sample_size(self.weights)
+
+
+    def resample(self, weights: np.ndarray, method: str = "systematic", kld_sampler: KLDSampler|None = None):
+        """
+            Method resamples the particles based on their weights to focus on the more likely particles.
+            A fixed-size resampling gathers the particles into a spare pose buffer swapped with the poses,
+            and the systematic scheme selects them in preallocated buffers, so no array is allocated.
+            Parameters:
+                weights (np.ndarray): The weights of the particles.
+                method (str): The resampling scheme, see mcl.resampling.RESAMPLERS. Defaults to "systematic".
+                kld_sampler (KLDSampler|None): If given, the size of the resampled set is chosen by KLD-sampling. Defaults to None.
+        """
+        if kld_sampler is not None:
+            self.select(kld_sampler.sample_indices(self.poses, weights, self.rng, method))
+            return
+
+        n = len(self)
+        if method == "systematic":
+            if self._resampler is None or self._resampler.n != n:
+                self._resampler = SystematicResampler(n)
+            sampled_rows = self._resampler.resample(weights, self.rng)
+        else:
+            sampled_rows = resample_indices(weights, method, rng=self.rng)
+        if self._spare_poses.shape[0] != n:
+            self._spare_poses = np.empty((n, 3), dtype=self.dtype)
+        for start in range(0, n, PARTICLE_CHUNK):
+            # by chunks, the uint32 indices are converted to intp a chunk at a time ("raise" would also buffer the output)
+            stop = start + PARTICLE_CHUNK
+            np.take(self.poses, sampled_rows[start:stop], axis=0, out=self._spare_poses[start:stop], mode="clip")
+        self.poses, self._spare_poses = self._spare_poses, self.poses
+        self.weights.fill(1.0 / n)
+
+
+    def select(self, indices: np.ndarray):
+        """
+            Method replaces the particle set by the particles at the given indices and resets the weights.
+            The size of the set becomes the number of indices.
+            Parameters:
+                indices (np.ndarray): The indices of the particles to keep, repetitions allowed.
+        """
+        n = indices.shape[0]
+        self.poses = self.poses[indices]
+        self.weights = np.full(n, 1.0 / n, dtype=self.dtype)
@@ -0,0 +1,181 @@
+"""
+    Project: ROBa project
+    File: pose_estimation.py
+    Description: This file contains the vectorized estimators of the robot pose from the weighted particle set.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+
+import numpy as np
+
+ESTIMATORS = ("mean", "cluster", "max")
+
+
+def weighted_mean(poses: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+        Function computes the weighted mean pose of the particles.
+        The orientation is averaged as a circular mean, so headings around 0 and 2π do not cancel out.
+        Parameters:
+            poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            weights (np.ndarray): The N array of weights, not necessarily normalized.
+        Returns:
+            np.ndarray: The mean pose (x, y, theta) with theta in [0, 2π).
+    """
+    total = float(np.sum(weights))
+    x = float(np.dot(weights, poses[:, 0])) / total
+    y = float(np.dot(weights, poses[:, 1])) / total
+    theta = math.atan2(float(np.dot(weights, np.sin(poses[:, 2]))), float(np.dot(weights, np.cos(poses[:, 2]))))
+    return np.array([x, y, theta % (2 * math.pi)])
+
+
+def weighted_covariance(poses: np.ndarray, weights: np.ndarray, mean: np.ndarray|None = None) -> np.ndarray:
+    """
+        Function computes the weighted covariance of the particle poses.
+        The orientation residuals are wrapped to [-π, π) around the circular mean.
+        Parameters:
+            poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            weights (np.ndarray): The N array of weights, not necessarily normalized.
+            mean (np.ndarray|None): The mean pose, computed with weighted_mean if None. Defaults to None.
+        Returns:
+            np.ndarray: The 3×3 covariance matrix of (x, y, theta).
+    """
+    if mean is None:
+        mean = weighted_mean(poses, weights)
+
+    residuals = poses - mean
+    residuals[:, 2] = (residuals[:, 2] + math.pi) % (2 * math.pi) - math.pi
+    return (residuals * weights[:, np.newaxis]).T @ residuals / float(np.sum(weights))
+
+
+def cluster_mean(poses: np.ndarray, weights: np.ndarray, world_size: tuple[float, float], cell_size: float = 2.0) -> np.ndarray:
+    """
+        Function estimates the pose from the most probable cluster of particles.
+        The weights are binned on a grid of cell_size, the 3×3 window of cells with the largest total weight
+        is taken as the best cluster and the weighted mean of its particles is returned.
+        Unlike the mean of the whole set, the estimate stays on one mode when the particles are multimodal.
+        Parameters:
+            poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            weights (np.ndarray): The N array of weights, not necessarily normalized.
+            world_size (tuple[float, float]): The size of the world the particles live in.
+            cell_size (float): The size of the grid cells in meters. Defaults to 2.0.
+        Returns:
+            np.ndarray: The mean pose (x, y, theta) of the best cluster.
+    """
+    nx = max(1, math.ceil(world_size[0] / cell_size))
+    nz = max(1, math.ceil(world_size[1] / cell_size))
+    ix = np.clip((poses[:, 0] / cell_size).astype(np.intp), 0, nx - 1)
+    iz = np.clip((poses[:, 1] / cell_size).astype(np.intp), 0, nz - 1)
+
+    mass = np.bincount(iz * nx + ix, weights=weights, minlength=nx * nz).reshape(nz, nx)
+    padded = np.pad(mass, 1)
+    window = sum(padded[dz:dz + nz, dx:dx + nx] for dz in range(3) for dx in range(3))
+    best_z, best_x = np.unravel_index(int(np.argmax(window)), window.shape)
+
+    in_cluster = (np.abs(ix - best_x) <= 1) & (np.abs(iz - best_z) <= 1)
+    if not np.any(weights[in_cluster] > 0):
+        return weighted_mean(poses, weights)
+    return weighted_mean(poses[in_cluster], weights[in_cluster])
+
+
+def estimate_pose(poses: np.ndarray, weights: np.ndarray, method: str = "cluster",
+                  world_size: tuple[float, float] = (0.0, 0.0), cell_size: float = 2.0) -> np.ndarray:
+    """
+        Function estimates the pose of the robot from the particles.
+        Parameters:
+            poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            weights (np.ndarray): The N array of weights.
+            method (str): "mean" for the weighted mean, "cluster" for the mean of the best cluster,
+                "max" for the particle with the largest weight. Defaults to "cluster".
+            world_size (tuple[float, float]): The size of the world, used by the "cluster" method.
+            cell_size (float): The size of the cluster grid cells in meters. Defaults to 2.0.
+        Returns:
+            np.ndarray: The estimated pose (x, y, theta).
+        Raises:
+            ValueError: If the method is unknown.
+    """
+    if method == "mean":
+        return weighted_mean(poses, weights)
+    if method == "cluster":
+        return cluster_mean(poses, weights, world_size, cell_size)
+    if method == "max":
+        return poses[int(np.argmax(weights))].copy()
+    raise ValueError(f"unknown pose estimator '{method}', expected one of {ESTIMATORS}")
+
+
+def batch_weighted_mean(poses: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+        Function computes the weighted mean pose of R particle sets at once, see weighted_mean.
+        Parameters:
+            poses (np.ndarray): The R×N×3 array of poses, one row per set.
+            weights (np.ndarray): The R×N array of weights, not necessarily normalized.
+        Returns:
+            np.ndarray: The R×3 array of mean poses with theta in [0, 2π).
+    """
+    total = np.sum(weights, axis=1)
+    means = np.empty((poses.shape[0], 3))
+    means[:, 0] = np.einsum("rn,rn->r", weights, poses[:, :, 0]) / total
+    means[:, 1] = np.einsum("rn,rn->r", weights, poses[:, :, 1]) / total
+    means[:, 2] = np.arctan2(np.einsum("rn,rn->r", weights, np.sin(poses[:, :, 2])),
+                             np.einsum("rn,rn->r", weights, np.cos(poses[:, :, 2]))) % (2 * math.pi)
+    return means
+
+
+def batch_cluster_mean(poses: np.ndarray, weights: np.ndarray, world_size: tuple[float, float], cell_size: float = 2.0) -> np.ndarray:
+    """
+        Function estimates the poses of R particle sets from their most probable clusters, see cluster_mean.
+        The grids of all sets are stacked into one bincount.
+        Parameters:
+            poses (np.ndarray): The R×N×3 array of poses, one row per set.
+            weights (np.ndarray): The R×N array of weights, not necessarily normalized.
+            world_size (tuple[float, float]): The size of the world the particles live in.
+            cell_size (float): The size of the grid cells in meters. Defaults to 2.0.
+        Returns:
+            np.ndarray: The R×3 array of the mean poses of the best clusters.
+    """
+    r = poses.shape[0]
+    nx = max(1, math.ceil(world_size[0] / cell_size))
+    nz = max(1, math.ceil(world_size[1] / cell_size))
+    ix = np.clip((poses[:, :, 0] / cell_size).astype(np.intp), 0, nx - 1)
+    iz = np.clip((poses[:, :, 1] / cell_size).astype(np.intp), 0, nz - 1)
+
+    cells = np.arange(r)[:, np.newaxis] * (nx * nz) + iz * nx + ix
+    mass = np.bincount(cells.ravel(), weights=weights.ravel(), minlength=r * nx * nz).reshape(r, nz, nx)
+    padded = np.pad(mass, ((0, 0), (1, 1), (1, 1)))
+    window = sum(padded[:, dz:dz + nz, dx:dx + nx] for dz in range(3) for dx in range(3))
+    best_z, best_x = np.divmod(np.argmax(window.reshape(r, -1), axis=1), nx)
+
+    in_cluster = (np.abs(ix - best_x[:, np.newaxis]) <= 1) & (np.abs(iz - best_z[:, np.newaxis]) <= 1)
+    cluster_weights = np.where(in_cluster, weights, 0.0)
+    empty = ~np.any(cluster_weights > 0, axis=1)
+    cluster_weights[empty] = weights[empty]
+    return batch_weighted_mean(poses, cluster_weights)
+
+
+def estimate_batch_poses(poses: np.ndarray, weights: np.ndarray, method: str = "cluster",
+                         world_size: tuple[float, float] = (0.0, 0.0), cell_size: float = 2.0) -> np.ndarray:
+    """
+        Function estimates the poses of R robots from their particle sets, see estimate_pose.
+        Parameters:
+            poses (np.ndarray): The R×N×3 array of poses, one row per robot.
+            weights (np.ndarray): The R×N array of weights.
+            method (str): One of ESTIMATORS. Defaults to "cluster".
+            world_size (tuple[float, float]): The size of the world, used by the "cluster" method.
+            cell_size (float): The size of the cluster grid cells in meters. Defaults to 2.0.
+        Returns:
+            np.ndarray: The R×3 array of estimated poses.
+        Raises:
+            ValueError: If the method is unknown.
+    """
+    if method == "mean":
+        return batch_weighted_mean(poses, weights)
+    if method == "cluster":
+        return batch_cluster_mean(poses, weights, world_size, cell_size)
+    if method == "max":
+        return poses[np.arange(poses.shape[0]), np.argmax(weights, axis=1)]
+    raise ValueError(f"unknown pose estimator '{method}', expected one of {ESTIMATORS}")
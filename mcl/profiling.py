@@ -0,0 +1,205 @@
+"""
+    Project: ROBa project
+    File: profiling.py
+    Description: This file contains the lightweight per-stage profiler of the Monte Carlo localization pipeline.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import contextlib
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+_DISABLED = contextlib.nullcontext()
+
+
+class StageTimer:
+    """
+        Class accumulates the timings of one stage of the pipeline, used as a context manager around the stage.
+        The last durations are kept in a ring buffer for the rolling statistics and histograms.
+        A stage is meant to be timed from one thread at a time.
+        Attributes:
+            name (str): The name of the stage.
+            count (int): The number of timed runs.
+            total (float): The total time of the runs in seconds.
+            last (float): The duration of the last run in seconds.
+            samples (np.ndarray): The ring buffer of the last durations in seconds.
+    """
+    __slots__ = ("name", "count", "total", "last", "samples", "_start")
+
+    def __init__(self, name: str, window: int):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.samples = np.zeros(window)
+        self._start = 0.0
+
+
+    def __enter__(self) -> "StageTimer":
+        self._start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *_):
+        self.add(time.perf_counter() - self._start)
+
+
+    def add(self, duration: float):
+        """
+            Method records the duration of a run.
+            Parameters:
+                duration (float): The duration in seconds.
+        """
+        self.samples[self.count % self.samples.shape[0]] = duration
+        self.count += 1
+        self.total += duration
+        self.last = duration
+
+
+    def window(self) -> np.ndarray:
+        """
+            Method returns the durations of the last runs, at most the size of the ring buffer.
+        """
+        return self.samples[:min(self.count, self.samples.shape[0])]
+
+
+class Profiler:
+    """
+        Class collects timers, counters and rolling histograms per stage of the pipeline.
+        When disabled, stage() returns a shared no-op context manager and count() returns immediately,
+        so the instrumentation can stay in place during normal runs.
+        Attributes:
+            enabled (bool): Whether the stages are timed.
+            window (int): The number of last durations kept per stage.
+            stages (dict[str, StageTimer]): The timers of the stages, in the order they were first run.
+            counters (dict[str, int]): The counters.
+    """
+    enabled: bool
+    window: int
+    stages: dict[str, StageTimer]
+    counters: dict[str, int]
+
+    def __init__(self, enabled: bool = False, window: int = 256):
+        """
+            Constructor of the class
+            Parameters:
+                enabled (bool): Whether the stages are timed. Defaults to False.
+                window (int): The number of last durations kept per stage. Defaults to 256.
+        """
+        self.enabled = enabled
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+
+
+    def stage(self, name: str):
+        """
+            Method returns the context manager timing a stage.
+            Parameters:
+                name (str): The name of the stage.
+            Returns:
+                The timer of the stage, or a no-op context manager if the profiler is disabled.
+        """
+        if not self.enabled:
+            return _DISABLED
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = StageTimer(name, self.window)
+        return timer
+
+
+    def count(self, name: str, n: int = 1):
+        """
+            Method increments a counter.
+            Parameters:
+                name (str): The name of the counter.
+                n (int): The increment. Defaults to 1.
+        """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def reset(self):
+        """
+            Method discards every timing and counter.
+        """
+        self.stages = {}
+        self.counters = {}
+
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+            Method computes the statistics of every stage.
+            Returns:
+                dict: For every stage, the number of runs, the total and last time, and the mean, median,
+                    95th percentile and maximum over the rolling window, all in seconds.
+        """
+        stats = {}
+        for name, timer in list(self.stages.items()):
+            window = timer.window()
+            stats[name] = {
+                "count": timer.count,
+                "total_s": timer.total,
+                "last_s": timer.last,
+                "mean_s": float(np.mean(window)) if window.shape[0] else 0.0,
+                "p50_s": float(np.percentile(window, 50)) if window.shape[0] else 0.0,
+                "p95_s": float(np.percentile(window, 95)) if window.shape[0] else 0.0,
+                "max_s": float(np.max(window)) if window.shape[0] else 0.0,
+            }
+        return stats
+
+
+    def histogram(self, name: str, bins: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Method computes the histogram of the durations of a stage over the rolling window.
+            Parameters:
+                name (str): The name of the stage.
+                bins (int): The number of bins. Defaults to 10.
+            Returns:
+                tuple[np.ndarray, np.ndarray]: The counts and the bin edges in seconds.
+            Raises:
+                KeyError: If the stage was never timed.
+        """
+        return np.histogram(self.stages[name].window(), bins=bins)
+
+
+    def summary_lines(self) -> list[str]:
+        """
+            Method formats the rolling statistics of the stages and the counters, one line each.
+        """
+        lines = [f"{name:<22} {s['mean_s'] * 1e3:8.2f} ms  p95 {s['p95_s'] * 1e3:8.2f} ms"
+                 for name, s in self.stats().items()]
+        lines += [f"{name:<22} {value:>11}" for name, value in list(self.counters.items())]
+        return lines
+
+
+    def export(self, path: str):
+        """
+            Method writes the statistics and the counters to a JSON file, or the statistics to a CSV file,
+            depending on the extension of the path.
+            Parameters:
+                path (str): The path to the file (.json or .csv).
+            Raises:
+                ValueError: If the format is not supported.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".json":
+            with open(path, "w") as f:
+                json.dump({"stages": self.stats(), "counters": dict(self.counters)}, f, indent=2)
+        elif extension == ".csv":
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["stage", "count", "total_s", "last_s", "mean_s", "p50_s", "p95_s", "max_s"])
+                for name, s in self.stats().items():
+                    writer.writerow([name, s["count"], s["total_s"], s["last_s"], s["mean_s"], s["p50_s"], s["p95_s"], s["max_s"]])
+        else:
+            raise ValueError(f"unsupported profile format '{extension}', expected .json or .csv")
@@ -0,0 +1,245 @@
+"""
+    Project: ROBa project
+    File: range_sensor.py
+    Description: This file contains the range-finder (LIDAR) sensor model evaluated against the occupancy grid map.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+
+import numpy as np
+
+from mcl.pose import Pose3D
+
+RANGE_METHODS = ("raycast", "likelihood_field")
+
+
+class RangeSensorModel:
+    """
+        Class to handle a range-finder with K beams for a whole set of particles at once.
+        The expected ranges are either ray-cast through the grid map for all N×K beams together ("raycast"),
+        or the beam end points are scored against a precomputed distance transform of the obstacles ("likelihood_field").
+        Attributes:
+            grid_map (environment.grid_map.GridMap): The map the beams are cast in.
+            beam_angles (np.ndarray): The K angles of the beams relative to the heading of the robot in rad.
+            max_range (float): The maximum range of the sensor in meters, also returned by beams hitting nothing.
+            sense_noise (float): The standard deviation of the measured ranges in meters.
+            method (str): The evaluation method, one of RANGE_METHODS.
+            z_hit (float): The weight of the Gaussian measurement noise in the beam model.
+            z_rand (float): The weight of the uniform random measurements in the beam model.
+            occupied_threshold (float): The occupancy probability above which a cell stops the beams.
+            distance_field (np.ndarray|None): The distance from every cell to the closest obstacle in meters,
+                used by both methods.
+    """
+    beam_angles: np.ndarray
+    max_range: float
+    sense_noise: float
+    method: str
+    z_hit: float
+    z_rand: float
+    occupied_threshold: float
+    distance_field: np.ndarray|None
+
+    def __init__(self, grid_map, number_of_beams: int = 36, max_range: float = 20.0, sense_noise: float = 0.5,
+                 method: str = "likelihood_field", field_of_view: float = 2 * math.pi, z_hit: float = 0.9,
+                 z_rand: float = 0.1, occupied_threshold: float = 0.5):
+        """
+            Constructor initializes the beams and the evaluation method.
+            Parameters:
+                grid_map (environment.grid_map.GridMap): The map the beams are cast in.
+                number_of_beams (int): The number of beams per scan. Defaults to 36.
+                max_range (float): The maximum range in meters. Defaults to 20.0.
+                sense_noise (float): The standard deviation of the ranges in meters. Defaults to 0.5.
+                method (str): "raycast" or "likelihood_field". Defaults to "likelihood_field".
+                field_of_view (float): The angle covered by the beams in rad. Defaults to a full turn.
+                z_hit (float): The weight of the Gaussian measurement noise. Defaults to 0.9.
+                z_rand (float): The weight of the uniform random measurements. Defaults to 0.1.
+                occupied_threshold (float): The occupancy above which a cell stops the beams. Defaults to 0.5.
+            Raises:
+                ValueError: If the method is unknown.
+        """
+        if method not in RANGE_METHODS:
+            raise ValueError(f"unknown range sensor method '{method}', expected one of {RANGE_METHODS}")
+
+        self.grid_map = grid_map
+        if field_of_view >= 2 * math.pi:
+            self.beam_angles = np.linspace(-math.pi, math.pi, number_of_beams, endpoint=False)
+        else:
+            self.beam_angles = np.linspace(-field_of_view / 2, field_of_view / 2, number_of_beams)
+        self.max_range = max_range
+        self.sense_noise = sense_noise
+        self.method = method
+        self.z_hit = z_hit
+        self.z_rand = z_rand
+        self.occupied_threshold = occupied_threshold
+        self.distance_field = None
+        self.precompute_distance_field()
+
+
+    def precompute_distance_field(self):
+        """
+            Method computes the Euclidean distance transform of the obstacles of the map, in meters.
+        """
+        from scipy.ndimage import distance_transform_edt
+
+        occupied = self.grid_map.occupancy >= self.occupied_threshold * self.grid_map.max_occupancy()
+        if not occupied.any():
+            self.distance_field = np.full(occupied.shape, np.inf, dtype=np.float32)
+            return
+        self.distance_field = distance_transform_edt(~occupied, sampling=(self.grid_map.size_z, self.grid_map.size_x)).astype(np.float32)
+
+
+    def raycast(self, poses: np.ndarray) -> np.ndarray:
+        """
+            Method casts all the beams of all the poses through the grid map.
+            The beams are sphere-traced on the distance field: every iteration advances all the beams still
+            in flight at once by the free distance around them, so beams cross open space in a few iterations.
+            Once a beam is less than a cell away from an obstacle, it is traversed cell by cell along the grid
+            (Amanatides-Woo), so it cannot jump over a thin wall, until it hits an obstacle or is in open space again.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            Returns:
+                np.ndarray: The N×K array of ranges, max_range for the beams hitting nothing.
+        """
+        if self.distance_field is None:
+            self.precompute_distance_field()
+
+        n, k = poses.shape[0], self.beam_angles.shape[0]
+        grid_map = self.grid_map
+        nb_cell_x, nb_cell_z = grid_map.nb_cell_x, grid_map.nb_cell_z
+        field = self.distance_field.reshape(-1)
+
+        # the field holds distances between cell centers, a point of a cell can be up to a cell diagonal closer
+        margin = math.hypot(grid_map.size_x, grid_map.size_z)
+        cell = min(grid_map.size_x, grid_map.size_z)
+
+        # the beams advance in meters, their positions are in cells
+        angles = poses[:, 2, np.newaxis] + self.beam_angles[np.newaxis, :]
+        cos = (np.cos(angles) / grid_map.size_x).ravel()
+        sin = (np.sin(angles) / grid_map.size_z).ravel()
+        x0 = np.repeat(poses[:, 0] / grid_map.size_x, k)
+        z0 = np.repeat(poses[:, 1] / grid_map.size_z, k)
+
+        # the grid traversal state: the direction of the steps, the distance between two cell boundaries
+        # and the distance of the next boundary on every axis
+        step_x = np.sign(cos).astype(np.intp)
+        step_z = np.sign(sin).astype(np.intp)
+        with np.errstate(divide="ignore"):
+            delta_x = 1.0 / np.abs(cos)
+            delta_z = 1.0 / np.abs(sin)
+        traversing = np.zeros(n * k, dtype=bool)
+        cell_x = np.floor(x0).astype(np.intp)
+        cell_z = np.floor(z0).astype(np.intp)
+        next_x = np.zeros(n * k)
+        next_z = np.zeros(n * k)
+
+        ranges = np.full(n * k, self.max_range)
+        travelled = np.zeros(n * k)
+        active = np.arange(n * k)
+        while active.shape[0] > 0:
+            cx, cz = cell_x[active], cell_z[active]
+            inside = (cx >= 0) & (cx < nb_cell_x) & (cz >= 0) & (cz < nb_cell_z)
+            free = np.where(inside, field[np.where(inside, cz * nb_cell_x + cx, 0)], np.inf)
+
+            t = travelled[active]
+            hit = free == 0
+            ranges[active[hit]] = t[hit]
+            flying = inside & ~hit
+
+            clearance = free - margin
+            near = flying & (clearance < cell)
+            traced = flying & ~near
+            beams = active[traced]
+            t[traced] = np.minimum(t[traced] + clearance[traced], self.max_range + cell)  # no infinite step on an empty map
+            cell_x[beams] = np.floor(x0[beams] + cos[beams] * t[traced])
+            cell_z[beams] = np.floor(z0[beams] + sin[beams] * t[traced])
+
+            # the beams coming close to an obstacle start the grid traversal from their cell
+            start = near & ~traversing[active]
+            if start.any():
+                beams = active[start]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    next_x[beams] = np.where(step_x[beams] != 0, (cx[start] + (step_x[beams] > 0) - x0[beams]) / cos[beams], np.inf)
+                    next_z[beams] = np.where(step_z[beams] != 0, (cz[start] + (step_z[beams] > 0) - z0[beams]) / sin[beams], np.inf)
+            traversing[active] = near
+
+            # one cell step, along the axis whose boundary comes first
+            beams = active[near]
+            boundary_x, boundary_z = next_x[beams], next_z[beams]
+            along_x = boundary_x < boundary_z
+            t[near] = np.minimum(boundary_x, boundary_z)
+            beams_x, beams_z = beams[along_x], beams[~along_x]
+            cell_x[beams_x] += step_x[beams_x]
+            next_x[beams_x] += delta_x[beams_x]
+            cell_z[beams_z] += step_z[beams_z]
+            next_z[beams_z] += delta_z[beams_z]
+
+            travelled[active] = t
+            active = active[flying & (t <= self.max_range)]
+
+        return ranges.reshape(n, k)
+
+
+    def measure(self, pose: Pose3D, rng: np.random.Generator) -> list[float]:
+        """
+            Method simulates a noisy scan from the given pose.
+            Parameters:
+                pose (Pose3D): The pose of the sensor.
+                rng (np.random.Generator): The random generator of the noise.
+            Returns:
+                list[float]: The K measured ranges, max_range for the beams hitting nothing.
+        """
+        ranges = self.raycast(np.array([[pose.x, pose.y, pose.theta]]))[0]
+        hits = ranges < self.max_range
+        ranges[hits] += rng.normal(0.0, self.sense_noise, int(hits.sum()))
+        return np.clip(ranges, 0.0, self.max_range).tolist()
+
+
+    def log_likelihood(self, poses: np.ndarray, measurements: list[float]) -> np.ndarray:
+        """
+            Method computes the log-likelihood of the scan for every pose.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+                measurements (list[float]): The K measured ranges.
+            Returns:
+                np.ndarray: The N array of log-likelihoods.
+        """
+        z = np.asarray(measurements, dtype=np.float64)
+        if self.method == "raycast":
+            errors = self.raycast(poses) - z[np.newaxis, :]
+        else:
+            errors = self.endpoint_distances(poses, z)
+
+        gauss = np.exp(-0.5 * np.square(errors / self.sense_noise)) / (self.sense_noise * math.sqrt(2 * math.pi))
+        return np.sum(np.log(self.z_hit * gauss + self.z_rand / self.max_range), axis=1)
+
+
+    def endpoint_distances(self, poses: np.ndarray, z: np.ndarray) -> np.ndarray:
+        """
+            Method looks up the distance from the end point of every beam to the closest obstacle.
+            Beams at the maximum range carry no end point and are given a zero distance.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+                z (np.ndarray): The K measured ranges.
+            Returns:
+                np.ndarray: The N×K array of distances in meters, infinite for end points outside of the map.
+        """
+        if self.distance_field is None:
+            self.precompute_distance_field()
+
+        valid = z < self.max_range
+        angles = poses[:, 2, np.newaxis] + self.beam_angles[np.newaxis, valid]
+        px = poses[:, 0, np.newaxis] + np.cos(angles) * z[np.newaxis, valid]
+        pz = poses[:, 1, np.newaxis] + np.sin(angles) * z[np.newaxis, valid]
+
+        inside = (px >= 0) & (px < self.grid_map.width) & (pz >= 0) & (pz < self.grid_map.height)
+        ix, iz = self.grid_map.world_to_cell(px, pz)
+
+        distances = np.zeros((poses.shape[0], z.shape[0]), dtype=np.float32)
+        distances[:, valid] = np.where(inside, self.distance_field[iz, ix], np.inf)
+        return distances
@@ -0,0 +1,182 @@
+"""
+    Project: ROBa project
+    File: recording.py
+    Description: This file contains the chunked binary recording of filter runs and its memory-mapped playback.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+
+    Layout:
+        A recording is a directory of chunks, every chunk being a pair of NPY files:
+        chunk_NNNNN_steps.npy       K×8 float64, per step: robot x, y, theta, estimate x, y, theta,
+                                    offset and count of the particles of the step in the particle file
+        chunk_NNNNN_particles.npy   P×4 float32, the (decimated) particles of the K steps: x, y, theta, weight
+"""
+
+import glob
+import math
+import os
+
+import numpy as np
+
+from mcl.engine import MCLEngine
+from mcl.pose import Pose3D
+from mcl.worker import FilterSnapshot
+
+STEP_COLUMNS = 8
+
+
+class RunRecorder:
+    """
+        Class appends the state of the filter at every step to a recording.
+        The steps are buffered in memory and written as one chunk every chunk_steps steps,
+        so the memory used does not depend on the length of the run and a crash loses at most one chunk.
+        Attributes:
+            directory (str): The directory of the recording.
+            decimation (int): Only every decimation-th particle is recorded.
+            chunk_steps (int): The number of steps per chunk.
+            steps (int): The number of steps recorded so far.
+    """
+    directory: str
+    decimation: int
+    chunk_steps: int
+    steps: int
+
+    def __init__(self, directory: str, decimation: int = 1, chunk_steps: int = 256):
+        """
+            Constructor creates the directory of the recording.
+            Parameters:
+                directory (str): The directory of the recording, created if needed.
+                decimation (int): Record only every decimation-th particle. Defaults to 1.
+                chunk_steps (int): The number of steps per chunk. Defaults to 256.
+            Raises:
+                ValueError: If the directory already holds a recording.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if glob.glob(os.path.join(directory, "chunk_*_steps.npy")):
+            raise ValueError(f"'{directory}' already holds a recording")
+
+        self.directory = directory
+        self.decimation = decimation
+        self.chunk_steps = chunk_steps
+        self.steps = 0
+        self._chunk = 0
+        self._step_rows: list[list[float]] = []
+        self._particles: list[np.ndarray] = []
+        self._offset = 0
+
+
+    def record(self, engine: MCLEngine):
+        """
+            Method appends the current state of the engine.
+            Parameters:
+                engine (MCLEngine): The engine to record.
+        """
+        particles = np.empty((math.ceil(len(engine.particles) / self.decimation), 4), dtype=np.float32)
+        particles[:, :3] = engine.particles.poses[::self.decimation]
+        particles[:, 3] = engine.particles.weights[::self.decimation]
+
+        robot, estimate = engine.robot.pose, engine.predicted_robot.pose
+        self._step_rows.append([robot.x, robot.y, robot.theta, estimate.x, estimate.y, estimate.theta,
+                                self._offset, particles.shape[0]])
+        self._particles.append(particles)
+        self._offset += particles.shape[0]
+        self.steps += 1
+        if len(self._step_rows) >= self.chunk_steps:
+            self.flush()
+
+
+    def flush(self):
+        """
+            Method writes the buffered steps as a new chunk.
+        """
+        if not self._step_rows:
+            return
+        prefix = os.path.join(self.directory, f"chunk_{self._chunk:05d}")
+        np.save(prefix + "_particles.npy", np.concatenate(self._particles))
+        np.save(prefix + "_steps.npy", np.array(self._step_rows, dtype=np.float64))
+        self._chunk += 1
+        self._step_rows = []
+        self._particles = []
+        self._offset = 0
+
+
+    def close(self):
+        self.flush()
+
+
+    def __enter__(self) -> "RunRecorder":
+        return self
+
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class RunPlayer:
+    """
+        Class gives random access to the steps of a recording.
+        The particle files are memory-mapped: only the pages of the steps actually accessed are read,
+        so recordings larger than the memory can be scrubbed through.
+        Attributes:
+            directory (str): The directory of the recording.
+            trajectory (np.ndarray): The S×6 array of the robot and estimated poses of every step.
+    """
+    directory: str
+    trajectory: np.ndarray
+
+    def __init__(self, directory: str):
+        """
+            Constructor opens the chunks of a recording.
+            Parameters:
+                directory (str): The directory of the recording.
+            Raises:
+                ValueError: If the directory holds no recording.
+        """
+        self.directory = directory
+        step_files = sorted(glob.glob(os.path.join(directory, "chunk_*_steps.npy")))
+        if not step_files:
+            raise ValueError(f"'{directory}' holds no recording")
+
+        steps = []
+        self._particles: list[np.ndarray] = []
+        for chunk, step_file in enumerate(step_files):
+            chunk_steps = np.load(step_file)
+            steps.append(np.column_stack([chunk_steps, np.full(chunk_steps.shape[0], chunk)]))
+            self._particles.append(np.load(step_file.replace("_steps.npy", "_particles.npy"), mmap_mode="r"))
+
+        self._steps = np.concatenate(steps)
+        self.trajectory = self._steps[:, :6]
+
+
+    def __len__(self) -> int:
+        return self._steps.shape[0]
+
+
+    def particles(self, step: int) -> np.ndarray:
+        """
+            Method returns the recorded particles of a step.
+            Parameters:
+                step (int): The index of the step.
+            Returns:
+                np.ndarray: The read-only P×4 memory-mapped array of particles (x, y, theta, weight).
+        """
+        offset, count, chunk = self._steps[step, 6:9].astype(np.int64)
+        return self._particles[chunk][offset:offset + count]
+
+
+    def snapshot(self, step: int) -> FilterSnapshot:
+        """
+            Method returns a step in the form published by the filter worker, so it can be drawn by the renderer.
+            Parameters:
+                step (int): The index of the step.
+            Returns:
+                FilterSnapshot: The recorded state.
+        """
+        particles = self.particles(step)
+        robot_x, robot_y, robot_theta, x, y, theta = self.trajectory[step].tolist()
+        return FilterSnapshot(particles[:, :3], particles[:, 3], Pose3D(robot_x, robot_y, robot_theta),
+                              Pose3D(x, y, theta), step)
@@ -0,0 +1,377 @@
+"""
+    Project: ROBa project
+    File: replay.py
+    Description: This file contains the streaming replay of recorded odometry and measurement logs through the Monte Carlo localization.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+
+    Usage:
+        python -m mcl.replay robot_log.csv --output poses.csv [--realtime --speed 2.0]
+
+    Log formats:
+        CSV (.csv, .txt): one record per line, "time, forward, turn, z_1, ..., z_M".
+            Empty forward and turn fields mean no odometry, no z fields mean no measurements,
+            an empty or NaN z field means the landmark was not observed.
+            Lines starting with '#' and a non-numeric header line are ignored.
+        Binary (.bin): the 8 bytes BINARY_MAGIC, the number of measurements M as a little-endian uint32 and 4 bytes
+            of padding, followed by records of 3 + M little-endian float64 (time, forward, turn, z_1, ..., z_M).
+            NaN odometry means no odometry, all measurements NaN mean no measurements,
+            a single NaN measurement means the landmark was not observed.
+"""
+
+import argparse
+import math
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Iterable, Iterator, NamedTuple
+
+import numpy as np
+
+from mcl.engine import MCLEngine
+from mcl.pose import Pose3D
+
+BINARY_MAGIC = b"MCLLOG1\n"
+BINARY_HEADER = struct.Struct("<8sI4x")
+
+
+class LogRecord(NamedTuple):
+    """
+        One record of a robot log.
+        Attributes:
+            time (float): The timestamp of the record in seconds.
+            odometry (tuple[float, float]|None): The forward and turn movement since the previous record.
+            measurements (list[float]|None): The measurements taken at the time of the record.
+    """
+    time: float
+    odometry: tuple[float, float]|None
+    measurements: list[float]|None
+
+
+def read_csv_log(path: str) -> Iterator[LogRecord]:
+    """
+        Function streams the records of a CSV log, one line at a time.
+        Parameters:
+            path (str): The path to the log.
+        Returns:
+            Iterator[LogRecord]: The records of the log.
+    """
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            fields = [field.strip() for field in line.split(",")]
+            try:
+                t = float(fields[0])
+            except ValueError:
+                if line_number == 0:
+                    continue  # header
+                raise
+
+            odometry = None
+            if len(fields) >= 3 and fields[1] and fields[2]:
+                odometry = (float(fields[1]), float(fields[2]))
+            measurements = [float(field) if field else math.nan for field in fields[3:]]
+            if all(math.isnan(z) for z in measurements):
+                measurements = None
+            yield LogRecord(t, odometry, measurements)
+
+
+def read_binary_log(path: str, chunk_records: int = 4096) -> Iterator[LogRecord]:
+    """
+        Function streams the records of a binary log, reading chunk_records records at a time,
+        so the memory used does not depend on the length of the log.
+        Parameters:
+            path (str): The path to the log.
+            chunk_records (int): The number of records read at once. Defaults to 4096.
+        Returns:
+            Iterator[LogRecord]: The records of the log.
+        Raises:
+            ValueError: If the file is not a binary log.
+    """
+    with open(path, "rb") as f:
+        magic, number_of_measurements = BINARY_HEADER.unpack(f.read(BINARY_HEADER.size))
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"'{path}' is not a binary robot log")
+
+        width = 3 + number_of_measurements
+        while True:
+            chunk = np.fromfile(f, dtype="<f8", count=chunk_records * width)
+            if chunk.shape[0] == 0:
+                return
+            chunk = chunk[:chunk.shape[0] - chunk.shape[0] % width].reshape(-1, width)
+            has_odometry = ~np.isnan(chunk[:, 1]) & ~np.isnan(chunk[:, 2])
+            has_measurements = ~np.all(np.isnan(chunk[:, 3:]), axis=1) if number_of_measurements > 0 else np.zeros(chunk.shape[0], dtype=bool)
+            for row, odometry, measurements in zip(chunk.tolist(), has_odometry.tolist(), has_measurements.tolist()):
+                yield LogRecord(row[0], (row[1], row[2]) if odometry else None, row[3:] if measurements else None)
+
+
+def read_log(path: str, chunk_records: int = 4096) -> Iterator[LogRecord]:
+    """
+        Function streams the records of a log in the format given by its extension.
+        Parameters:
+            path (str): The path to the log.
+            chunk_records (int): The number of records read at once from binary logs. Defaults to 4096.
+        Returns:
+            Iterator[LogRecord]: The records of the log.
+        Raises:
+            ValueError: If the format of the log is not supported.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".csv", ".txt"):
+        return read_csv_log(path)
+    if extension == ".bin":
+        return read_binary_log(path, chunk_records)
+    raise ValueError(f"unsupported log format '{extension}', expected .csv, .txt or .bin")
+
+
+def prefetch(records: Iterable[LogRecord], buffer_size: int = 1024) -> Iterator[LogRecord]:
+    """
+        Function reads the records on a background thread into a bounded buffer,
+        so the reading and parsing overlap with the filter updates without reading ahead of them unboundedly.
+        Parameters:
+            records (Iterable[LogRecord]): The records to read.
+            buffer_size (int): The maximal number of records read ahead. Defaults to 1024.
+        Returns:
+            Iterator[LogRecord]: The same records.
+    """
+    buffer = queue.Queue(maxsize=buffer_size)
+    end = object()
+    stop = threading.Event()
+
+    def read():
+        try:
+            for record in records:
+                while not stop.is_set():
+                    try:
+                        buffer.put(record, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(end)
+        except Exception as e:  # re-raised by the consumer
+            buffer.put(e)
+
+    reader = threading.Thread(target=read, name="mcl-log-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class LogWriter:
+    """
+        Class writes a robot log record by record, in the format given by the extension of the file.
+        Attributes:
+            path (str): The path to the log.
+            number_of_measurements (int): The number of measurements of every record of a binary log.
+    """
+    path: str
+    number_of_measurements: int
+
+    def __init__(self, path: str, number_of_measurements: int = 0):
+        """
+            Constructor opens the log for writing.
+            Parameters:
+                path (str): The path to the log (.csv, .txt or .bin).
+                number_of_measurements (int): The number of measurements per record, required by binary logs. Defaults to 0.
+            Raises:
+                ValueError: If the format of the log is not supported.
+        """
+        self.path = path
+        self.number_of_measurements = number_of_measurements
+        self._binary = os.path.splitext(path)[1].lower() == ".bin"
+        if not self._binary and os.path.splitext(path)[1].lower() not in (".csv", ".txt"):
+            raise ValueError(f"unsupported log format '{os.path.splitext(path)[1]}', expected .csv, .txt or .bin")
+
+        self._file = open(path, "wb" if self._binary else "w")
+        if self._binary:
+            self._file.write(BINARY_HEADER.pack(BINARY_MAGIC, number_of_measurements))
+        else:
+            self._file.write("# time, forward, turn, measurements...\n")
+
+
+    def write(self, record: LogRecord):
+        """
+            Method appends a record to the log.
+            Parameters:
+                record (LogRecord): The record to write.
+        """
+        if self._binary:
+            row = np.full(3 + self.number_of_measurements, np.nan, dtype="<f8")
+            row[0] = record.time
+            if record.odometry is not None:
+                row[1:3] = record.odometry
+            if record.measurements is not None:
+                row[3:] = record.measurements
+            self._file.write(row.tobytes())
+        else:
+            fields = [repr(record.time)]
+            fields += [repr(v) for v in record.odometry] if record.odometry is not None else ["", ""]
+            fields += [repr(v) for v in record.measurements or []]
+            self._file.write(",".join(fields) + "\n")
+
+
+    def close(self):
+        self._file.close()
+
+
+    def __enter__(self) -> "LogWriter":
+        return self
+
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PoseWriter:
+    """
+        Class writes the estimated poses to a CSV file as they are computed, "time, x, y, theta" per line.
+        Attributes:
+            path (str): The path to the file.
+            flush_every (int): The number of poses written between two flushes of the file.
+    """
+    path: str
+    flush_every: int
+
+    def __init__(self, path: str, flush_every: int = 100):
+        """
+            Constructor opens the file for writing.
+            Parameters:
+                path (str): The path to the file.
+                flush_every (int): The number of poses written between two flushes. Defaults to 100.
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self._file = open(path, "w")
+        self._file.write("time,x,y,theta\n")
+        self._unflushed = 0
+
+
+    def write(self, t: float, pose: Pose3D):
+        """
+            Method appends a pose to the file.
+            Parameters:
+                t (float): The timestamp of the pose.
+                pose (Pose3D): The estimated pose.
+        """
+        self._file.write(f"{t!r},{pose.x!r},{pose.y!r},{pose.theta!r}\n")
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self._file.flush()
+            self._unflushed = 0
+
+
+    def close(self):
+        self._file.close()
+
+
+    def __enter__(self) -> "PoseWriter":
+        return self
+
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def replay(engine: MCLEngine, records: Iterable[LogRecord], realtime: bool = False, speed: float = 1.0,
+           pose_writer: PoseWriter|None = None) -> Iterator[tuple[float, Pose3D]]:
+    """
+        Function runs the filter over a stream of log records.
+        The odometry is accumulated (see MCLEngine.odometry) and applied to the particles at the next measurement,
+        so records without measurements cost no pass over the particles.
+        Parameters:
+            engine (MCLEngine): The engine to run.
+            records (Iterable[LogRecord]): The records, e.g. read_log() wrapped in prefetch().
+            realtime (bool): Wait for the timestamps of the records instead of running as fast as possible. Defaults to False.
+            speed (float): The playback speed factor of the real-time mode. Defaults to 1.0.
+            pose_writer (PoseWriter|None): The writer of the estimated poses, if any. Defaults to None.
+        Returns:
+            Iterator[tuple[float, Pose3D]]: The timestamp and the estimated pose after every measurement.
+    """
+    start_wall = None
+    start_time = 0.0
+    for record in records:
+        if realtime:
+            if start_wall is None:
+                start_wall, start_time = time.monotonic(), record.time
+            delay = start_wall + (record.time - start_time) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if record.odometry is not None:
+            engine.odometry.add(*record.odometry)
+        if record.measurements is None:
+            continue
+
+        estimate = engine.step(engine.odometry.flush(), record.measurements)
+        if pose_writer is not None:
+            pose_writer.write(record.time, estimate)
+        yield record.time, estimate
+
+
+if __name__ == "__main__":
+    from environment.grid_map import GridMap
+    from mcl.monte_carlo import Robot
+    from mcl.recording import RunRecorder
+    from parameters.parameters import Parameters
+
+    parser = argparse.ArgumentParser(description="Replay a robot log through the Monte Carlo localization.")
+    parser.add_argument("log", help="the log to replay (.csv, .txt or .bin)")
+    parser.add_argument("--output", default="poses.csv", help="the CSV file to write the estimated poses to")
+    parser.add_argument("--realtime", action="store_true", help="follow the timestamps of the log")
+    parser.add_argument("--speed", type=float, default=1.0, help="the playback speed factor in the real-time mode")
+    parser.add_argument("--particles", type=int, default=5000)
+    parser.add_argument("--sensor", default="landmarks", choices=("landmarks", "range"))
+    parser.add_argument("--map", default=None, help="the map (.npy, .pgm or .png), the default empty map if not given")
+    parser.add_argument("--resolution", type=float, default=0.05, help="the size of a cell of the map in meters")
+    parser.add_argument("--landmarks", default=None, help="the landmarks (.npy, .csv or .txt), the built-in ones if not given")
+    parser.add_argument("--buffer", type=int, default=1024, help="the number of records read ahead")
+    parser.add_argument("--record", default=None, help="the directory to record the filter state to, see mcl.recording")
+    parser.add_argument("--decimation", type=int, default=1, help="record only every n-th particle")
+    args = parser.parse_args()
+
+    grid_map = GridMap()
+    if args.map is None:
+        grid_map.init_map()
+    else:
+        grid_map.load_map(args.map, args.resolution)
+
+    parameters = Parameters()
+    setattr(parameters, "robot", Robot(Pose3D(0, 0, 0)))  # no ground truth in a log
+    setattr(parameters, "predicted_robot", Robot(Pose3D(0, 0, 0)))
+    setattr(parameters, "map", grid_map)
+    setattr(parameters, "number_of_particles", args.particles)
+    setattr(parameters, "percent_random_particles", 10)
+    setattr(parameters, "sensor", args.sensor)
+    setattr(parameters, "landmarks_file", args.landmarks)
+    engine = MCLEngine(parameters)
+
+    recorder = RunRecorder(args.record, args.decimation) if args.record is not None else None
+    steps = 0
+    start = time.perf_counter()
+    with PoseWriter(args.output) as writer:
+        for _ in replay(engine, prefetch(read_log(args.log), args.buffer), args.realtime, args.speed, writer):
+            steps += 1
+            if recorder is not None:
+                recorder.record(engine)
+    if recorder is not None:
+        recorder.close()
+    print(f"{steps} filter updates in {time.perf_counter() - start:.2f} s, poses written to {args.output}")
@@ -0,0 +1,241 @@
+"""
+    Project: ROBa project
+    File: resampling.py
+    Description: This file contains the resampling schemes and the effective sample size used by the Monte Carlo localization.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import numpy as np
+
+
+def effective_sample_size(weights: np.ndarray) -> float:
+    """
+        Function computes the effective sample size of a set of normalized weights.
+        Parameters:
+            weights (np.ndarray): The N array of normalized weights.
+        Returns:
+            float: The effective sample size, N for uniform weights and 1 for a single non-zero weight.
+    """
+    return 1.0 / float(np.dot(weights, weights))
+
+
+def _cumulative(weights: np.ndarray) -> np.ndarray:
+    """
+        Function computes the cumulative sum of the weights with the last element forced to one,
+        so rounding errors can never produce an index past the end of the array.
+    """
+    cumulative = np.cumsum(weights)
+    cumulative /= cumulative[-1]
+    cumulative[-1] = 1.0
+    return cumulative
+
+
+def multinomial_resample(weights: np.ndarray, rng: np.random.Generator, n: int|None = None) -> np.ndarray:
+    """
+        Function draws n independent indices with probabilities given by the weights.
+        Parameters:
+            weights (np.ndarray): The N array of normalized weights.
+            rng (np.random.Generator): The random generator.
+            n (int|None): The number of indices to draw. Defaults to N.
+        Returns:
+            np.ndarray: The n array of selected particle indices.
+    """
+    n = weights.shape[0] if n is None else n
+    return np.searchsorted(_cumulative(weights), rng.random(n), side='right')
+
+
+def stratified_resample(weights: np.ndarray, rng: np.random.Generator, n: int|None = None) -> np.ndarray:
+    """
+        Function draws one index from each of the n equal strata of the cumulative weights.
+        Parameters:
+            weights (np.ndarray): The N array of normalized weights.
+            rng (np.random.Generator): The random generator.
+            n (int|None): The number of indices to draw. Defaults to N.
+        Returns:
+            np.ndarray: The n array of selected particle indices, sorted.
+    """
+    n = weights.shape[0] if n is None else n
+    positions = (np.arange(n) + rng.random(n)) / n
+    return np.searchsorted(_cumulative(weights), positions, side='right')
+
+
+def systematic_resample(weights: np.ndarray, rng: np.random.Generator, n: int|None = None) -> np.ndarray:
+    """
+        Function performs low-variance resampling with a single random offset shared by all strata.
+        The number of copies of every particle is computed directly from the cumulative weights,
+        so the function runs in linear time.
+        Parameters:
+            weights (np.ndarray): The N array of normalized weights.
+            rng (np.random.Generator): The random generator.
+            n (int|None): The number of indices to draw. Defaults to N.
+        Returns:
+            np.ndarray: The n array of selected particle indices, sorted.
+    """
+    n = weights.shape[0] if n is None else n
+    offset = rng.random()
+
+    # particle i receives one copy for every position (offset + k) falling into [n * c_{i-1}, n * c_i)
+    edges = np.ceil(_cumulative(weights) * n - offset).astype(np.int64)
+    counts = np.diff(edges, prepend=0)
+    return np.repeat(np.arange(weights.shape[0]), counts)
+
+
+def residual_resample(weights: np.ndarray, rng: np.random.Generator, n: int|None = None) -> np.ndarray:
+    """
+        Function keeps floor(n * w) copies of every particle and fills the rest of the set by
+        stratified resampling of the residual weights.
+        Parameters:
+            weights (np.ndarray): The N array of normalized weights.
+            rng (np.random.Generator): The random generator.
+            n (int|None): The number of indices to draw. Defaults to N.
+        Returns:
+            np.ndarray: The n array of selected particle indices.
+    """
+    n = weights.shape[0] if n is None else n
+    scaled = weights * n
+    counts = np.floor(scaled).astype(np.int64)
+    indices = np.repeat(np.arange(weights.shape[0]), counts)
+
+    remaining = n - indices.shape[0]
+    if remaining > 0:
+        residuals = scaled - counts
+        positions = (np.arange(remaining) + rng.random(remaining)) / remaining
+        extra = np.searchsorted(_cumulative(residuals), positions, side='right')
+        indices = np.concatenate((indices, extra))
+    return indices
+
+
+RESAMPLERS = {
+    "multinomial": multinomial_resample,
+    "stratified": stratified_resample,
+    "systematic": systematic_resample,
+    "residual": residual_resample,
+}
+
+
+def resample_indices(weights: np.ndarray, method: str = "systematic", n: int|None = None,
+                     rng: np.random.Generator|None = None) -> np.ndarray:
+    """
+        Function selects the indices of the particles that survive the resampling.
+        Parameters:
+            weights (np.ndarray): The N array of normalized weights.
+            method (str): The resampling scheme, one of RESAMPLERS. Defaults to "systematic".
+            n (int|None): The number of indices to draw. Defaults to N.
+            rng (np.random.Generator|None): The random generator, a fresh one if None. Defaults to None.
+        Returns:
+            np.ndarray: The n array of selected particle indices.
+        Raises:
+            ValueError: If the resampling scheme is unknown.
+    """
+    if method not in RESAMPLERS:
+        raise ValueError(f"unknown resampling method '{method}', expected one of {list(RESAMPLERS)}")
+    rng = np.random.default_rng() if rng is None else rng
+    return RESAMPLERS[method](weights, rng, n)
+
+
+class SystematicResampler:
+    """
+        Class performs the systematic resampling of a fixed number of particles in preallocated buffers,
+        so no array is allocated by a resampling. It selects the same indices as systematic_resample
+        for the same random generator state.
+        Every particle with at least one copy writes its index at the position of its first copy,
+        a running maximum then fills the positions of the other copies.
+        Attributes:
+            n (int): The number of particles.
+            indices (np.ndarray): The n+1 uint32 buffer of the selected indices, the last slot absorbs the particles without copies.
+    """
+    n: int
+    indices: np.ndarray
+
+    def __init__(self, n: int):
+        """
+            Constructor allocates the buffers.
+            Parameters:
+                n (int): The number of particles.
+        """
+        self.n = n
+        self.indices = np.empty(n + 1, dtype=np.uint32)
+        self._cumulative = np.empty(n, dtype=np.float64)
+        self._edges = np.empty(n + 1, dtype=np.intp)
+        self._no_copy = np.empty(n, dtype=bool)
+        self._particles = np.arange(n, dtype=np.uint32)
+
+
+    def resample(self, weights: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+            Method selects the indices of the particles that survive the resampling.
+            Parameters:
+                weights (np.ndarray): The n array of normalized weights.
+                rng (np.random.Generator): The random generator.
+            Returns:
+                np.ndarray: The n uint32 array of selected particle indices, sorted, overwritten by the next call.
+        """
+        n = self.n
+        offset = rng.random()
+
+        # the copies of particle i take the positions [edges[i], edges[i + 1]), as in systematic_resample
+        cumulative = self._cumulative
+        cumulative[:] = weights  # float32 weights are accumulated in float64 without a cast buffer
+        np.cumsum(cumulative, out=cumulative)
+        cumulative /= cumulative[-1]
+        cumulative[-1] = 1.0
+        cumulative *= n
+        cumulative -= offset
+        np.ceil(cumulative, out=cumulative)
+        edges = self._edges
+        edges[0] = 0
+        edges[1:] = cumulative
+
+        starts = edges[:-1]
+        np.equal(starts, edges[1:], out=self._no_copy)
+        np.copyto(starts, n, where=self._no_copy)
+        self.indices.fill(0)
+        self.indices[starts] = self._particles
+        selected = self.indices[:n]
+        np.maximum.accumulate(selected, out=selected)
+        return selected
+
+
+BATCH_RESAMPLERS = ("multinomial", "stratified", "systematic")
+
+
+def batch_resample_indices(weights: np.ndarray, rng: np.random.Generator, method: str = "systematic") -> np.ndarray:
+    """
+        Function resamples R independent particle sets of N particles in one pass.
+        The cumulative weights of set r are shifted to [r, r + 1], so all the sets form one sorted array
+        and a single searchsorted draws the particles of every set.
+        Parameters:
+            weights (np.ndarray): The R×N array of normalized weights, one row per set.
+            rng (np.random.Generator): The random generator.
+            method (str): The resampling scheme, one of BATCH_RESAMPLERS. Defaults to "systematic".
+        Returns:
+            np.ndarray: The R×N array of selected particles, as indices into the flattened R·N particles.
+        Raises:
+            ValueError: If the resampling scheme is unknown.
+    """
+    if method not in BATCH_RESAMPLERS:
+        raise ValueError(f"unknown batch resampling method '{method}', expected one of {BATCH_RESAMPLERS}")
+    r, n = weights.shape
+    rows = np.arange(r)[:, np.newaxis]
+
+    cumulative = np.cumsum(weights, axis=1)
+    cumulative /= cumulative[:, -1:]
+    cumulative[:, -1] = 1.0
+    cumulative += rows
+
+    if method == "multinomial":
+        positions = rng.random((r, n))
+    elif method == "stratified":
+        positions = (np.arange(n) + rng.random((r, n))) / n
+    else:
+        positions = (np.arange(n) + rng.random((r, 1))) / n
+    positions += rows
+
+    indices = np.searchsorted(cumulative.ravel(), positions.ravel(), side='right').reshape(r, n)
+    # a position rounded up to r + 1 must not leak into the next set
+    return np.minimum(indices, (rows + 1) * n - 1)
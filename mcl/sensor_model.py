@@ -0,0 +1,184 @@
+"""
+    Project: ROBa project
+    File: sensor_model.py
+    Description: This file contains the batched landmark sensor model used to weight the particles of the Monte Carlo localization.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import math
+
+import numpy as np
+
+from .global_vars import LANDMARKS_NP
+
+LOOKUP_MODES = ("exact", "nearest", "bilinear")
+
+
+def normalize_log_weights(log_weights: np.ndarray, return_log_sum: bool = False) -> np.ndarray|tuple[np.ndarray, float]:
+    """
+        Function converts log-likelihoods to normalized weights using the log-sum-exp trick,
+        so the result stays finite even when every likelihood underflows in linear space.
+        Parameters:
+            log_weights (np.ndarray): The N array of log-likelihoods.
+            return_log_sum (bool): Also return the logarithm of the sum of the unnormalized weights. Defaults to False.
+        Returns:
+            np.ndarray: The N array of weights summing up to one, with the log of their sum if return_log_sum is True.
+    """
+    max_log_weight = np.max(log_weights)
+    if not np.isfinite(max_log_weight):
+        # no particle explains the measurements, fall back to uniform weights
+        weights = np.full(log_weights.shape[0], 1.0 / log_weights.shape[0])
+        return (weights, float(max_log_weight)) if return_log_sum else weights
+
+    weights = np.exp(log_weights - max_log_weight)
+    total = np.sum(weights)
+    weights /= total
+    return (weights, float(max_log_weight + np.log(total))) if return_log_sum else weights
+
+
+def normalize_batch_log_weights(log_weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+        Function normalizes the log-likelihoods of R independent particle sets at once, see normalize_log_weights.
+        Parameters:
+            log_weights (np.ndarray): The R×N array of log-likelihoods, one row per set.
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The R×N array of weights, every row summing up to one,
+                and the R array of the logarithms of the sums of the unnormalized weights.
+    """
+    max_log_weights = np.max(log_weights, axis=1)
+    finite = np.isfinite(max_log_weights)
+    weights = np.exp(log_weights - np.where(finite, max_log_weights, 0.0)[:, np.newaxis])
+    weights[~finite] = 1.0  # no particle of the set explains the measurements, fall back to uniform weights
+
+    totals = np.sum(weights, axis=1)
+    weights /= totals[:, np.newaxis]
+    return weights, np.where(finite, max_log_weights + np.log(totals), max_log_weights)
+
+
+class LandmarkSensorModel:
+    """
+        Class to handle the range-to-landmark sensor model for a whole set of particles at once.
+        Attributes:
+            landmarks (np.ndarray): The L×2 array of landmark coordinates.
+            sense_noise (float): The standard deviation of the range measurements.
+            lookup (str): How the distances to the landmarks are evaluated, one of LOOKUP_MODES.
+            lookup_map (GridMap|None): The grid map holding the precomputed distance tables.
+    """
+    landmarks: np.ndarray
+    sense_noise: float
+    lookup: str
+
+    def __init__(self, landmarks: np.ndarray = LANDMARKS_NP, sense_noise: float = 2.0):
+        """
+            Constructor initializes the landmarks and the sensing noise.
+            Parameters:
+                landmarks (np.ndarray): The L×2 array of landmark coordinates. Defaults to LANDMARKS_NP.
+                sense_noise (float): The standard deviation of the range measurements. Defaults to 2.0.
+        """
+        self.landmarks = np.asarray(landmarks, dtype=np.float64)
+        self.sense_noise = sense_noise
+        self.lookup = "exact"
+        self.lookup_map = None
+
+
+    def use_lookup(self, grid_map, lookup: str = "bilinear", subdivisions: int|None = 4):
+        """
+            Method selects how the distances to the landmarks are evaluated.
+            Parameters:
+                grid_map (environment.grid_map.GridMap): The grid map holding the distance tables.
+                lookup (str): "exact" to compute the distances, "nearest" or "bilinear" to look them up. Defaults to "bilinear".
+                subdivisions (int|None): The table samples per cell, the tables are precomputed for the landmarks
+                    of this model unless None. Defaults to 4.
+            Raises:
+                ValueError: If the lookup mode is unknown.
+        """
+        if lookup not in LOOKUP_MODES:
+            raise ValueError(f"unknown landmark lookup '{lookup}', expected one of {LOOKUP_MODES}")
+        self.lookup = lookup
+        self.lookup_map = None if lookup == "exact" else grid_map
+        if self.lookup_map is not None and subdivisions is not None:
+            self.lookup_map.precompute_landmark_distances(self.landmarks, subdivisions)
+
+
+    def expected_measurements(self, poses: np.ndarray) -> np.ndarray:
+        """
+            Method computes the noise-free distances from every pose to every landmark,
+            or looks them up in the precomputed tables of the grid map.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+            Returns:
+                np.ndarray: The N×L array of distances.
+        """
+        if self.lookup_map is not None:
+            return self.lookup_map.lookup_landmark_distances(poses[:, 0], poses[:, 1], interpolate=self.lookup == "bilinear")
+
+        dx = poses[:, 0, np.newaxis] - self.landmarks[np.newaxis, :, 0]
+        dy = poses[:, 1, np.newaxis] - self.landmarks[np.newaxis, :, 1]
+        return np.hypot(dx, dy)
+
+
+    def log_likelihood(self, poses: np.ndarray, measurements: list[float]) -> np.ndarray:
+        """
+            Method computes the log-likelihood of the measurements for every pose in one N×L operation.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+                measurements (list[float]): The L observed distances to the landmarks, NaN for a landmark not observed.
+            Returns:
+                np.ndarray: The N array of log-likelihoods.
+        """
+        z = np.asarray(measurements, dtype=np.float64)
+        observed = ~np.isnan(z)
+
+        residuals = self.expected_measurements(poses)
+        residuals -= z[np.newaxis, :]
+        residuals /= self.sense_noise
+        np.square(residuals, out=residuals)
+
+        log_norm = np.count_nonzero(observed) * math.log(self.sense_noise * math.sqrt(2 * math.pi))
+        if observed.all():
+            return -0.5 * np.sum(residuals, axis=1) - log_norm
+        return -0.5 * np.sum(residuals, axis=1, where=observed[np.newaxis, :]) - log_norm
+
+
+    def batch_log_likelihood(self, poses: np.ndarray, measurements: np.ndarray) -> np.ndarray:
+        """
+            Method computes the log-likelihood of the measurements of R robots for their own particles.
+            The particles of all robots go through a single expected_measurements call, so the distance tables
+            of the map are shared by the whole batch.
+            Parameters:
+                poses (np.ndarray): The R×N×3 array of poses, one row of particles per robot.
+                measurements (np.ndarray): The R×L array of observed distances to the landmarks, one row per robot,
+                    NaN for a landmark not observed.
+            Returns:
+                np.ndarray: The R×N array of log-likelihoods.
+        """
+        z = np.asarray(measurements, dtype=np.float64)
+        observed = ~np.isnan(z)
+        r, n = poses.shape[:2]
+
+        residuals = self.expected_measurements(poses.reshape(r * n, 3)).reshape(r, n, -1)
+        residuals -= z[:, np.newaxis, :]
+        residuals /= self.sense_noise
+        np.square(residuals, out=residuals)
+
+        log_norm = np.count_nonzero(observed, axis=1)[:, np.newaxis] * math.log(self.sense_noise * math.sqrt(2 * math.pi))
+        if observed.all():
+            return -0.5 * np.sum(residuals, axis=2) - log_norm
+        return -0.5 * np.sum(residuals, axis=2, where=observed[:, np.newaxis, :]) - log_norm
+
+
+    def weights(self, poses: np.ndarray, measurements: list[float]) -> np.ndarray:
+        """
+            Method computes the normalized weights of the poses given the measurements.
+            Parameters:
+                poses (np.ndarray): The N×3 array of poses (x, y, theta).
+                measurements (list[float]): The L observed distances to the landmarks.
+            Returns:
+                np.ndarray: The N array of weights summing up to one.
+        """
+        return normalize_log_weights(self.log_likelihood(poses, measurements))
@@ -10,25 +10,27 @@
     Date of Creation: 2024-12-19
 """
 
-import math
-import tkinter as tk
 from math import pi
-from random import choices, sample, random
-import copy as copy
-from mcl.pose import Pose3D
-from .global_vars import LANDMARKS
-import numpy as np
+from typing import TYPE_CHECKING
 
-import drawing.drawing_functions as drawing
-from mcl.global_vars import WORLD_SIZE
-from mcl.monte_carlo import Robot
+from drawing.renderer import Renderer
+from mcl.engine import MCLEngine
+from mcl.recording import RunPlayer, RunRecorder
+from mcl.worker import FilterWorker
+
+if TYPE_CHECKING:
+    import tkinter as tk
 
 NUM_EXTRA_MCL_ITERATIONS = 5
+OVERLAY_REFRESH_FRAMES = 10  # the performance overlay is refreshed every 10 frames
 
 
 class Simulator:
     """
         Class provides the simulator for the MCL workshop
+        It is a Tkinter viewer on top of the headless MCLEngine which owns the filter state.
+        The filter runs on a FilterWorker thread, the viewer only sends it the motions and draws its latest snapshot.
+        With a playback directory, the viewer scrubs through a recorded run instead (see mcl.recording).
     """
 
     def __init__(self, parameters):
@@ -38,6 +40,8 @@ class Simulator:
                 parameters: (parameters.parameters.Parameters) the parameters of the simulator
         """
 
+        import tkinter as tk  # the GUI toolkit is only loaded by the viewer, the headless modules never import it
+
         """ ***** Initialization of the user interface ***** """
         self.screen = tk.Tk()  # the window
         self.screen.title("ROBa project - Monte Carlo Localization")  # define the window name
@@ -58,36 +62,56 @@ class Simulator:
                                      variable=self.randomize)
         self.cb_env.pack(side='left')
 
+        # slider to scrub through a recorded run
+        playback_directory = getattr(parameters, "playback_directory", None)
+        self.player = RunPlayer(playback_directory) if playback_directory is not None else None
+        if self.player is not None:
+            self.playback_step = tk.Scale(self.screen, from_=0, to=len(self.player) - 1, orient=tk.HORIZONTAL)
+            self.playback_step.pack(side='left', fill=tk.X, expand=tk.YES)
+
         """ ***** Handle some keyboard events ***** """
-        self.screen.bind('<Left>', self.left_key)  # pad left arrow key
-        self.screen.bind('<Right>', self.right_key)  # pad right key
-        self.screen.bind('<Up>', self.up_key)  # pad up key
+        if self.player is None:
+            self.screen.bind('<Left>', self.left_key)  # pad left arrow key
+            self.screen.bind('<Right>', self.right_key)  # pad right key
+            self.screen.bind('<Up>', self.up_key)  # pad up key
+            self.canvas.bind("<Button-1>", self.kidnap_robot)  # mouse click
+        self.screen.bind('<p>', self.toggle_overlay)  # show or hide the performance overlay
         self.screen.bind('<Escape>', self.close_window_event)  # pad escape key (to close the simulator)
 
         # to call close_window when closing the window
         self.screen.protocol("WM_DELETE_WINDOW", self.close_window)
 
-        """ ***** Bind mouse click event ***** """
-        self.canvas.bind("<Button-1>", self.kidnap_robot)
-
         """ ***** Initialization of the parameters ***** """
         try:
-            self.world_size = (WORLD_SIZE[0], WORLD_SIZE[1])
-            self.robot: Robot = getattr(parameters, "robot")
-            self.predicted_robot: Robot = getattr(parameters, "predicted_robot")
-            self.map = getattr(parameters, "map")
-            self.number_of_particles = getattr(parameters, "number_of_particles")
-            self.particles: list[Robot] = self.init_particles()
-            self.landmarks = LANDMARKS
-            self.percent_random_particles = getattr(parameters, "percent_random_particles")
+            self.engine = MCLEngine(parameters)
+            self.world_size = self.engine.world_size
             self.fps = getattr(parameters, "fps")
 
         except AttributeError as ae:
             print(ae)
             exit(0)
 
-        self.should_resample_mcl = 0;
-        self.resample_frame = 5;
+        self.renderer = Renderer(self.canvas, self.engine.map,
+                                 particle_rendering=getattr(parameters, "particle_rendering", "auto"),
+                                 density_threshold=getattr(parameters, "density_threshold", 5000),
+                                 density_resolution=getattr(parameters, "density_resolution", "canvas"),
+                                 landmarks=self.engine.landmarks_np)
+
+        # the filter is updated when the accumulated motion passes the odometry thresholds,
+        # then every 5 frames NUM_EXTRA_MCL_ITERATIONS times once the robot stops
+        self.profile_output = getattr(parameters, "profile_output", None)  # .json or .csv written when closing
+        self.show_overlay = self.engine.profiler.enabled
+        self.frame = 0
+
+        self.worker: FilterWorker|None = None
+        if self.player is None:
+            record_directory = getattr(parameters, "record_directory", None)
+            recorder = None
+            if record_directory is not None:
+                recorder = RunRecorder(record_directory, decimation=getattr(parameters, "record_decimation", 1))
+            self.worker = FilterWorker(self.engine, updates_per_motion=NUM_EXTRA_MCL_ITERATIONS,
+                                       update_interval=5 / self.fps, recorder=recorder)
+            self.worker.start()
 
         self.update_simulator()
         self.screen.mainloop()
@@ -98,110 +122,36 @@ class Simulator:
             Update the dynamic of the simulator.
 
             This function performs the following steps:
-            1. Gets the measurements from the robot's sensors.
-            2. Calculates the weights of the particles based on the measurements.
-            3. Resamples the particles according to their weights.
-            4. Randomizes a specified number of particles.
-            5. Draws the updated state.
-            6. Schedules the next update.
+            1. Passes the state of the Randomize checkbox to the filter worker.
+            2. Draws the latest state published by the worker, or the recorded step selected by the slider.
+            3. Refreshes the performance overlay, if shown.
+            4. Schedules the next update.
+            The measurements and filter updates (see MCLEngine.step) run on the worker thread.
         """
 
-        self.resample_frame -= 1
-        if self.should_resample_mcl > 0 and self.resample_frame <= 0:
-            self.resample_frame = 5
-            self.should_resample_mcl -= 1
-
-            # sensor model
-            z = self.robot.get_measurements(self.landmarks)
-            w = self.calculate_weights(z)
-            self.resample_particles(w) # type: ignore
-            self.predicted_robot.pose = self.estimate_location() # robot location estimate based on particles
-            if self.randomize.get():
-                self.randomize_n_particles(100)  # TODO(filip): make optional
+        if self.worker is not None:
+            self.worker.randomize = 100 if self.randomize.get() else 0
+        with self.engine.profiler.stage("draw"):
+            self.draw()
 
-        self.draw()
+        self.frame += 1
+        if self.show_overlay and self.frame % OVERLAY_REFRESH_FRAMES == 0:
+            self.renderer.draw_overlay(self.engine.profiler.summary_lines())
         self.screen.after(int(1000 / self.fps), self.update_simulator)
 
 
-    def init_particles(self):
-        """
-            Method creates a list of particles with random positions and orientations.
-        """
-        return [Robot(Pose3D(random() * self.world_size[0], random() * self.world_size[1], random() * 2 * math.pi), weight=1/self.number_of_particles) for _ in range(self.number_of_particles)]
-
-
-    def calculate_weights(self, z: list[float]) -> list[float]:
-        """
-            Method calculates the weights of the particles based on the measurement probabilities.
-            Parameters:
-                z (list[float]): The observed measurements.
-            Returns:
-                list[float]: The weights of the particles.
-        """
-        ws = np.array([p.get_measurement_prob(z, self.landmarks) for p in self.particles])
-        return ws / np.sum(ws)
-
-
-    def resample_particles(self, weights: np.ndarray):
-        """
-            Method resamples the particles based on their weights to focus on the more likely particles.
-            Parameters:
-                weights (list[float]): The weights of the particles.
-        """
-        particles = np.array([np.array([p.pose.x, p.pose.y, p.pose.theta]) for p in self.particles])
-        sampled_rows = np.random.choice(particles.shape[0], size=self.number_of_particles, p=weights, replace=True)
-
-        sampled_particles = particles[sampled_rows]
-
-        self.particles = [Robot(Pose3D(p[0], p[1], p[2])) for p in sampled_particles]
-        return
-
-
-    def randomize_n_particles(self, n: int):
-        """
-            Method randomizes the positions and orientations of a specified number of particles.
-            Parameters:
-                n (int): The number of particles to randomize.
-        """
-        rnd_particles = sample(self.particles, n)
-        for p in rnd_particles:
-            p.set_pose(Pose3D(random() * self.world_size[0], random() * self.world_size[1], random() * 2 * math.pi))
-
-
-    def estimate_location(self) -> Pose3D:
-        """
-            Method estimates the location of the robot based on the particle with the highest weight.
-            Returns:
-                Pose3D: The estimated pose of the robot.
-        """
-        mp = max(self.particles, key=lambda x: x.weight)
-        return Pose3D(mp.pose.x, mp.pose.y, mp.pose.theta)
-
-
-    def move_particles(self, forward: float, turn: float):
-        """
-            Method moves the particles based on the given forward and turn values.
-            Parameters:
-                forward (float): The forward movement.
-                turn (float): The turn movement.
-        """
-        return [p.move(forward=forward, turn=turn) for p in self.particles]
-
-
     def draw(self):
         """
             Method draws the grid map, particles, robot, and landmarks on the canvas.
+            Only the latest snapshot of the filter worker is drawn, the canvas items are kept between frames,
+            see drawing.renderer.Renderer.
         """
-        self.canvas.delete("all")  # we start by removing the old display
-
-        drawing.draw_grid_map(self.canvas, self.map)
-       
-        drawing.draw_particles(self.canvas, self.particles, self.map)
-        drawing.draw_predicted_robot(self.canvas, self.predicted_robot, self.map)
-
-        drawing.draw_robot(self.canvas, self.robot, self.map)
-
-        drawing.draw_landmarks(self.canvas, self.map)
+        if self.player is not None:
+            snapshot = self.player.snapshot(self.playback_step.get())
+            self.renderer.draw(snapshot, snapshot.robot, snapshot.predicted_robot)
+        else:
+            with self.worker.latest() as snapshot:
+                self.renderer.draw(snapshot, snapshot.robot, snapshot.predicted_robot)
 
 
     def left_key(self, _):
@@ -212,9 +162,7 @@ class Simulator:
         """
         forward = 0.0
         turn = -pi / 50
-        self.should_resample_mcl = NUM_EXTRA_MCL_ITERATIONS
-        self.move_particles(forward=forward, turn=turn)
-        self.robot.move(forward=forward, turn=turn)
+        self.worker.move(forward=forward, turn=turn)
 
 
     def right_key(self, _):
@@ -225,9 +173,7 @@ class Simulator:
         """
         forward = 0.0
         turn = pi / 50
-        self.should_resample_mcl = NUM_EXTRA_MCL_ITERATIONS
-        self.move_particles(forward=forward, turn=turn)
-        self.robot.move(forward=forward, turn=turn)
+        self.worker.move(forward=forward, turn=turn)
 
 
     def up_key(self, _):
@@ -238,12 +184,10 @@ class Simulator:
         """
         forward = 0.1
         turn = 0.0
-        self.should_resample_mcl = NUM_EXTRA_MCL_ITERATIONS
-        self.move_particles(forward=forward, turn=turn)
-        self.robot.move(forward=forward, turn=turn)
+        self.worker.move(forward=forward, turn=turn)
 
 
-    def kidnap_robot(self, event: tk.Event):
+    def kidnap_robot(self, event: "tk.Event"):
         """
             Method updates the robot's position based on the click coordinates.
             Parameters:
@@ -251,15 +195,32 @@ class Simulator:
         """
         x_click = event.x * self.world_size[0] / self.canvas.winfo_width()
         y_click = event.y * self.world_size[1] / self.canvas.winfo_height()
-        self.robot.set_pose(Pose3D(x_click, y_click, self.robot.pose.theta))
-        self.draw()
+        self.worker.kidnap(x_click, y_click)
 
 
     def close_window(self):
         self.close_window_event(None)
 
 
+    def toggle_overlay(self, _):
+        """
+            Method shows or hides the performance overlay, enabling the profiler of the engine if needed.
+            Parameters:
+                _: (event) the event that is not used here
+        """
+        self.show_overlay = not self.show_overlay
+        self.engine.profiler.enabled = self.engine.profiler.enabled or self.show_overlay
+        if not self.show_overlay:
+            self.renderer.draw_overlay(None)
+
+
     def close_window_event(self, _):
+        if self.worker is not None:
+            self.worker.stop(timeout=1.0)
+            if self.engine.checkpoint_file is not None and not self.worker.is_alive():
+                self.engine.save_checkpoint()  # the next start resumes from the final state
+        if self.profile_output is not None and self.engine.profiler.enabled:
+            self.engine.profiler.export(self.profile_output)
         self.screen.destroy()
 
 
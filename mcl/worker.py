@@ -0,0 +1,273 @@
+"""
+    Project: ROBa project
+    File: worker.py
+    Description: This file contains the background worker running the Monte Carlo localization filter for the user interface.
+
+    Authors:
+        - Author 1: xstolf00, xstolf00@stud.fit.vutbr.cz
+        - Author 2: xjahnf00, xjahnf00@vutbr.cz
+
+    Date of Creation: 2024-12-19
+"""
+
+import contextlib
+import queue
+import threading
+import time
+from typing import Iterator
+
+import numpy as np
+
+from mcl.engine import MCLEngine
+from mcl.monte_carlo import Robot
+from mcl.pose import Pose3D
+
+
+class FilterSnapshot:
+    """
+        Class holds an immutable copy of the filter state, published by the worker for drawing.
+        It has the poses, weights and length of a ParticleSet, so it can be drawn in its place.
+        Attributes:
+            poses (np.ndarray): The read-only N×3 array of particle poses.
+            weights (np.ndarray): The read-only N array of particle weights.
+            robot (Robot): A copy of the ground truth robot.
+            predicted_robot (Robot): A copy of the robot at the estimated pose.
+            update (int): The number of filter updates done before the snapshot.
+    """
+    poses: np.ndarray
+    weights: np.ndarray
+    robot: Robot
+    predicted_robot: Robot
+    update: int
+
+    def __init__(self, poses: np.ndarray, weights: np.ndarray, robot_pose: Pose3D, predicted_pose: Pose3D, update: int):
+        """
+            Constructor wraps the given state, the arrays are made read-only.
+            Parameters:
+                poses (np.ndarray): The N×3 array of particle poses, not shared with the engine.
+                weights (np.ndarray): The N array of particle weights, not shared with the engine.
+                robot_pose (Pose3D): The pose of the ground truth robot.
+                predicted_pose (Pose3D): The estimated pose.
+                update (int): The number of filter updates done so far.
+        """
+        self.poses = poses
+        self.poses.flags.writeable = False
+        self.weights = weights
+        self.weights.flags.writeable = False
+        self.robot = Robot(robot_pose)
+        self.predicted_robot = Robot(predicted_pose)
+        self.update = update
+
+
+    def copy_from(self, engine: MCLEngine, update: int):
+        """
+            Method copies the state of an engine into the arrays of the snapshot, which are only reallocated
+            when the number of particles changed (KLD-sampling).
+            Parameters:
+                engine (MCLEngine): The engine to copy.
+                update (int): The number of filter updates done so far.
+        """
+        particles = engine.particles
+        if self.poses.shape != particles.poses.shape or self.poses.dtype != particles.poses.dtype:
+            self.poses = np.empty_like(particles.poses)
+            self.weights = np.empty_like(particles.weights)
+        self.poses.flags.writeable = True
+        self.weights.flags.writeable = True
+        np.copyto(self.poses, particles.poses)
+        np.copyto(self.weights, particles.weights)
+        self.poses.flags.writeable = False
+        self.weights.flags.writeable = False
+        self.robot.set_pose(Pose3D(engine.robot.pose.x, engine.robot.pose.y, engine.robot.pose.theta))
+        self.predicted_robot.set_pose(Pose3D(engine.predicted_robot.pose.x, engine.predicted_robot.pose.y,
+                                             engine.predicted_robot.pose.theta))
+        self.update = update
+
+
+    @classmethod
+    def from_engine(cls, engine: MCLEngine, update: int) -> "FilterSnapshot":
+        """
+            Method copies the state of an engine.
+            Parameters:
+                engine (MCLEngine): The engine to copy.
+                update (int): The number of filter updates done so far.
+            Returns:
+                FilterSnapshot: The snapshot.
+        """
+        return cls(engine.particles.poses.copy(), engine.particles.weights.copy(),
+                   engine.robot.pose, engine.predicted_robot.pose, update)
+
+
+    def __len__(self) -> int:
+        return self.poses.shape[0]
+
+
+class FilterWorker(threading.Thread):
+    """
+        Class runs the filter of an engine on a background thread, so the user interface never waits for it.
+        The user interface only enqueues commands (motion, kidnapping, stop) and reads the latest snapshot.
+        The snapshots are double buffered: the worker copies the engine into the arrays of the back snapshot,
+        allocated once, and swaps it with the front one, so the reader always gets a complete state
+        without holding a lock while drawing. The worker only waits when the reader still draws the back snapshot.
+        Attributes:
+            engine (MCLEngine): The engine owned by the worker, only touched from the worker thread.
+            commands (queue.Queue): The commands sent by the user interface.
+            updates_per_motion (int): The number of filter updates done once the robot stops.
+            update_interval (float): The time between two filter updates once the robot stops in seconds.
+            randomize (int): The number of particles randomized after every filter update.
+            recorder (RunRecorder|None): The recorder of the filter updates, closed when the worker stops.
+    """
+    engine: MCLEngine
+    commands: queue.Queue
+    updates_per_motion: int
+    update_interval: float
+    randomize: int
+
+    def __init__(self, engine: MCLEngine, updates_per_motion: int = 5, update_interval: float = 0.25, recorder=None):
+        """
+            Constructor of the class
+            Parameters:
+                engine (MCLEngine): The engine to run.
+                updates_per_motion (int): The number of filter updates once the robot stops. Defaults to 5.
+                update_interval (float): The time between two filter updates once the robot stops in seconds. Defaults to 0.25.
+                recorder (mcl.recording.RunRecorder|None): The recorder of the filter updates. Defaults to None.
+        """
+        super().__init__(name="mcl-filter", daemon=True)
+        self.engine = engine
+        self.commands = queue.Queue()
+        self.updates_per_motion = updates_per_motion
+        self.update_interval = update_interval
+        self.randomize = 0
+        self.recorder = recorder
+
+        self._buffers: list[FilterSnapshot] = [FilterSnapshot.from_engine(engine, 0), FilterSnapshot.from_engine(engine, 0)]
+        self._front = 0
+        self._reading: int|None = None  # the buffer being drawn by the reader
+        self._swapped = threading.Condition()
+        self._updates = 0
+        self._pending_updates = 0
+        self._next_update = 0.0
+
+
+    @contextlib.contextmanager
+    def latest(self) -> Iterator[FilterSnapshot]:
+        """
+            Method gives the last complete snapshot of the filter state in a with block,
+            the worker does not overwrite it until the block exits.
+        """
+        with self._swapped:
+            self._reading = self._front
+        try:
+            yield self._buffers[self._reading]
+        finally:
+            with self._swapped:
+                self._reading = None
+                self._swapped.notify()
+
+
+    def publish(self):
+        """
+            Method copies the state of the engine into the back buffer and makes it the front buffer.
+            If the reader still draws the back buffer (it took it before the last swap), the copy waits for it.
+        """
+        back = 1 - self._front
+        with self._swapped:
+            self._swapped.wait_for(lambda: self._reading != back)
+        # from now on the reader only takes the front buffer, so the back one stays free until the swap
+        self._buffers[back].copy_from(self.engine, self._updates)
+        with self._swapped:
+            self._front = back
+
+
+    def move(self, forward: float, turn: float):
+        """
+            Method enqueues a motion of the robot and of the particles.
+            Parameters:
+                forward (float): The forward movement.
+                turn (float): The turn movement.
+        """
+        self.commands.put(("move", forward, turn))
+
+
+    def kidnap(self, x: float, y: float):
+        """
+            Method enqueues moving the ground truth robot to the given position.
+            Parameters:
+                x (float): The x position in meters.
+                y (float): The y position in meters.
+        """
+        self.commands.put(("kidnap", x, y))
+
+
+    def stop(self, timeout: float|None = None):
+        """
+            Method asks the worker to finish and waits for it.
+            Parameters:
+                timeout (float|None): The maximal time to wait in seconds, None to wait until it finishes.
+        """
+        self.commands.put(("stop",))
+        if self.is_alive():
+            self.join(timeout)
+
+
+    def run(self):
+        """
+            Method processes the commands and runs the filter updates requested by the motions.
+            The motions of the robot are accumulated and the filter runs as soon as they pass the thresholds
+            of the odometry accumulator of the engine. Once the robot stops, the remaining motion is applied
+            and the filter is updated every update_interval until updates_per_motion updates are done.
+        """
+        while True:
+            timeout = None
+            if self._pending_updates > 0:
+                timeout = self._next_update - time.monotonic()
+                if timeout <= 0:
+                    self.update()
+                    continue
+
+            try:
+                command = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            if command[0] == "stop":
+                if self.recorder is not None:
+                    self.recorder.close()
+                return
+            self.execute(command)
+            if self.commands.empty():  # a burst of commands is published once
+                self.publish()
+
+
+    def execute(self, command: tuple):
+        """
+            Method applies a command of the user interface to the engine.
+            Parameters:
+                command (tuple): The name of the command followed by its arguments.
+        """
+        if command[0] == "move":
+            _, forward, turn = command
+            self.engine.robot.move(forward=forward, turn=turn)
+            self.engine.odometry.add(forward, turn)
+            if self.engine.odometry.ready():
+                self.update()
+            self._next_update = time.monotonic() + self.update_interval
+            self._pending_updates = self.updates_per_motion
+        elif command[0] == "kidnap":
+            _, x, y = command
+            self.engine.robot.set_pose(Pose3D(x, y, self.engine.robot.pose.theta))
+
+
+    def update(self):
+        """
+            Method applies the accumulated motion to the particles, performs one filter update with
+            the measurements of the ground truth robot and publishes it.
+        """
+        self._pending_updates -= 1
+        self._next_update = time.monotonic() + self.update_interval
+        self.engine.step(self.engine.odometry.flush(), self.engine.sense())
+        if self.randomize > 0:
+            self.engine.randomize_n_particles(self.randomize)
+        self._updates += 1
+        if self.recorder is not None:
+            self.recorder.record(self.engine)
+        self.publish()